@@ -0,0 +1,373 @@
+"""Benchmarks of the pipeline stages on synthetic media
+
+    python -m benchmarks.run_benchmarks run --output benchmarks/results.json
+    python -m benchmarks.run_benchmarks compare benchmarks/baseline.json benchmarks/results.json
+
+The sources are generated with ffmpeg lavfi (testsrc2 + sine) and the
+subtitles from a seeded random generator, so two runs on the same machine
+process the same bytes. Every benchmark runs in a new process, its peak RSS
+is the one of this process and of the ffmpeg processes it waited for.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import ffmpeg
+
+from src import (
+    add_part_to_correct_index,
+    add_subtitles_to_video_segments_ass_segment_only,
+    add_title_to_correct_index,
+    convert_to_tiktok_format,
+    cut_segment_of_video,
+    render_all_segments,
+)
+from src.subtitle_io import AssWriter, JsonWriter, SrtWriter, iter_cues
+
+BENCH_DIR = "./cache/bench/"
+SEGMENT_NAME = "bench"
+TIME_OF_SEGMENT = 10
+FPS = 30
+
+# name: (duration in seconds, width, height)
+SOURCES = {
+    "30s_720p": (30, 1280, 720),
+    "30s_1080p": (30, 1920, 1080),
+    "120s_1080p": (120, 1920, 1080),
+}
+QUICK_SOURCES = ["30s_720p"]
+NUMBER_OF_CUES = 20000
+
+
+def generate_source(name, bench_dir=BENCH_DIR):
+    """Generate a test video with lavfi, it is reused by the next runs
+
+    Args:
+        name (string): key of SOURCES
+        bench_dir (string, optional): where the sources are kept. Defaults to BENCH_DIR.
+
+    Returns:
+        string: path to the video
+    """
+    duration, width, height = SOURCES[name]
+    path = os.path.join(bench_dir, f"source_{name}.mp4")
+    if os.path.exists(path):
+        return path
+    os.makedirs(bench_dir, exist_ok=True)
+    video = ffmpeg.input(f"testsrc2=size={width}x{height}:rate={FPS}:duration={duration}", f="lavfi")
+    audio = ffmpeg.input(f"sine=frequency=440:sample_rate=48000:duration={duration}", f="lavfi")
+    temp_path = os.path.join(bench_dir, f"source_{name}.tmp.mp4")
+    (
+        ffmpeg
+        .output(video, audio, temp_path, vcodec="libx264", preset="veryfast", pix_fmt="yuv420p", acodec="aac", g=FPS * 2)
+        .global_args("-fflags", "+bitexact")
+        .run(overwrite_output=True, quiet=True)
+    )
+    os.replace(temp_path, path)
+    return path
+
+
+def synthetic_cues(count, seed=0, words_per_cue=4):
+    """Deterministic cues, a few words each, one after the other
+
+    Args:
+        count (int): number of cues
+        seed (int, optional): seed of the generator. Defaults to 0.
+        words_per_cue (int, optional): words in a cue. Defaults to 4.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["lorem", "ipsum", "dolor", "sit", "amet", "video", "partie", "titre", "sous", "clip"]
+    time_code = 0.0
+    cues = []
+    for _ in range(count):
+        duration = rng.uniform(0.3, 2.5)
+        text = " ".join(rng.choice(vocabulary) for _ in range(words_per_cue))
+        cues.append({"start": round(time_code, 3), "end": round(time_code + duration, 3), "text": text})
+        time_code += duration + rng.uniform(0.0, 0.5)
+    return cues
+
+
+def write_cues(writer, cues):
+    with writer:
+        for cue in cues:
+            writer.write(cue)
+
+
+def write_segment_subtitles(directory_videos, directory_sub):
+    """One synthetic .ass for every segment of the directory"""
+    os.makedirs(directory_sub, exist_ok=True)
+    for i, seg_file in enumerate(sorted(os.listdir(directory_videos))):
+        cues = [c for c in synthetic_cues(40, seed=i) if c["end"] <= TIME_OF_SEGMENT]
+        write_cues(AssWriter(os.path.join(directory_sub, f"{os.path.splitext(seg_file)[0]}.ass")), cues)
+
+
+def _number_of_segment(source_name):
+    return SOURCES[source_name][0] // TIME_OF_SEGMENT
+
+
+def _prepare_segments(source_name, workdir, bench_dir=BENCH_DIR):
+    """Cut the source once in bench_dir and copy the segments in workdir"""
+    segments_dir = os.path.join(bench_dir, f"segments_{source_name}")
+    if not os.path.isdir(segments_dir):
+        temp_dir = segments_dir + ".tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        cut_segment_of_video(generate_source(source_name), _number_of_segment(source_name), 0, TIME_OF_SEGMENT, temp_dir, SEGMENT_NAME)
+        os.replace(temp_dir, segments_dir)
+    directory_videos = os.path.join(workdir, "segments")
+    shutil.copytree(segments_dir, directory_videos)
+    return directory_videos
+
+
+# setup is not timed, it prepares the workdir and gives the kwargs of the benchmark
+
+def _setup_source(source_name, workdir):
+    return {"source": generate_source(source_name), "number_of_segment": _number_of_segment(source_name), "workdir": workdir}
+
+
+def _setup_segments(source_name, workdir):
+    directory_videos = _prepare_segments(source_name, workdir)
+    directory_sub = os.path.join(workdir, "subtitles")
+    write_segment_subtitles(directory_videos, directory_sub)
+    directory_output = os.path.join(workdir, "output")
+    os.makedirs(directory_output)
+    return {"directory_videos": directory_videos, "directory_sub": directory_sub, "directory_output": directory_output}
+
+
+def _setup_subtitles(source_name, workdir):
+    cues = synthetic_cues(NUMBER_OF_CUES)
+    paths = {}
+    for extension, writer in (("srt", SrtWriter), ("ass", AssWriter), ("json", JsonWriter)):
+        paths[extension] = os.path.join(workdir, f"cues.{extension}")
+        write_cues(writer(paths[extension]), cues)
+    return {"paths": paths, "cues": cues, "workdir": workdir}
+
+
+def bench_cut(source, number_of_segment, workdir):
+    cut_segment_of_video(source, number_of_segment, 0, TIME_OF_SEGMENT, os.path.join(workdir, "segments"), SEGMENT_NAME)
+
+
+def bench_convert(directory_videos, directory_sub, directory_output):
+    convert_to_tiktok_format(directory_videos, SEGMENT_NAME, directory_output)
+
+
+def bench_subtitles(directory_videos, directory_sub, directory_output):
+    add_subtitles_to_video_segments_ass_segment_only(directory_videos, directory_sub, directory_output, SEGMENT_NAME)
+
+
+def bench_part(directory_videos, directory_sub, directory_output):
+    add_part_to_correct_index(directory_videos, directory_output)
+
+
+def bench_title(directory_videos, directory_sub, directory_output):
+    add_title_to_correct_index(directory_videos, "Benchmark of the title banner", directory_output)
+
+
+def bench_render(directory_videos, directory_sub, directory_output):
+    render_all_segments(
+        directory_videos,
+        SEGMENT_NAME,
+        directory_input_sub=directory_sub,
+        video_title="Benchmark of the title banner",
+        directory_output=directory_output
+    )
+
+
+def bench_parse(paths, cues, workdir):
+    for path in paths.values():
+        for _ in iter_cues(path):
+            pass
+
+
+def bench_write(paths, cues, workdir):
+    for extension, writer in (("srt", SrtWriter), ("ass", AssWriter), ("json", JsonWriter)):
+        write_cues(writer(os.path.join(workdir, f"written.{extension}")), cues)
+
+
+# name: (setup, run, frames are encoded)
+BENCHMARKS = {
+    "cut": (_setup_source, bench_cut, True),
+    "convert": (_setup_segments, bench_convert, True),
+    "subtitles": (_setup_segments, bench_subtitles, True),
+    "part": (_setup_segments, bench_part, True),
+    "title": (_setup_segments, bench_title, True),
+    "render": (_setup_segments, bench_render, True),
+    "parse_subtitles": (_setup_subtitles, bench_parse, False),
+    "write_subtitles": (_setup_subtitles, bench_write, False),
+}
+
+
+def _timed(name, kwargs):
+    """Run a benchmark in this (fresh) process
+
+    Returns:
+        tuple: (wall time in seconds, peak RSS in MB)
+    """
+    run = BENCHMARKS[name][1]
+    start = time.perf_counter()
+    run(**kwargs)
+    wall = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return wall, peak / unit
+
+
+def run_benchmark(name, source_name, repeat=3):
+    """Run a benchmark several times, each in a new process
+
+    Args:
+        name (string): key of BENCHMARKS
+        source_name (string): key of SOURCES
+        repeat (int, optional): number of runs. Defaults to 3.
+
+    Returns:
+        dict: median wall time, encode fps and peak RSS
+    """
+    setup, _, encodes = BENCHMARKS[name]
+    walls = []
+    peaks = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="subcut_bench_") as workdir:
+            kwargs = setup(source_name, workdir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                wall, peak = executor.submit(_timed, name, kwargs).result()
+        walls.append(wall)
+        peaks.append(peak)
+
+    wall = statistics.median(walls)
+    duration = SOURCES[source_name][0]
+    return {
+        "wall_s": round(wall, 4),
+        "wall_runs_s": [round(w, 4) for w in walls],
+        "fps": round(duration * FPS / wall, 2) if encodes else None,
+        "peak_rss_mb": round(max(peaks), 1),
+    }
+
+
+def _ffmpeg_version():
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    except OSError:
+        return None
+    return out.splitlines()[0] if out else None
+
+
+def run_all(benchmarks, sources, repeat, output):
+    """Run the benchmarks and write the results in a json file
+
+    Args:
+        benchmarks (list): names of the benchmarks
+        sources (list): names of the sources
+        repeat (int): number of runs of every benchmark
+        output (string): path to the json of the results
+    """
+    results = {}
+    for source_name in sources:
+        for name in benchmarks:
+            # the subtitles benchmarks do not depend on the video
+            if not BENCHMARKS[name][2] and source_name != sources[0]:
+                continue
+            key = f"{name}/{source_name}" if BENCHMARKS[name][2] else name
+            print(f"[INFO] Benchmark {key}")
+            results[key] = run_benchmark(name, source_name, repeat)
+            print(f"[OK] {key} : {results[key]['wall_s']}s, {results[key]['fps']} fps, {results[key]['peak_rss_mb']} MB")
+
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": _ffmpeg_version(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[OK] Results : {output}")
+    return report
+
+
+def compare(baseline_path, current_path, threshold=0.10):
+    """Compare two results, a benchmark slower or bigger by more than threshold is a regression
+
+    Args:
+        baseline_path (string): json of the reference results
+        current_path (string): json of the new results
+        threshold (float, optional): allowed relative increase. Defaults to 0.10.
+
+    Returns:
+        list: keys of the regressions
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'benchmark':<28}{'wall base':>12}{'wall new':>12}{'change':>10}{'rss base':>12}{'rss new':>12}")
+    for key in sorted(set(baseline) | set(current)):
+        if key not in baseline or key not in current:
+            print(f"{key:<28}{'only in ' + ('baseline' if key in baseline else 'current'):>36}")
+            continue
+        old, new = baseline[key], current[key]
+        wall_change = new["wall_s"] / old["wall_s"] - 1 if old["wall_s"] else 0.0
+        rss_change = new["peak_rss_mb"] / old["peak_rss_mb"] - 1 if old["peak_rss_mb"] else 0.0
+        flag = ""
+        if wall_change > threshold or rss_change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(
+            f"{key:<28}{old['wall_s']:>12.3f}{new['wall_s']:>12.3f}{wall_change:>+10.1%}"
+            f"{old['peak_rss_mb']:>12.1f}{new['peak_rss_mb']:>12.1f}{flag}"
+        )
+
+    if regressions:
+        print(f"[WARNING] {len(regressions)} regressions over {threshold:.0%} : {', '.join(regressions)}")
+    else:
+        print("[OK] No regression")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the SubCut stages on synthetic media")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS), help="benchmark to run, every one by default")
+    run_parser.add_argument("--source", action="append", choices=list(SOURCES), help="source to use, every one by default")
+    run_parser.add_argument("--quick", action="store_true", help=f"only the {', '.join(QUICK_SOURCES)} source")
+    run_parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the median is kept")
+    run_parser.add_argument("--output", default="./benchmarks/results.json", help="json of the results")
+
+    compare_parser = commands.add_parser("compare", help="flag the regressions against a baseline")
+    compare_parser.add_argument("baseline", help="json of the reference results")
+    compare_parser.add_argument("current", help="json of the new results")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative increase, 0.10 for 10%%")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        sources = args.source or (QUICK_SOURCES if args.quick else list(SOURCES))
+        run_all(args.benchmark or list(BENCHMARKS), sources, args.repeat, args.output)
+    else:
+        sys.exit(1 if compare(args.baseline, args.current, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-
-from src import cut_segment_of_video,transcribe_all_segments_to_ass,convert_to_tiktok_format,add_subtitles_to_video_segments_ass_segment_only,cleanup_directory,rename_all_files_segment_in_directory
-from src.video_utils import add_part_to_correct_index, add_title_to_correct_index
+import argparse
+from src.ffmpeg_scheduler import configure_scheduler
+from src.metrics import configure as configure_metrics
+from src.pipeline import STAGES, STAGE_ALIASES, run_pipeline
+from src.transcription_cache import purge as purge_transcription_cache
 
 PATH_TO_VIDEO = "https://www.youtube.com/watch?YOUR_VIDEO or path/to/your/video"
 NUMBER_OF_SEGMENT = 9
@@ -8,55 +10,74 @@ START_TIME_CODE = 0
 TIME_OF_SEGMENT = 90
 DIRECTORY_VIDEOS = "./segments/"
 DIRECTORY_OUTPUT = "./output/"
+DIRECTORY_PREVIEW = "./preview/"
 DIRECTORY_VIDEOS_SUB = "./subtitles/"
 FILE_VIDEO_NAME_OUTPUT = "example_segment"
 PATH_ASS_FILE = "./segments/example.ass"
 PATH_JSON_FILE = "./segments/example.json"
 VIDEO_NAME = "name of your video"
 TITLE_TO_ADD = "name of the title in the video"
+TRANSCRIBE = False
+WHISPER_MODEL = "medium" # "tiny" or "base" for a quick preview
+TRANSCRIPTION_BACKEND = "whisper" # "faster-whisper" for int8 inference on CPU
+STREAMING = True # every segment is rendered as soon as it is cut, the first clip is ready early
+KARAOKE_SUBTITLES = True # lines with the spoken word highlighted, False for one word at a time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut a video in tiktok-style clips")
+    parser.add_argument("--no-cache", action="store_true", help="transcribe again even if the audio is in the cache")
+    parser.add_argument("--purge-cache", action="store_true", help="delete the transcription cache and the extracted audio before running")
+    parser.add_argument(
+        "--from-stage",
+        choices=STAGES + list(STAGE_ALIASES),
+        help="do this stage and the next ones again, the other stages resume from the manifest"
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="quick 360x640 draft render in ./preview/ to review the title, the crop and the subtitles"
+    )
+    parser.add_argument("--events", help="write every event (logs, ffmpeg progress, timers) in this .jsonl file")
+    parser.add_argument("--metrics", help="write the counters and the durations of the stages in this json file")
+    parser.add_argument("--ffmpeg-timeout", type=float, help="seconds before a stuck ffmpeg is killed, no limit by default")
+    parser.add_argument("--ffmpeg-retries", type=int, default=0, help="attempts again of a failed ffmpeg")
+    parser.add_argument("--progress", action="store_true", help="print the ffmpeg progress of every segment")
+    args = parser.parse_args()
+
+    configure_metrics(events_path=args.events, metrics_path=args.metrics, show_progress=args.progress)
+    configure_scheduler(timeout=args.ffmpeg_timeout, retries=args.ffmpeg_retries)
+
+    if args.purge_cache:
+        purge_transcription_cache()
+
+    # every (stage, segment) done is recorded in ./segments/manifest.json,
+    # running again after a crash only does what is missing
+    run_pipeline(
+        PATH_TO_VIDEO,
+        config={
+            "number_of_segment": NUMBER_OF_SEGMENT,
+            "start_cuting_time_code": START_TIME_CODE,
+            "time_of_segment": TIME_OF_SEGMENT,
+            "directory_videos": DIRECTORY_VIDEOS,
+            "directory_output": DIRECTORY_PREVIEW if args.preview else DIRECTORY_OUTPUT,
+            "directory_output_sub": DIRECTORY_VIDEOS_SUB,
+            "file_video_name_output": FILE_VIDEO_NAME_OUTPUT,
+            "video_name": VIDEO_NAME,
+            "video_title": TITLE_TO_ADD,
+            "transcribe": TRANSCRIBE,
+            "model_name": WHISPER_MODEL,
+            "backend": TRANSCRIPTION_BACKEND,
+            "karaoke": KARAOKE_SUBTITLES,
+            "use_cache": not args.no_cache,
+            "mode": "letterbox",
+            "profile": "draft" if args.preview else "final",
+            "streaming": STREAMING,
+        },
+        from_stage=args.from_stage
+    )
+
 
-cut_segment_of_video(
-    PATH_TO_VIDEO,
-    number_of_segment=NUMBER_OF_SEGMENT,
-    start_cuting_time_code=START_TIME_CODE,
-    time_of_segment=TIME_OF_SEGMENT,
-    directory_videos=DIRECTORY_VIDEOS,
-    file_video_name_output=FILE_VIDEO_NAME_OUTPUT
-)
-'''
-transcribe_all_segments_to_ass(
-    directory_videos=DIRECTORY_VIDEOS,
-    directory_output_sub=DIRECTORY_VIDEOS_SUB,
-    file_video_name_output=FILE_VIDEO_NAME_OUTPUT
-)
-'''
-convert_to_tiktok_format(
-    directory_videos=DIRECTORY_VIDEOS,
-    file_video_name_output=FILE_VIDEO_NAME_OUTPUT,
-    mode="letterbox"
-)
-
-'''
-add_subtitles_to_video_segments_ass_segment_only(
-    directory_videos=DIRECTORY_VIDEOS,
-    directory_input_sub=DIRECTORY_VIDEOS_SUB,
-    directory_output=DIRECTORY_OUTPUT,
-    file_video_name_output=FILE_VIDEO_NAME_OUTPUT,
-    burn_in=True
-)
-
-'''
-
-add_part_to_correct_index(
-    directory_videos=DIRECTORY_VIDEOS,
-    output_path=None, 
-)
-
-add_title_to_correct_index(
-    directory_videos=DIRECTORY_VIDEOS,
-    video_title=TITLE_TO_ADD,
-    output_path=DIRECTORY_OUTPUT
-)
-
-rename_all_files_segment_in_directory(DIRECTORY_OUTPUT, VIDEO_NAME)
-cleanup_directory(DIRECTORY_VIDEOS)
\ No newline at end of file
+# the renders run in a process pool, with spawn (macOS, Windows) every worker imports this file again
+if __name__ == "__main__":
+    main()
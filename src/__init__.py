@@ -1,3 +1,6 @@
-from .video_utils import cut_segment_of_video,add_subtitles_to_video_segments_ass_segment_only,add_title_to_video,add_part_to_video,convert_to_tiktok_format,add_title_to_correct_index,add_part_to_correct_index
-from .subtitles_utils import transcribe_all_segments_to_ass
-from .source_file_utils import get_video_source,cleanup_directory,rename_all_files_segment_in_directory
\ No newline at end of file
+from .video_utils import cut_segment_of_video,add_subtitles_to_video_segments_ass_segment_only,add_title_to_video,add_part_to_video,convert_to_tiktok_format,add_title_to_correct_index,add_part_to_correct_index,render_segment,render_all_segments
+from .subtitles_utils import transcribe_all_segments_to_ass,transcribe_source_to_segments_ass
+from .source_file_utils import get_video_source,cleanup_directory,rename_all_files_segment_in_directory
+from .pipeline import run_pipeline
+from .batch_runner import run_batch
+from .work_queue import WorkQueue,run_worker
\ No newline at end of file
@@ -0,0 +1,178 @@
+import os
+import threading
+import ffmpeg
+import numpy as np
+from src.ffmpeg_scheduler import open_ffmpeg, run_ffmpeg
+from src.metrics import log
+
+SAMPLE_RATE = 16000
+DEFAULT_AUDIO_DIR = "./cache/audio/"
+# about 9 hours of audio
+DEFAULT_AUDIO_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_WINDOW = 120.0
+DEFAULT_OVERLAP = 10.0
+
+
+def extract_audio_pcm(video_path, output_path=None, sample_rate=SAMPLE_RATE, max_bytes=DEFAULT_AUDIO_MAX_BYTES):
+    """Decode the audio of a video once to raw mono float32 PCM, the format used by whisper
+
+    The file is reused while it is newer than the video. The files of
+    DEFAULT_AUDIO_DIR are a cache : the least recently used ones are
+    deleted when they go over max_bytes, see evict_audio.
+
+    Args:
+        video_path (string): path to the video
+        output_path (string, optional): path of the .f32 file. Defaults to None, in DEFAULT_AUDIO_DIR.
+        sample_rate (int, optional): sample rate of the audio. Defaults to 16000.
+        max_bytes (int, optional): size of DEFAULT_AUDIO_DIR. Defaults to 2 GB.
+
+    Returns:
+        string: path to the PCM file
+    """
+    cached = output_path is None
+    if cached:
+        stat = os.stat(video_path)
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        output_path = os.path.join(DEFAULT_AUDIO_DIR, f"{name}.{stat.st_size}.{sample_rate}.f32")
+
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(video_path):
+        if cached:
+            # still newer than the video, the mtime orders the eviction
+            os.utime(output_path)
+        return output_path
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    temp_output = f"{output_path}.tmp"
+    log("info", f"Extract audio of {video_path}")
+    run_ffmpeg(
+        ffmpeg
+        .input(video_path)
+        .output(temp_output, vn=None, ac=1, ar=sample_rate, acodec="pcm_f32le", f="f32le"),
+        name="audio"
+    )
+    os.replace(temp_output, output_path)
+    if cached:
+        evict_audio(DEFAULT_AUDIO_DIR, max_bytes, keep=output_path)
+    return output_path
+
+
+def evict_audio(audio_dir=DEFAULT_AUDIO_DIR, max_bytes=DEFAULT_AUDIO_MAX_BYTES, keep=None):
+    """Delete the least recently used PCM files until the directory fits in max_bytes
+
+    Args:
+        audio_dir (string, optional): directory of the PCM files. Defaults to DEFAULT_AUDIO_DIR.
+        max_bytes (int, optional): size of the directory. Defaults to 2 GB.
+        keep (string, optional): path of a file which is never deleted, the one just extracted. Defaults to None.
+    """
+    if not os.path.isdir(audio_dir):
+        return
+    entries = []
+    for filename in os.listdir(audio_dir):
+        path = os.path.join(audio_dir, filename)
+        if filename.endswith(".f32") and path != keep:
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # mapped by load_pcm on Windows, it goes on the next eviction
+            continue
+        total -= size
+
+
+def load_pcm(pcm_path):
+    """Map a PCM file in memory without reading it
+
+    Args:
+        pcm_path (string): path to a file from extract_audio_pcm
+
+    Returns:
+        np.memmap: float32 samples
+    """
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode="r")
+
+
+def audio_window(pcm, start=0, end=None, sample_rate=SAMPLE_RATE):
+    """View of the samples between two times, no copy is made
+
+    Args:
+        pcm (np.ndarray): samples from load_pcm
+        start (float, optional): start in seconds. Defaults to 0.
+        end (float, optional): end in seconds. Defaults to None, until the end.
+        sample_rate (int, optional): sample rate of the audio. Defaults to 16000.
+
+    Returns:
+        np.ndarray: samples of the window
+    """
+    first = max(int(start * sample_rate), 0)
+    if end is None:
+        return pcm[first:]
+    return pcm[first:max(int(end * sample_rate), first)]
+
+
+def iter_audio_windows(video_path, window=DEFAULT_WINDOW, overlap=DEFAULT_OVERLAP, sample_rate=SAMPLE_RATE):
+    """Read the audio of a video from an ffmpeg pipe in overlapping windows
+
+    Only the window being read is in memory, whatever the length of the
+    video. Each window starts `overlap` seconds before the end of the
+    previous one.
+
+    Args:
+        video_path (string): path to the video
+        window (float, optional): duration of a window in seconds. Defaults to 120.
+        overlap (float, optional): seconds shared by two windows. Defaults to 10.
+        sample_rate (int, optional): sample rate of the audio. Defaults to 16000.
+
+    Raises:
+        ValueError: overlap is not shorter than window
+        ffmpeg.Error: ffmpeg failed to decode the audio
+
+    Yields:
+        tuple: (start in seconds, float32 samples, True for the last window)
+    """
+    if not 0 <= overlap < window:
+        raise ValueError("overlap must be shorter than window")
+    window_samples = int(window * sample_rate)
+    overlap_samples = int(overlap * sample_rate)
+    stream = (
+        ffmpeg
+        .input(video_path)
+        .output("pipe:", vn=None, ac=1, ar=sample_rate, acodec="pcm_f32le", f="f32le")
+        .global_args("-loglevel", "error", "-nostats")
+    )
+    # the scheduler kills ffmpeg on its timeout and when the windows are not read to the end
+    with open_ffmpeg(stream, name="audio_stream") as process:
+        # stderr is read aside, a full stderr pipe would block ffmpeg
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        reader.start()
+
+        carry = np.zeros(0, dtype=np.float32)
+        start = 0
+        while True:
+            data = process.stdout.read((window_samples - len(carry)) * 4)
+            samples = np.concatenate([carry, np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)])
+            last = len(samples) < window_samples
+            if last:
+                break
+            yield start / sample_rate, samples, False
+            carry = samples[-overlap_samples:] if overlap_samples else samples[:0]
+            start += window_samples - overlap_samples
+
+        process.wait()
+        reader.join()
+        if process.timed_out:
+            raise ffmpeg.Error("ffmpeg", b"", b"ffmpeg killed on the scheduler timeout")
+        if process.returncode != 0:
+            raise ffmpeg.Error("ffmpeg", b"", b"".join(stderr))
+    if start == 0 and len(samples) == 0:
+        return
+    yield start / sample_rate, samples, True
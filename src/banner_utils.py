@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import tempfile
+import textwrap
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_FONT_PATH = "./fonts/Montserrat-SemiBold.otf"
+DEFAULT_BANNER_DIR = "./cache/banners/"
+
+PART_Y = 1500
+TITLE_Y_RATIO = 1 / 10
+BOX_BORDER = 25
+
+
+def title_fontsize(title):
+    """Font size of the title banner, smaller for long titles
+
+    Args:
+        title (string): title in the banner
+    """
+    length = len(title)
+    if length < 30:
+        return 70
+    if length < 60:
+        return 60
+    return 50
+
+
+def render_banner(
+    text,
+    font_path=None,
+    fontsize=70,
+    box_opacity=1.0,
+    line_spacing=0,
+    box_border=BOX_BORDER,
+    banner_dir=DEFAULT_BANNER_DIR
+):
+    """Rasterize a banner (black text on a white box) once to a RGBA png
+
+    The png is cached by (text, font, size, style), the next calls only
+    return its path.
+
+    Args:
+        text (string): text of the banner, lines separated by "\\n"
+        font_path (string, optional): Which font to use. Defaults to None, Montserrat SemiBold.
+        fontsize (int, optional): size of the text. Defaults to 70.
+        box_opacity (float, optional): opacity of the white box. Defaults to 1.0.
+        line_spacing (int, optional): space between lines in pixels. Defaults to 0.
+        box_border (int, optional): margin of the box around the text. Defaults to 25.
+        banner_dir (string, optional): directory of the cache. Defaults to DEFAULT_BANNER_DIR.
+
+    Returns:
+        string: path to the png
+    """
+    font_path = font_path or DEFAULT_FONT_PATH
+    key = json.dumps([text, os.path.abspath(font_path), fontsize, box_opacity, line_spacing, box_border])
+    banner_path = os.path.join(banner_dir, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.png")
+    if os.path.exists(banner_path):
+        return banner_path
+
+    font = ImageFont.truetype(font_path, fontsize)
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox((0, 0), text, font=font, spacing=line_spacing, align="center")
+
+    image = Image.new(
+        "RGBA",
+        (right - left + 2 * box_border, bottom - top + 2 * box_border),
+        (255, 255, 255, round(255 * box_opacity))
+    )
+    ImageDraw.Draw(image).multiline_text(
+        (box_border - left, box_border - top),
+        text,
+        font=font,
+        fill=(0, 0, 0, 255),
+        spacing=line_spacing,
+        align="center"
+    )
+
+    os.makedirs(banner_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=banner_dir, suffix=".png", delete=False) as tmpfile:
+        image.save(tmpfile, format="PNG")
+    os.replace(tmpfile.name, banner_path)
+    return banner_path
+
+
+def part_banner(title, font_path=None, scale=1.0):
+    """png of the part banner
+
+    Args:
+        title (string): text of the part, ex "Partie 1"
+        font_path (string, optional): Which font to use. Defaults to None.
+        scale (float, optional): size compared to a 1080 wide video. Defaults to 1.
+    """
+    return render_banner(
+        title,
+        font_path,
+        fontsize=round(70 * scale),
+        box_opacity=1.0,
+        box_border=round(BOX_BORDER * scale)
+    )
+
+
+def title_banner(title, font_path=None, max_chars_per_line=25, scale=1.0):
+    """png of the title banner
+
+    Args:
+        title (string): title in the banner
+        font_path (string, optional): Which font to use. Defaults to None.
+        max_chars_per_line (int, optional): Number of characters per line. Defaults to 25.
+        scale (float, optional): size compared to a 1080 wide video. Defaults to 1.
+    """
+    wrapped_title = "\n".join(textwrap.wrap(title, width=max_chars_per_line))
+    return render_banner(
+        wrapped_title,
+        font_path,
+        fontsize=round(title_fontsize(title) * scale),
+        box_opacity=0.9,
+        line_spacing=round(15 * scale),
+        box_border=round(BOX_BORDER * scale)
+    )
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from src.metrics import configure as configure_metrics
+from src.metrics import ffmpeg_error_message, log, timer
+from src.model_registry import clear_models, stop_transcription_worker
+from src.pipeline import DEFAULT_CONFIG, Pipeline, stream_pipelines
+
+DEFAULT_WORK_DIR = "./batch/"
+DEFAULT_REPORT_PATH = "./batch/report.json"
+# short names of the manifest, the other keys of a job are pipeline settings, see DEFAULT_CONFIG
+JOB_KEYS = {
+    "start": "start_cuting_time_code",
+    "segments": "number_of_segment",
+    "segment_length": "time_of_segment",
+    "title": "video_title",
+    "output": "directory_output",
+}
+
+
+def _job_id(job, index):
+    name = str(job.get("id") or f"job_{index + 1}")
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+def load_jobs(path):
+    """Read the jobs of a manifest, a .jsonl file (one job by line) or a .yaml file (a list of jobs)
+
+    A job has a source and any pipeline setting, with the short names
+    start, segments, segment_length, title and output, ex
+    {"source": "video.mp4", "segments": 5, "title": "My video", "mode": "crop", "output": "./output/a/"}
+
+    Args:
+        path (string): path to the manifest
+
+    Raises:
+        ValueError: a job has no source, an unknown setting or the manifest is not a list of jobs
+
+    Returns:
+        list: jobs as dict, with their id
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("PyYAML is needed to read a .yaml manifest : pip install pyyaml") from e
+            jobs = yaml.safe_load(f) or []
+            if isinstance(jobs, dict):
+                jobs = jobs.get("jobs", [])
+        else:
+            jobs = [json.loads(line) for line in f if line.strip()]
+    if not isinstance(jobs, list):
+        raise ValueError(f"{path} must be a list of jobs")
+
+    loaded = []
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict) or not job.get("source"):
+            raise ValueError(f"Job {i + 1} of {path} has no source")
+        job = {JOB_KEYS.get(key, key): value for key, value in job.items()}
+        unknown = set(job) - set(DEFAULT_CONFIG) - {"id", "source"}
+        if unknown:
+            raise ValueError(f"Job {i + 1} of {path} has unknown settings {sorted(unknown)}")
+        loaded.append(dict(job, id=_job_id(job, i)))
+    ids = [job["id"] for job in loaded]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"The ids of the jobs of {path} must be unique")
+    return loaded
+
+
+def make_pipeline(job, work_dir=DEFAULT_WORK_DIR, defaults=None):
+    """Pipeline of a job, its segments, subtitles and manifest are in work_dir/<id>/
+
+    Args:
+        job (dict): job, see load_jobs
+        work_dir (string, optional): directory of the work files. Defaults to DEFAULT_WORK_DIR.
+        defaults (dict, optional): settings of every job, the job settings win. Defaults to None.
+
+    Returns:
+        Pipeline: pipeline of the job
+    """
+    directory = os.path.join(work_dir, job["id"])
+    config = {
+        "directory_videos": os.path.join(directory, "segments"),
+        "directory_output_sub": os.path.join(directory, "subtitles"),
+        "directory_output": os.path.join(directory, "output"),
+        "file_video_name_output": job["id"],
+        "video_name": job["id"],
+    }
+    config.update(defaults or {})
+    config.update({key: value for key, value in job.items() if key not in ("id", "source")})
+    config["streaming"] = True
+    return Pipeline(job["source"], config)
+
+
+def job_status(job, pipeline):
+    """Status of a job after the run
+
+    Returns:
+        dict: id, source, status ("ok" or "failed"), clips, failed segments and error
+    """
+    failed = [
+        {"segment": record.index, "stage": record.stage, "error": ffmpeg_error_message(record.error)}
+        for record in pipeline.records if record.error is not None
+    ]
+    error = ffmpeg_error_message(pipeline.error) if pipeline.error is not None else None
+    if error is None and not pipeline.records:
+        error = "no segment to cut"
+    return {
+        "id": job["id"],
+        "source": job["source"],
+        "status": "failed" if failed or error else "ok",
+        "clips": [
+            record.output_path for record in pipeline.records
+            if record.error is None and os.path.exists(record.output_path)
+        ],
+        "failed_segments": failed,
+        "error": error,
+    }
+
+
+def write_report(report, path=DEFAULT_REPORT_PATH):
+    """Write the report json (temp file then rename)"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(f.name, path)
+
+
+def run_batch(jobs, work_dir=DEFAULT_WORK_DIR, report_path=DEFAULT_REPORT_PATH, defaults=None, total_threads=None, max_workers=None, queue_size=2):
+    """Run many jobs in one process
+
+    The segments of every job go through the same streaming stages (see
+    pipeline.stream_pipelines) : the transcription model is loaded once and
+    stays warm for every job, the renders share one process pool, and the
+    next source is fetched and cut while the previous job is rendered.
+    Every job resumes from its own manifest, a failed job does not stop
+    the others.
+
+    Args:
+        jobs (list): jobs, see load_jobs
+        work_dir (string, optional): directory of the work files. Defaults to DEFAULT_WORK_DIR.
+        report_path (string, optional): path of the status report. Defaults to DEFAULT_REPORT_PATH.
+        defaults (dict, optional): settings of every job, ex {"model_name": "small"}. Defaults to None.
+        total_threads (int, optional): threads shared by the transcription and the renders. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments rendered at the same time. Defaults to None.
+        queue_size (int, optional): segments waiting between two stages. Defaults to 2.
+
+    Returns:
+        dict: the report, started_at, duration_s and the status of every job
+    """
+    pipelines = [make_pipeline(job, work_dir, defaults) for job in jobs]
+    log("info", f"Batch of {len(jobs)} jobs")
+    started_at = time.time()
+    start = time.perf_counter()
+    with timer("batch", jobs=len(jobs)):
+        try:
+            stream_pipelines(pipelines, total_threads, max_workers, queue_size)
+        finally:
+            if not (defaults or {}).get("keep_models"):
+                clear_models()
+                stop_transcription_worker()
+
+    statuses = [job_status(job, pipeline) for job, pipeline in zip(jobs, pipelines)]
+    report = {
+        "started_at": round(started_at, 3),
+        "duration_s": round(time.perf_counter() - start, 3),
+        "jobs": statuses,
+    }
+    write_report(report, report_path)
+    failed = [status["id"] for status in statuses if status["status"] != "ok"]
+    if failed:
+        log("warning", f"{len(failed)}/{len(jobs)} jobs failed : {', '.join(failed)}, see {report_path}")
+    else:
+        log("ok", f"{len(jobs)} jobs done, see {report_path}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cut many videos in tiktok-style clips from a job manifest")
+    parser.add_argument("manifest", help="jobs in a .jsonl or a .yaml file")
+    parser.add_argument("--work-dir", default=DEFAULT_WORK_DIR, help="directory of the segments, subtitles and manifests")
+    parser.add_argument("--report", default=DEFAULT_REPORT_PATH, help="path of the status report")
+    parser.add_argument("--model", help="whisper model of every job")
+    parser.add_argument("--backend", help="transcription backend of every job")
+    parser.add_argument(
+        "--transcription-worker",
+        action="store_true",
+        help="transcribe in a separate process which keeps the model loaded"
+    )
+    parser.add_argument("--threads", type=int, help="threads shared by the transcription and the renders, every core by default")
+    parser.add_argument("--workers", type=int, help="maximum of segments rendered at the same time")
+    parser.add_argument("--events", help="write every event in this .jsonl file")
+    parser.add_argument("--metrics", help="write the counters and the durations in this json file")
+    args = parser.parse_args(argv)
+
+    configure_metrics(events_path=args.events, metrics_path=args.metrics)
+    defaults = {}
+    if args.model:
+        defaults["model_name"] = args.model
+    if args.backend:
+        defaults["backend"] = args.backend
+    if args.transcription_worker:
+        defaults["use_worker"] = True
+    report = run_batch(load_jobs(args.manifest), args.work_dir, args.report, defaults, args.threads, args.workers)
+    return 0 if all(status["status"] == "ok" for status in report["jobs"]) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
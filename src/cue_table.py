@@ -0,0 +1,231 @@
+import numpy as np
+
+from src.subtitle_io import KARAOKE_ASS_HEADER, AssWriter, JsonWriter, SrtWriter, iter_cues, iter_karaoke_lines
+
+
+class CueTable:
+    """Subtitle cues stored in arrays, sorted by start time
+
+    Times are kept in two float64 arrays and the texts in a single string
+    with an offset table, so a transcript of tens of thousands of words
+    stays compact. Window queries use a binary search (O(log n + k)) and
+    retiming works on the whole arrays at once.
+    """
+
+    def __init__(self, start, end, texts):
+        """
+        Args:
+            start (array-like): start of the cues in seconds
+            end (array-like): end of the cues in seconds
+            texts (list): text of the cues
+        """
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        order = np.argsort(start, kind="stable")
+        self.start = start[order]
+        self.end = end[order]
+        texts = [texts[i] for i in order]
+        self._text = "".join(texts)
+        self._offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=self._offsets[1:])
+        self._max_end = None
+
+    @classmethod
+    def _from_sorted(cls, start, end, text, offsets):
+        table = cls.__new__(cls)
+        table.start = start
+        table.end = end
+        table._text = text
+        table._offsets = offsets
+        table._max_end = None
+        return table
+
+    @classmethod
+    def from_cues(cls, cues):
+        """Build a table from {'start', 'end', 'text'} dicts
+
+        Args:
+            cues (iterable): cues with times in seconds
+        """
+        cues = list(cues)
+        return cls(
+            [c["start"] for c in cues],
+            [c["end"] for c in cues],
+            [c["text"] for c in cues],
+        )
+
+    @classmethod
+    def from_whisper_words(cls, segments):
+        """Build a table with one cue per word of a whisper result
+
+        Args:
+            segments (list): segments of the whisper result, segments without words are kept whole
+        """
+        cues = []
+        for seg in segments:
+            words = seg.get("words", [])
+            if words:
+                cues.extend({"start": w["start"], "end": w["end"], "text": w["word"].strip()} for w in words)
+            else:
+                cues.append({"start": seg["start"], "end": seg["end"], "text": seg["text"].strip()})
+        return cls.from_cues(cues)
+
+    @classmethod
+    def load(cls, path):
+        """Load a .srt, .ass or .json subtitles file
+
+        Args:
+            path (string): path to subtitles file
+        """
+        return cls.from_cues(iter_cues(path))
+
+    def __len__(self):
+        return len(self.start)
+
+    def text(self, i):
+        """Text of the cue i"""
+        return self._text[self._offsets[i]:self._offsets[i + 1]]
+
+    def texts(self):
+        """Texts of every cue"""
+        return [self.text(i) for i in range(len(self))]
+
+    def to_cues(self):
+        """Cues as {'start', 'end', 'text'} dicts"""
+        return [
+            {"start": float(s), "end": float(e), "text": self.text(i)}
+            for i, (s, e) in enumerate(zip(self.start, self.end))
+        ]
+
+    def _take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and np.all(np.diff(indices) == 1):
+            return self._slice(int(indices[0]), int(indices[-1]) + 1)
+        texts = [self.text(i) for i in indices]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        return CueTable._from_sorted(self.start[indices], self.end[indices], "".join(texts), offsets)
+
+    def _slice(self, lo, hi):
+        first, last = self._offsets[lo], self._offsets[hi]
+        return CueTable._from_sorted(
+            self.start[lo:hi],
+            self.end[lo:hi],
+            self._text[first:last],
+            self._offsets[lo:hi + 1] - first,
+        )
+
+    def starting_in(self, start, end):
+        """Cues which start in [start, end)
+
+        Args:
+            start (float): start of the window in seconds
+            end (float): end of the window in seconds
+        """
+        lo = np.searchsorted(self.start, start, side="left")
+        hi = np.searchsorted(self.start, end, side="left")
+        return self._slice(int(lo), int(hi))
+
+    def window(self, start, end):
+        """Cues which overlap [start, end)
+
+        Args:
+            start (float): start of the window in seconds
+            end (float): end of the window in seconds
+        """
+        if self._max_end is None:
+            self._max_end = np.maximum.accumulate(self.end) if len(self) else self.end
+        lo = int(np.searchsorted(self._max_end, start, side="right"))
+        hi = int(np.searchsorted(self.start, end, side="left"))
+        if hi <= lo:
+            return self._slice(lo, lo)
+        keep = np.nonzero(self.end[lo:hi] > start)[0] + lo
+        return self._take(keep)
+
+    def offset(self, seconds):
+        """Shift every cue
+
+        Args:
+            seconds (float): shift, negative to go earlier
+        """
+        return CueTable._from_sorted(self.start + seconds, self.end + seconds, self._text, self._offsets)
+
+    def scale(self, factor, origin=0.0):
+        """Stretch the times around origin, ex 25/23.976 for a frame rate change
+
+        Args:
+            factor (float): ratio applied to the times
+            origin (float, optional): time which does not move. Defaults to 0.
+        """
+        return CueTable._from_sorted(
+            (self.start - origin) * factor + origin,
+            (self.end - origin) * factor + origin,
+            self._text,
+            self._offsets,
+        )
+
+    def clamp(self, start, end):
+        """Limit the cues to [start, end], the cues left empty are dropped
+
+        Args:
+            start (float): start of the allowed range in seconds
+            end (float): end of the allowed range in seconds
+        """
+        new_start = np.clip(self.start, start, end)
+        new_end = np.clip(self.end, start, end)
+        instant = (self.end == self.start) & (self.start >= start) & (self.start <= end)
+        keep = np.nonzero((new_end > new_start) | instant)[0]
+        table = self._take(keep)
+        table.start = new_start[keep]
+        table.end = new_end[keep]
+        return table
+
+    def drop_short(self, min_duration):
+        """Drop the cues shorter than min_duration
+
+        Args:
+            min_duration (float): minimum duration in seconds
+        """
+        return self._take(np.nonzero(self.end - self.start >= min_duration)[0])
+
+    def merge_adjacent(self, max_gap=0.0, separator=" "):
+        """Merge the cues separated by at most max_gap seconds
+
+        Args:
+            max_gap (float, optional): largest gap merged, in seconds. Defaults to 0.
+            separator (string, optional): put between the merged texts. Defaults to " ".
+        """
+        if len(self) < 2:
+            return self
+        breaks = np.nonzero(self.start[1:] - self.end[:-1] > max_gap)[0] + 1
+        firsts = np.concatenate(([0], breaks))
+        lasts = np.concatenate((breaks, [len(self)]))
+        texts = [separator.join(self.text(i) for i in range(a, b)) for a, b in zip(firsts, lasts)]
+        return CueTable(self.start[firsts], np.maximum.reduceat(self.end, firsts), texts)
+
+    def _save(self, writer):
+        with writer:
+            for i, (s, e) in enumerate(zip(self.start, self.end)):
+                writer.write({"start": float(s), "end": float(e), "text": self.text(i)})
+
+    def save_srt(self, path):
+        """Save the cues in a .srt file"""
+        self._save(SrtWriter(path))
+
+    def save_ass(self, path, karaoke=False):
+        """Save the cues in a stylized .ass file
+
+        Args:
+            path (string): output path of the subtitles file
+            karaoke (bool, optional): the cues are words, group them in karaoke lines. Defaults to False.
+        """
+        if not karaoke:
+            self._save(AssWriter(path))
+            return
+        with AssWriter(path, header=KARAOKE_ASS_HEADER) as writer:
+            for line in iter_karaoke_lines(self.to_cues()):
+                writer.write(line)
+
+    def save_json(self, path):
+        """Save the cues in the json format read by load_subtitles_master"""
+        self._save(JsonWriter(path))
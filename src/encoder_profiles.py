@@ -0,0 +1,111 @@
+REFERENCE_WIDTH = 1080
+REFERENCE_HEIGHT = 1920
+
+# "draft" is for reviewing the title, the crop and the subtitles, "final" for publishing,
+# "high", "720p" and "480p" are the rungs of the output ladder of the platforms
+PROFILES = {
+    "draft": {
+        "width": 360,
+        "height": 640,
+        "preset": "ultrafast",
+        "crf": 32,
+        "audio_bitrate": "96k",
+    },
+    "final": {
+        "width": 1080,
+        "height": 1920,
+        "preset": "slow",
+        "crf": 20,
+        "audio_bitrate": "192k",
+    },
+    "high": {
+        "width": 1080,
+        "height": 1920,
+        "preset": "slow",
+        "crf": 18,
+        "maxrate": "12M",
+        "bufsize": "24M",
+        "audio_bitrate": "192k",
+    },
+    "720p": {
+        "width": 720,
+        "height": 1280,
+        "preset": "medium",
+        "crf": 23,
+        "maxrate": "4M",
+        "bufsize": "8M",
+        "audio_bitrate": "128k",
+    },
+    "480p": {
+        "width": 480,
+        "height": 854,
+        "preset": "veryfast",
+        "crf": 28,
+        "maxrate": "1500k",
+        "bufsize": "3M",
+        "audio_bitrate": "96k",
+    },
+}
+DEFAULT_PROFILE = "final"
+DEFAULT_LADDER = ["high", "720p", "480p"]
+# video of the segments cut in "exact" mode : they are decoded again by the render,
+# so they are encoded fast and near lossless, the profile only sets the encode of the clip
+INTERMEDIATE_VIDEO = {"preset": "veryfast", "crf": 16}
+
+
+def get_profile(profile=DEFAULT_PROFILE):
+    """Settings of an encoding profile
+
+    Args:
+        profile (string or dict, optional): name in PROFILES or the settings. Defaults to "final".
+
+    Raises:
+        ValueError: unknown profile
+
+    Returns:
+        dict: width, height, preset, crf, audio_bitrate and optionally maxrate and bufsize
+    """
+    if isinstance(profile, dict):
+        return dict(PROFILES[DEFAULT_PROFILE], **profile)
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile}. Choose in {list(PROFILES)}")
+    return PROFILES[profile]
+
+
+def video_args(profile=DEFAULT_PROFILE, threads=None):
+    """ffmpeg output arguments of the video encoder for the profile
+
+    Args:
+        profile (string or dict, optional): encoding profile. Defaults to "final".
+        threads (int, optional): threads used by ffmpeg. Defaults to None, ffmpeg decides.
+    """
+    settings = get_profile(profile)
+    args = {"vcodec": "libx264", "preset": settings["preset"], "crf": settings["crf"]}
+    for key in ("maxrate", "bufsize"):
+        if settings.get(key):
+            args[key] = settings[key]
+    if threads:
+        args["threads"] = threads
+    return args
+
+
+def intermediate_video_args(threads=None):
+    """ffmpeg output arguments of the video encoder of a segment which is rendered again, see INTERMEDIATE_VIDEO
+
+    Args:
+        threads (int, optional): threads used by ffmpeg. Defaults to None, ffmpeg decides.
+    """
+    args = {"vcodec": "libx264", **INTERMEDIATE_VIDEO}
+    if threads:
+        args["threads"] = threads
+    return args
+
+
+def audio_args(profile=DEFAULT_PROFILE):
+    """ffmpeg output arguments of the audio encoder for the profile"""
+    return {"acodec": "aac", "audio_bitrate": get_profile(profile)["audio_bitrate"]}
+
+
+def scale_of(profile=DEFAULT_PROFILE):
+    """Ratio between the profile width and 1080, used to scale the banners"""
+    return get_profile(profile)["width"] / REFERENCE_WIDTH
@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from src.ffmpeg_scheduler import configure_scheduler, scheduler_settings
+from src.metrics import ffmpeg_error_message, forward_events, init_worker, log, timer
+
+
+def split_thread_budget(number_of_jobs, total_threads=None, max_workers=None):
+    """Split the thread budget between concurrent jobs
+
+    Args:
+        number_of_jobs (int): number of jobs to run
+        total_threads (int, optional): threads for all the jobs. Defaults to None, every core.
+        max_workers (int, optional): maximum of concurrent jobs. Defaults to None, no limit.
+
+    Returns:
+        tuple: (number of concurrent jobs, threads for each job)
+    """
+    total_threads = total_threads or os.cpu_count() or 1
+    workers = min(number_of_jobs, total_threads)
+    if max_workers:
+        workers = min(workers, max_workers)
+    workers = max(workers, 1)
+    return workers, max(total_threads // workers, 1)
+
+
+def reserve_threads(total_threads=None, reserved=None):
+    """Reserve a share of the thread budget for a job running next to the others, ex the
+    transcription in this process while ffmpeg cuts or renders
+
+    Args:
+        total_threads (int, optional): threads for all the jobs. Defaults to None, every core.
+        reserved (int, optional): threads to reserve. Defaults to None, a quarter of the budget.
+
+    Returns:
+        tuple: (reserved threads, threads left for the other jobs)
+    """
+    total_threads = total_threads or os.cpu_count() or 1
+    if total_threads == 1:
+        return 1, 1
+    if reserved is None:
+        reserved = total_threads // 4
+    reserved = min(max(reserved, 1), total_threads - 1)
+    return reserved, total_threads - reserved
+
+
+def set_torch_threads(threads):
+    """Limit the threads used by torch (whisper) in this process
+
+    Args:
+        threads (int): number of threads
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _init_pool_worker(events, settings):
+    # with spawn or forkserver the worker does not inherit the state of the parent
+    init_worker(events)
+    configure_scheduler(**settings)
+
+
+@contextmanager
+def process_pool(max_workers):
+    """ProcessPoolExecutor whose workers send their events (logs, timers, ffmpeg progress) to this process
+    and run ffmpeg with the scheduler settings of this process (timeout, retries...)
+
+    Args:
+        max_workers (int): number of worker processes
+    """
+    events = multiprocessing.Queue()
+    forwarder = threading.Thread(target=forward_events, args=(events,), name="pool-events", daemon=True)
+    forwarder.start()
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_pool_worker, initargs=(events, scheduler_settings())) as executor:
+            yield executor
+    finally:
+        # the workers have exited and flushed their queue, the forwarder gets every event before None
+        events.put(None)
+        forwarder.join()
+
+
+def _timed_job(func, name, threads, kwargs):
+    with timer("segment", job=func.__name__, segment=name):
+        return func(threads=threads, **kwargs)
+
+
+def run_segment_jobs(func, jobs, total_threads=None, max_workers=None, on_result=None):
+    """Run a job for every segment in a process pool
+
+    Each job gets the number of threads it can use with the `threads` keyword,
+    a job which fails is reported and does not stop the others. Every job is
+    timed with a "segment" timer, see metrics.
+
+    Args:
+        func (callable): function run for a segment, must accept `threads`
+        jobs (list): (name, kwargs) for every segment
+        total_threads (int, optional): threads for all the jobs. Defaults to None, every core.
+        max_workers (int, optional): maximum of concurrent jobs. Defaults to None, no limit.
+        on_result (callable, optional): called with (name, result) as soon as a job succeeds. Defaults to None.
+
+    Returns:
+        tuple: (results, errors), dicts by job name
+    """
+    results = {}
+    errors = {}
+    if not jobs:
+        return results, errors
+
+    workers, threads = split_thread_budget(len(jobs), total_threads, max_workers)
+
+    if workers == 1:
+        for name, kwargs in jobs:
+            try:
+                results[name] = _timed_job(func, name, threads, kwargs)
+            except Exception as e:
+                log("error", f"in {name} : {ffmpeg_error_message(e)}")
+                errors[name] = e
+                continue
+            if on_result:
+                on_result(name, results[name])
+        return results, errors
+
+    log("info", f"{len(jobs)} jobs on {workers} workers with {threads} threads each")
+    with process_pool(workers) as executor:
+        futures = {
+            executor.submit(_timed_job, func, name, threads, kwargs): name
+            for name, kwargs in jobs
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                log("error", f"in {name} : {ffmpeg_error_message(e)}")
+                errors[name] = e
+                continue
+            if on_result:
+                on_result(name, results[name])
+    return results, errors
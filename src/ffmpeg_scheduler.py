@@ -0,0 +1,369 @@
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+import ffmpeg
+from src.metrics import emit, increment, log, parse_progress_line, timer
+
+DEFAULT_SETTINGS = {
+    "max_concurrency": None,
+    "timeout": None,
+    "retries": 0,
+    "backoff": 2.0,
+    "kill_grace": 5.0,
+}
+
+_settings = dict(DEFAULT_SETTINGS)
+_scheduler = None
+_loop = None
+_lock = threading.Lock()
+
+
+class FfmpegResult:
+    """Result of an ffmpeg job"""
+
+    def __init__(self, args, returncode, stdout, stderr, duration, attempts, timed_out=False):
+        """
+        Args:
+            args (list): command line
+            returncode (int): exit status, None if the process was killed on timeout
+            stdout (bytes): output of ffmpeg without the progress lines
+            stderr (bytes): error output of ffmpeg
+            duration (float): wall time of the last attempt in seconds
+            attempts (int): number of attempts
+            timed_out (bool, optional): the last attempt was killed on timeout. Defaults to False.
+        """
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.attempts = attempts
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def raise_for_status(self):
+        """Raise ffmpeg.Error like ffmpeg-python when the job failed"""
+        if not self.ok:
+            raise ffmpeg.Error(self.args[0], self.stdout, self.stderr)
+        return self
+
+
+async def _kill_tree(process, grace):
+    """SIGTERM then SIGKILL to the process group of ffmpeg"""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        await asyncio.wait_for(process.wait(), grace)
+    except (ProcessLookupError, asyncio.TimeoutError):
+        pass
+    if process.returncode is None:
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+def _kill_process_tree(process, grace):
+    """_kill_tree for a subprocess.Popen started in its own session"""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(grace)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    if process.poll() is None:
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+
+class FfmpegScheduler:
+    """Run ffmpeg processes on an asyncio loop
+
+    At most max_concurrency processes run at the same time in this
+    process : every worker of a process pool has its own scheduler, so
+    the limit is by worker, not for the machine. A job which is
+    over its timeout, or which is cancelled, is killed with its whole
+    process group. A failed job is run again up to `retries` times, waiting
+    backoff, 2 * backoff, 4 * backoff... seconds between attempts.
+    """
+
+    def __init__(self, max_concurrency=None, timeout=None, retries=0, backoff=2.0, kill_grace=5.0):
+        """
+        Args:
+            max_concurrency (int, optional): processes at the same time. Defaults to None, the number of cores.
+            timeout (float, optional): seconds before a job is killed. Defaults to None, no timeout.
+            retries (int, optional): attempts after the first one. Defaults to 0.
+            backoff (float, optional): wait before the first retry in seconds. Defaults to 2.
+            kill_grace (float, optional): seconds between SIGTERM and SIGKILL. Defaults to 5.
+        """
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.kill_grace = kill_grace
+        self._semaphore = None
+
+    async def _attempt(self, args, timeout, on_progress):
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=os.name == "posix"
+        )
+        stdout = []
+        report = {}
+
+        async def read_stdout():
+            async for line in process.stdout:
+                complete = parse_progress_line(report, line.decode("utf-8", "replace"))
+                if complete is None:
+                    if "=" not in line.decode("utf-8", "replace"):
+                        stdout.append(line)
+                elif on_progress:
+                    on_progress(complete)
+
+        async def communicate():
+            stderr = asyncio.ensure_future(process.stderr.read())
+            await read_stdout()
+            await process.wait()
+            return await stderr
+
+        start = time.perf_counter()
+        try:
+            stderr = await asyncio.wait_for(communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill_tree(process, self.kill_grace)
+            message = f"ffmpeg killed after {timeout}s timeout".encode("utf-8")
+            return None, b"".join(stdout), message, time.perf_counter() - start, True
+        except asyncio.CancelledError:
+            await _kill_tree(process, self.kill_grace)
+            raise
+        return process.returncode, b"".join(stdout), stderr, time.perf_counter() - start, False
+
+    async def acquire(self):
+        """Take a slot for a process run outside of run, see open_ffmpeg"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self._semaphore.acquire()
+
+    def release(self):
+        """Give back a slot taken with acquire, on the loop of the scheduler"""
+        self._semaphore.release()
+
+    async def run(self, args, timeout=None, retries=None, on_progress=None):
+        """Run an ffmpeg command line
+
+        Args:
+            args (list): command line, ex ["ffmpeg", "-i", ...]
+            timeout (float, optional): seconds before the job is killed. Defaults to None, the scheduler timeout.
+            retries (int, optional): attempts after the first one. Defaults to None, the scheduler retries.
+            on_progress (callable, optional): called with every report of -progress pipe:1. Defaults to None.
+
+        Returns:
+            FfmpegResult: result of the last attempt
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self._semaphore:
+                returncode, stdout, stderr, duration, timed_out = await self._attempt(args, timeout, on_progress)
+            result = FfmpegResult(args, returncode, stdout, stderr, duration, attempt, timed_out)
+            if result.ok or attempt > retries:
+                return result
+            delay = self.backoff * 2 ** (attempt - 1)
+            log("warning", f"ffmpeg failed (attempt {attempt}/{retries + 1}), retry in {delay}s")
+            increment("ffmpeg_retries")
+            await asyncio.sleep(delay)
+
+
+def configure_scheduler(**settings):
+    """Change the settings of the scheduler used by run_ffmpeg, see FfmpegScheduler
+
+    The settings are for this process, the pools of executor_utils give
+    them to their workers, see scheduler_settings.
+
+    Args:
+        **settings: max_concurrency, timeout, retries, backoff or kill_grace
+    """
+    global _scheduler
+    unknown = set(settings) - set(DEFAULT_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown scheduler settings {sorted(unknown)}")
+    with _lock:
+        _settings.update(settings)
+        _scheduler = None
+
+
+def scheduler_settings():
+    """Settings given to configure_scheduler, to configure the same scheduler in a pool worker"""
+    with _lock:
+        return dict(_settings)
+
+
+def get_scheduler():
+    """Scheduler of this process and its loop, running in a daemon thread"""
+    global _scheduler, _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ffmpeg-scheduler", daemon=True).start()
+        if _scheduler is None:
+            _scheduler = FfmpegScheduler(**_settings)
+        return _scheduler, _loop
+
+
+def _reset_after_fork():
+    # the loop thread does not exist in a forked worker, it gets its own loop
+    global _scheduler, _loop, _lock
+    _scheduler = None
+    _loop = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _compile(stream):
+    if isinstance(stream, (list, tuple)):
+        # a command line built by hand, ex a -filter_complex with several outputs
+        return [stream[0], "-progress", "pipe:1", "-nostats", "-y", *stream[1:]]
+    return stream.global_args("-progress", "pipe:1", "-nostats").compile(overwrite_output=True)
+
+
+async def run_ffmpeg_async(stream, name=None, timeout=None, retries=None, **fields):
+    """Run an ffmpeg-python stream on the running loop, see run_ffmpeg
+
+    Returns:
+        FfmpegResult: result, the caller checks result.ok
+    """
+    scheduler, _ = get_scheduler()
+
+    def on_progress(report):
+        emit("ffmpeg_progress", name=name, **fields, **report)
+
+    return await scheduler.run(_compile(stream), timeout, retries, on_progress)
+
+
+def run_ffmpeg(stream, name=None, timeout=None, retries=None, **fields):
+    """Run an ffmpeg-python stream through the scheduler and wait for it
+
+    Every -progress report is emitted as a ffmpeg_progress event. If the
+    caller is interrupted (Ctrl+C) the ffmpeg process is killed.
+
+    Args:
+        stream (ffmpeg node or list): stream with its output, ex ffmpeg.input(...).output(...), or a command line
+        name (string, optional): name of the job in the events. Defaults to None.
+        timeout (float, optional): seconds before ffmpeg is killed. Defaults to None, the scheduler timeout.
+        retries (int, optional): attempts after the first one. Defaults to None, the scheduler retries.
+        **fields: data added to the events, ex segment="part_1"
+
+    Raises:
+        ffmpeg.Error: ffmpeg failed or timed out, with its stderr
+
+    Returns:
+        FfmpegResult: result of the job
+    """
+    scheduler, loop = get_scheduler()
+
+    def on_progress(report):
+        emit("ffmpeg_progress", name=name, **fields, **report)
+
+    with timer("ffmpeg", job=name, **fields):
+        future = asyncio.run_coroutine_threadsafe(
+            scheduler.run(_compile(stream), timeout, retries, on_progress),
+            loop
+        )
+        try:
+            result = future.result()
+        except BaseException:
+            future.cancel()
+            raise
+        if not result.ok:
+            increment("ffmpeg_timeouts" if result.timed_out else "ffmpeg_errors")
+        return result.raise_for_status()
+
+
+
+@contextmanager
+def open_ffmpeg(stream, name=None, timeout=None, **fields):
+    """Start an ffmpeg-python stream whose output is read by the caller, ex audio on pipe:
+
+    The process takes a slot of the scheduler while it runs, like run_ffmpeg.
+    It runs in its own process group, which is killed after the timeout, when
+    the caller leaves the block (an error, a generator which is not read to
+    the end) or on Ctrl+C. A timed out process gets `timed_out` set to True.
+    It is not retried, the caller may have used a part of its output.
+
+    Args:
+        stream (ffmpeg node): stream with its output, ex ffmpeg.input(...).output("pipe:", ...)
+        name (string, optional): name of the job in the events. Defaults to None.
+        timeout (float, optional): seconds before ffmpeg is killed. Defaults to None, the scheduler timeout.
+        **fields: data added to the events
+
+    Yields:
+        subprocess.Popen: the ffmpeg process, with stdout and stderr pipes
+    """
+    scheduler, loop = get_scheduler()
+    timeout = scheduler.timeout if timeout is None else timeout
+    asyncio.run_coroutine_threadsafe(scheduler.acquire(), loop).result()
+    try:
+        with timer("ffmpeg", job=name, **fields):
+            process = subprocess.Popen(
+                stream.compile(),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=os.name == "posix"
+            )
+            process.timed_out = False
+
+            def expire():
+                process.timed_out = True
+                log("warning", f"ffmpeg killed after {timeout}s timeout")
+                increment("ffmpeg_timeouts")
+                _kill_process_tree(process, scheduler.kill_grace)
+
+            watchdog = threading.Timer(timeout, expire) if timeout else None
+            if watchdog:
+                watchdog.daemon = True
+                watchdog.start()
+            try:
+                yield process
+            finally:
+                if watchdog:
+                    watchdog.cancel()
+                _kill_process_tree(process, scheduler.kill_grace)
+    finally:
+        loop.call_soon_threadsafe(scheduler.release)
@@ -0,0 +1,365 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import ffmpeg
+
+LEVEL_PREFIXES = {"info": "[INFO]", "ok": "[OK]", "warning": "[WARNING]", "error": "[ERROR]"}
+
+_sinks = []
+_hooks = []
+_lock = threading.Lock()
+
+
+class ConsoleSink:
+    """Print the log events like the rest of the project, "[INFO] message" """
+
+    def __init__(self, show_progress=False):
+        """
+        Args:
+            show_progress (bool, optional): also print the ffmpeg progress. Defaults to False.
+        """
+        self.show_progress = show_progress
+
+    def handle(self, event):
+        if event["event"] == "log":
+            print(f"{LEVEL_PREFIXES.get(event['level'], '[INFO]')} {event['message']}")
+        elif event["event"] == "ffmpeg_progress" and self.show_progress:
+            print(
+                f"[INFO] {event.get('name', 'ffmpeg')} : frame {event.get('frame')}, "
+                f"{event.get('fps')} fps, speed {event.get('speed')}"
+            )
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """Append every event as a json line, the file can be followed with tail -f"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (string): path to the .jsonl file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def handle(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class QueueSink:
+    """Put every event in a multiprocessing queue, used in the pool workers, see forward_events"""
+
+    def __init__(self, events):
+        """
+        Args:
+            events (multiprocessing.Queue): queue read by the parent process
+        """
+        self.events = events
+
+    def handle(self, event):
+        self.events.put(event)
+
+    def close(self):
+        pass
+
+
+class MetricsFileSink:
+    """Aggregate the events in counters and histograms, written as json
+
+    Counters count the events by name (and the `counter` events by their
+    value), histograms keep the durations of the timers by name (and
+    stage for the stage timers). The file
+    is written when a stage ends and when the process exits.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (string): path to the metrics json
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        atexit.register(self.flush)
+
+    def handle(self, event):
+        with self._lock:
+            name = event["event"]
+            if name == "counter":
+                self.counters[event["name"]] = self.counters.get(event["name"], 0) + event["value"]
+            else:
+                self.counters[name] = self.counters.get(name, 0) + 1
+            if name == "timer_end":
+                key = f"{event['name']}.{event['stage']}" if "stage" in event else event["name"]
+                self.histograms.setdefault(key, []).append(event["duration_s"])
+        if name == "timer_end" and event["name"] == "stage":
+            self.flush()
+
+    def summary(self):
+        """Counters and, for every histogram, count, sum, min, max and percentiles"""
+        with self._lock:
+            histograms = {}
+            for name, values in self.histograms.items():
+                values = sorted(values)
+                histograms[name] = {
+                    "count": len(values),
+                    "sum": round(sum(values), 4),
+                    "min": round(values[0], 4),
+                    "p50": round(values[len(values) // 2], 4),
+                    "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+                    "max": round(values[-1], 4),
+                }
+            return {"counters": dict(self.counters), "histograms": histograms}
+
+    def flush(self):
+        summary = self.summary()
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        os.replace(f.name, self.path)
+
+    def close(self):
+        self.flush()
+
+
+def add_sink(sink):
+    """Send the next events to a sink, any object with handle(event) and close()
+
+    Args:
+        sink (object): sink to add
+
+    Returns:
+        object: the sink
+    """
+    with _lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    """Stop sending events to a sink and close it"""
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+    sink.close()
+
+
+def configure(console=True, events_path=None, metrics_path=None, show_progress=False):
+    """Replace the sinks
+
+    Args:
+        console (bool, optional): print the logs. Defaults to True.
+        events_path (string, optional): write every event in this .jsonl file. Defaults to None.
+        metrics_path (string, optional): write counters and histograms in this json. Defaults to None.
+        show_progress (bool, optional): print the ffmpeg progress. Defaults to False.
+    """
+    with _lock:
+        sinks = list(_sinks)
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+    if console:
+        add_sink(ConsoleSink(show_progress))
+    if events_path:
+        add_sink(JsonLinesSink(events_path))
+    if metrics_path:
+        add_sink(MetricsFileSink(metrics_path))
+
+
+def subscribe(callback, events=None):
+    """Call a function for every event, ex to follow a job from a monitor
+
+    The callbacks run in the process and the thread which emits the event,
+    the segments rendered in a process pool emit in their worker.
+
+    Args:
+        callback (callable): called with the event dict
+        events (list, optional): names of the events to receive. Defaults to None, every event.
+
+    Returns:
+        callable: call it to unsubscribe
+    """
+    hook = (callback, set(events) if events else None)
+    with _lock:
+        _hooks.append(hook)
+
+    def unsubscribe():
+        with _lock:
+            if hook in _hooks:
+                _hooks.remove(hook)
+    return unsubscribe
+
+
+def emit(event, **fields):
+    """Send an event to the sinks and the subscribers
+
+    Args:
+        event (string): name of the event
+        **fields: data of the event, must be json serializable
+    """
+    _publish({"ts": round(time.time(), 3), "event": event, "pid": os.getpid(), **fields})
+
+
+def _publish(record):
+    event = record["event"]
+    with _lock:
+        sinks = list(_sinks)
+        hooks = list(_hooks)
+    for sink in sinks:
+        sink.handle(record)
+    for callback, events in hooks:
+        if events is None or event in events:
+            try:
+                callback(record)
+            except Exception as e:
+                print(f"[ERROR] metrics hook failed : {e}")
+
+
+def init_worker(events):
+    """Send the events of a pool worker to its parent instead of its own sinks
+
+    A worker has a copy of the sinks of the parent (fork) or the default
+    console (spawn), and exits without running atexit : its counters and
+    progress would never reach the metrics file or the subscribers.
+
+    Args:
+        events (multiprocessing.Queue): queue read by forward_events in the parent
+    """
+    with _lock:
+        _sinks.clear()
+        _hooks.clear()
+        _sinks.append(QueueSink(events))
+
+
+def forward_events(events):
+    """Send the events of the pool workers to the sinks and subscribers of this process
+
+    Reads the queue until it gets None, run it in a thread.
+
+    Args:
+        events (multiprocessing.Queue): queue given to init_worker
+    """
+    for record in iter(events.get, None):
+        _publish(record)
+
+
+def log(level, message, **fields):
+    """Log a message, "info", "ok", "warning" or "error"
+
+    Args:
+        level (string): level of the message
+        message (string): message
+        **fields: data added to the event
+    """
+    emit("log", level=level, message=message, **fields)
+
+
+def increment(name, value=1, **fields):
+    """Add value to a counter"""
+    emit("counter", name=name, value=value, **fields)
+
+
+@contextmanager
+def timer(name, **fields):
+    """Time a block, emit timer_start then timer_end with its duration and status
+
+    Args:
+        name (string): name of the timer, ex "stage" or "segment"
+        **fields: data of the events, ex stage="cut"
+    """
+    emit("timer_start", name=name, **fields)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        emit("timer_end", name=name, duration_s=round(time.perf_counter() - start, 4), status=status, **fields)
+
+
+def _parse_progress_value(key, value):
+    if key in ("frame", "total_size", "out_time_us", "out_time_ms", "dup_frames", "drop_frames"):
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    if key == "fps":
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    if key == "speed":
+        try:
+            return float(value.rstrip("x"))
+        except ValueError:
+            return None
+    return value
+
+
+def parse_progress_line(report, line):
+    """Add a "key=value" line of ffmpeg -progress to report
+
+    Args:
+        report (dict): report being read, updated in place
+        line (string): line of the progress output
+
+    Returns:
+        dict: the complete report on its "progress=" line, else None
+    """
+    key, sep, value = line.strip().partition("=")
+    if not sep:
+        return None
+    report[key] = _parse_progress_value(key, value.strip())
+    if key != "progress":
+        return None
+    complete = dict(report)
+    if complete.get("out_time_us") is not None:
+        complete["out_time_s"] = round(complete["out_time_us"] / 1_000_000, 3)
+    report.clear()
+    return complete
+
+
+def iter_progress(lines):
+    """Group the lines of ffmpeg -progress in one dict by report
+
+    Args:
+        lines (iterable): "key=value" lines
+
+    Yields:
+        dict: frame, fps, speed, out_time_s and progress ("continue" or "end")
+    """
+    report = {}
+    for line in lines:
+        complete = parse_progress_line(report, line)
+        if complete:
+            yield complete
+
+
+def ffmpeg_error_message(error, lines=5):
+    """Last lines of the stderr of an ffmpeg.Error, where ffmpeg says what failed, str(error) for other errors"""
+    if not isinstance(error, ffmpeg.Error):
+        return str(error)
+    stderr = (error.stderr or b"").decode("utf-8", "replace").strip().splitlines()
+    return " | ".join(stderr[-lines:]) or str(error)
+
+
+configure()
@@ -0,0 +1,196 @@
+import gc
+import multiprocessing
+import queue
+import threading
+
+from src.transcription_backends import get_backend_class
+from src.metrics import log
+
+_models = {}
+_lock = threading.Lock()
+_worker = None
+# how often a caller waiting for the worker checks that it is still running
+WORKER_POLL_SECONDS = 1.0
+
+
+def get_model(model_name="medium", device=None, compute_type=None, backend="whisper"):
+    """Get a model, it is loaded on the first call and reused after
+
+    Args:
+        model_name (string, optional): size of the model. Defaults to "medium".
+        device (string, optional): "cpu" or "cuda". Defaults to None, the backend decides.
+        compute_type (string, optional): "float16", "float32" or "int8". Defaults to None, the backend decides.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+
+    Returns:
+        WhisperBackend or FasterWhisperBackend: the loaded model
+    """
+    backend_class = get_backend_class(backend)
+    key = (backend, model_name, device, compute_type)
+    with _lock:
+        if key not in _models:
+            log("info", f"Load {backend} model '{model_name}'")
+            _models[key] = backend_class(model_name, device=device, compute_type=compute_type)
+        return _models[key]
+
+
+def evict_model(model_name="medium", device=None, compute_type=None, backend="whisper"):
+    """Free a model loaded by get_model
+
+    Args:
+        model_name (string, optional): size of the model. Defaults to "medium".
+        device (string, optional): device of the model. Defaults to None.
+        compute_type (string, optional): compute type of the model. Defaults to None.
+        backend (string, optional): backend of the model. Defaults to "whisper".
+    """
+    with _lock:
+        _models.pop((backend, model_name, device, compute_type), None)
+    _free_memory()
+
+
+def clear_models():
+    """Free every model loaded by get_model"""
+    with _lock:
+        _models.clear()
+    _free_memory()
+
+
+def _free_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+def transcribe(audio, model_name="medium", device=None, compute_type=None, backend="whisper", use_worker=False, **options):
+    """Transcribe audio with a model of the registry
+
+    Args:
+        audio (string or np.ndarray): path to the media or 16 kHz mono float32 audio
+        model_name (string, optional): size of the model. Defaults to "medium".
+        device (string, optional): "cpu" or "cuda". Defaults to None.
+        compute_type (string, optional): "float16", "float32" or "int8". Defaults to None.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        use_worker (bool, optional): run in the warm transcription worker. Defaults to False.
+        **options: options of the transcription, ex word_timestamps=True
+
+    Returns:
+        dict: result in the whisper format
+    """
+    if use_worker:
+        return get_transcription_worker().transcribe(audio, model_name, device, compute_type, backend, **options)
+    return get_model(model_name, device, compute_type, backend).transcribe(audio, **options)
+
+
+def transcribe_batch(audios, model_name="medium", device=None, compute_type=None, backend="whisper", **options):
+    """Transcribe several audios, in shared batches when the backend can
+
+    Args:
+        audios (list): 16 kHz mono float32 audios
+        model_name (string, optional): size of the model. Defaults to "medium".
+        device (string, optional): "cpu" or "cuda". Defaults to None.
+        compute_type (string, optional): "float16", "float32" or "int8". Defaults to None.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        **options: options of the transcription, ex word_timestamps=True
+
+    Returns:
+        list: result in the whisper format for every audio
+    """
+    return get_model(model_name, device, compute_type, backend).transcribe_batch(audios, **options)
+
+
+def _worker_loop(requests, results):
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        audio, model_name, device, compute_type, backend, options = request
+        try:
+            results.put((True, transcribe(audio, model_name, device, compute_type, backend, **options)))
+        except Exception as e:
+            results.put((False, repr(e)))
+
+
+class TranscriptionWorker:
+    """Process which keeps the models loaded between pipeline runs
+
+    The models stay in the worker memory, the calling process only sends
+    the audio and gets the whisper result back.
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._lock = threading.Lock()
+        self._process = context.Process(target=_worker_loop, args=(self._requests, self._results), daemon=True)
+        self._process.start()
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    def transcribe(self, audio, model_name="medium", device=None, compute_type=None, backend="whisper", **options):
+        """Transcribe in the worker, see model_registry.transcribe
+
+        Raises:
+            RuntimeError: the transcription failed in the worker or the worker died
+        """
+        with self._lock:
+            self._requests.put((audio, model_name, device, compute_type, backend, options))
+            ok, result = self._wait_result()
+        if not ok:
+            raise RuntimeError(f"Transcription worker failed : {result}")
+        return result
+
+    def _wait_result(self):
+        while True:
+            try:
+                return self._results.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                pass
+            if not self._process.is_alive():
+                break
+        # the result may have been sent just before the worker exited
+        try:
+            return self._results.get(timeout=WORKER_POLL_SECONDS)
+        except queue.Empty:
+            pass
+        _forget_worker(self)
+        raise RuntimeError(f"Transcription worker died (exit code {self._process.exitcode}), ex out of memory")
+
+    def stop(self):
+        """Stop the worker and free its models"""
+        if self._process.is_alive():
+            self._requests.put(None)
+            self._process.join(timeout=10)
+        if self._process.is_alive():
+            self._process.kill()
+
+
+def get_transcription_worker():
+    """Get the warm transcription worker of this process, started on the first call"""
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = TranscriptionWorker()
+        return _worker
+
+
+def _forget_worker(worker):
+    # the next call of get_transcription_worker starts a new one
+    global _worker
+    with _lock:
+        if _worker is worker:
+            _worker = None
+
+
+def stop_transcription_worker():
+    """Stop the warm transcription worker if it is running"""
+    global _worker
+    with _lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop()
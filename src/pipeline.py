@@ -0,0 +1,734 @@
+import json
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+from src.banner_utils import DEFAULT_FONT_PATH
+from src.executor_utils import process_pool, reserve_threads, run_segment_jobs, set_torch_threads, split_thread_budget
+from src.metrics import emit, ffmpeg_error_message, log, timer
+from src.model_registry import clear_models, stop_transcription_worker
+from src.probe_utils import get_duration
+from src.source_file_utils import get_video_section, sanitize_filename
+from src.subtitles_utils import transcribe_segment_to_ass, transcribe_source_to_segments_ass
+from src.transcription_cache import file_hash
+from src.video_utils import cut_segment_of_video, cut_single_segment, render_segment
+
+# convert, subtitle and banner are a single encode since the render spec,
+# they are kept as names of the render stage for --from-stage
+STAGES = ["fetch", "cut", "transcribe", "render", "rename"]
+STAGE_ALIASES = {"convert": "render", "subtitle": "render", "banner": "render"}
+DEPENDENCIES = {
+    "fetch": [],
+    "cut": ["fetch"],
+    "transcribe": ["fetch"],
+    "render": ["cut", "transcribe"],
+    "rename": ["render"],
+}
+# settings which change the outputs of a stage, a unit is done again when one changes
+STAGE_SETTINGS = {
+    "fetch": ["source", "number_of_segment", "start_cuting_time_code", "time_of_segment"],
+    "cut": ["number_of_segment", "start_cuting_time_code", "time_of_segment", "cut_mode", "profile"],
+    "transcribe": ["number_of_segment", "start_cuting_time_code", "time_of_segment", "model_name", "backend", "karaoke"],
+    "render": ["mode", "video_title", "font_path", "add_part", "profile"],
+    "rename": ["video_name", "directory_output"],
+}
+
+DEFAULT_CONFIG = {
+    "number_of_segment": 9,
+    "start_cuting_time_code": 0,
+    "time_of_segment": 90,
+    "directory_videos": "./segments/",
+    "directory_output": "./output/",
+    "directory_output_sub": "./subtitles/",
+    "file_video_name_output": "segment",
+    "video_name": "video",
+    "video_title": None,
+    "transcribe": False,
+    "model_name": "medium",
+    "backend": "whisper",
+    "karaoke": False,
+    "use_cache": True,
+    "mode": "letterbox",
+    "cut_mode": "exact",
+    "profile": "final",
+    "font_path": DEFAULT_FONT_PATH,
+    "add_part": True,
+    "total_threads": None,
+    # threads of whisper, taken from total_threads while ffmpeg cuts or renders,
+    # None for a quarter of them
+    "transcription_threads": None,
+    "max_workers": None,
+    "streaming": False,
+    "queue_size": 2,
+    # transcribe in the warm worker of model_registry, and keep the models
+    # loaded after the run for the next runs of this process
+    "use_worker": False,
+    "keep_models": False,
+}
+
+
+def resolve_stage(stage):
+    """Name of the stage, convert, subtitle and banner give "render"
+
+    Args:
+        stage (string): name of a stage or an alias
+
+    Raises:
+        ValueError: unknown stage
+    """
+    stage = STAGE_ALIASES.get(stage, stage)
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage {stage}. Choose in {STAGES + list(STAGE_ALIASES)}")
+    return stage
+
+
+def downstream_stages(stage):
+    """The stage and every stage which depends on it, in order
+
+    Args:
+        stage (string): name of the stage
+    """
+    stages = {resolve_stage(stage)}
+    for name in STAGES:
+        if any(dependency in stages for dependency in DEPENDENCIES[name]):
+            stages.add(name)
+    return [name for name in STAGES if name in stages]
+
+
+def stage_levels():
+    """Stages grouped by level, the stages of a level only depend on the previous levels"""
+    levels = []
+    done = set()
+    while len(done) < len(STAGES):
+        level = [s for s in STAGES if s not in done and all(d in done for d in DEPENDENCIES[s])]
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+class Manifest:
+    """Completed (stage, unit) pairs with the hashes of their inputs and outputs
+
+    The manifest is written again after every unit (temp file then rename),
+    so a killed run loses at most the units which were running.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (string): path to the manifest json
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.units = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.units = json.load(f).get("units", {})
+
+    def get(self, stage, unit):
+        return self.units.get(f"{stage}/{unit}")
+
+    def record(self, stage, unit, settings, inputs, outputs):
+        """Record a completed unit, hashes its outputs
+
+        Args:
+            stage (string): name of the stage
+            unit (string): name of the unit, "source" or the segment index
+            settings (dict): settings of the stage used for the unit
+            inputs (dict): hash of every input by path
+            outputs (list): paths written by the unit
+        """
+        entry = {
+            "settings": settings,
+            "inputs": inputs,
+            "outputs": {path: file_hash(path) for path in outputs},
+        }
+        with self._lock:
+            self.units[f"{stage}/{unit}"] = entry
+            self._save()
+
+    def invalidate(self, stages):
+        """Forget every unit of the stages
+
+        Args:
+            stages (list): names of the stages
+        """
+        with self._lock:
+            self.units = {k: v for k, v in self.units.items() if k.split("/", 1)[0] not in stages}
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False, encoding="utf-8") as f:
+            json.dump({"units": self.units}, f, indent=2, ensure_ascii=False)
+        os.replace(f.name, self.path)
+
+
+class SegmentRecord:
+    """A segment going through the streaming pipeline, with its paths and state"""
+
+    def __init__(self, pipeline, index):
+        """
+        Args:
+            pipeline (Pipeline): pipeline of the segment
+            index (int): index of the segment, from 0
+        """
+        self.pipeline = pipeline
+        self.index = index
+        self.unit = str(index)
+        self.segment_path = pipeline.segment_path(index)
+        self.subtitles_path = pipeline.subtitles_path(index) if pipeline.config["transcribe"] else None
+        self.rendered_path = pipeline.rendered_path(index)
+        self.output_path = pipeline.output_path(index)
+        self.stage = None
+        self.error = None
+
+    def fail(self, stage, error):
+        self.stage = stage
+        self.error = error
+        log("error", f"{stage} of segment {self.index} : {ffmpeg_error_message(error)}")
+
+
+class Pipeline:
+    """Resumable pipeline : fetch, cut, transcribe, render, rename
+
+    Every stage is split in units of work (the source or one segment). A
+    unit is skipped when the manifest has it with the same settings, the
+    same input hashes and outputs still on disk with the recorded hash.
+    Segments are never rewritten in place : cut segments, rendered segments
+    and final clips are different files, so a crash leaves no half-done
+    segment behind.
+    """
+
+    def __init__(self, path_or_url, config=None, manifest_path=None):
+        """
+        Args:
+            path_or_url (string): the path or the url of the video
+            config (dict, optional): settings, see DEFAULT_CONFIG. Defaults to None.
+            manifest_path (string, optional): path to the manifest. Defaults to None, manifest.json in directory_videos.
+        """
+        self.config = dict(DEFAULT_CONFIG, source=path_or_url, **(config or {}))
+        self.directory_rendered = os.path.join(self.config["directory_videos"], "rendered")
+        self.manifest = Manifest(manifest_path or os.path.join(self.config["directory_videos"], "manifest.json"))
+        self.source = None
+        self.start = self.config["start_cuting_time_code"]
+        self.number_of_segment = 0
+        self.records = []
+        self.error = None
+
+    def settings(self, stage):
+        return {key: self.config[key] for key in STAGE_SETTINGS[stage]}
+
+    def is_done(self, stage, unit, inputs):
+        """Whether the unit is in the manifest and its outputs are unchanged
+
+        Args:
+            stage (string): name of the stage
+            unit (string): name of the unit
+            inputs (dict): current hash of every input by path
+        """
+        entry = self.manifest.get(stage, unit)
+        if entry is None or entry["settings"] != self.settings(stage) or entry["inputs"] != inputs:
+            return False
+        for path, digest in entry["outputs"].items():
+            if not os.path.exists(path) or file_hash(path) != digest:
+                return False
+        return True
+
+    def segment_name(self, i):
+        return f"{self.config['file_video_name_output']}_{i}"
+
+    def segment_path(self, i):
+        return os.path.join(self.config["directory_videos"], f"{self.segment_name(i)}.mp4")
+
+    def subtitles_path(self, i):
+        return os.path.join(self.config["directory_output_sub"], f"{self.segment_name(i)}.ass")
+
+    def rendered_path(self, i):
+        return os.path.join(self.directory_rendered, f"{self.segment_name(i)}.mp4")
+
+    def output_path(self, i):
+        name = sanitize_filename(f"[Partie {i + 1}] {self.config['video_name']}")
+        return os.path.join(self.config["directory_output"], f"{name}.mp4")
+
+    def units(self, stage):
+        """Units of a stage as (unit, inputs, outputs)
+
+        Args:
+            stage (string): name of the stage
+        """
+        if stage == "fetch":
+            return [("source", [], [self.source])]
+        segments = range(self.number_of_segment)
+        if stage == "cut":
+            return [(str(i), [self.source], [self.segment_path(i)]) for i in segments]
+        if stage == "transcribe":
+            if not self.config["transcribe"]:
+                return []
+            outputs = []
+            for i in segments:
+                outputs.append(self.subtitles_path(i))
+                outputs.append(os.path.splitext(self.subtitles_path(i))[0] + ".json")
+            return [("source", [self.source], outputs)]
+        if stage == "render":
+            units = []
+            for i in segments:
+                inputs = [self.segment_path(i)]
+                if self.config["transcribe"]:
+                    inputs.append(self.subtitles_path(i))
+                units.append((str(i), inputs, [self.rendered_path(i)]))
+            return units
+        return [(str(i), [self.rendered_path(i)], [self.output_path(i)]) for i in segments]
+
+    def run_stage(self, stage):
+        """Run the units of the stage which are not done
+
+        Args:
+            stage (string): name of the stage
+
+        Raises:
+            RuntimeError: some units failed, they will be run again on the next run
+        """
+        if stage == "fetch":
+            # fetching is what gives the path of the source, it is always run
+            # and returns the file at once when it is already downloaded.
+            # For an url only the section which is cut is downloaded, self.start
+            # is the start rebased in this section
+            config = self.config
+            with timer("download", stage=stage):
+                self.source, self.start = get_video_section(
+                    config["source"],
+                    config["start_cuting_time_code"],
+                    config["start_cuting_time_code"] + config["number_of_segment"] * config["time_of_segment"]
+                )
+            self._count_segments()
+
+        pending = []
+        for unit, input_paths, outputs in self.units(stage):
+            inputs = {path: file_hash(path) for path in input_paths}
+            if self.is_done(stage, unit, inputs):
+                continue
+            pending.append((unit, inputs, outputs))
+
+        if not pending:
+            log("ok", f"Stage {stage} already done")
+            return
+        log("info", f"Stage {stage} : {len(pending)} units to do")
+
+        def done(unit, inputs, outputs):
+            self.manifest.record(stage, unit, self.settings(stage), inputs, outputs)
+            emit("unit_done", stage=stage, unit=unit)
+
+        with timer("stage", stage=stage, units=len(pending)):
+            failed = getattr(self, f"_run_{stage}")(pending, done)
+        if failed:
+            raise RuntimeError(f"Stage {stage} failed for units {sorted(failed, key=int)}")
+
+    def run(self, from_stage=None):
+        """Run the pipeline, resuming from the first unit which is not done
+
+        Args:
+            from_stage (string, optional): do this stage and the next ones again. Defaults to None.
+        """
+        if from_stage:
+            stages = downstream_stages(from_stage)
+            log("info", f"Recompute stages {stages}")
+            self.manifest.invalidate(stages)
+
+        if self.config["streaming"]:
+            self.run_streaming()
+            log("ok", f"Pipeline done, {self.number_of_segment} clips in {self.config['directory_output']}")
+            return
+
+        for level in stage_levels():
+            if len(level) == 1:
+                self.run_stage(level[0])
+                continue
+            # cut and transcribe both read the source, they run at the same time
+            with ThreadPoolExecutor(max_workers=len(level)) as executor:
+                futures = [executor.submit(self.run_stage, stage) for stage in level]
+            for future in futures:
+                future.result()
+        log("ok", f"Pipeline done, {self.number_of_segment} clips in {self.config['directory_output']}")
+
+    def segment_unit(self, stage, i):
+        """Unit of one segment in the streaming pipeline as (unit, inputs, outputs)
+
+        The transcription is done by segment, from the cut segment, instead
+        of once for the source.
+
+        Args:
+            stage (string): "cut", "transcribe", "render" or "rename"
+            i (int): index of the segment
+        """
+        if stage == "transcribe":
+            ass_path = self.subtitles_path(i)
+            return str(i), [self.segment_path(i)], [ass_path, os.path.splitext(ass_path)[0] + ".json"]
+        return next(unit for unit in self.units(stage) if unit[0] == str(i))
+
+    def _segment_step(self, stage, record, func):
+        """Run one stage of a segment if it is not done, then record it
+
+        Returns:
+            bool: the segment can go to the next stage
+        """
+        unit, input_paths, outputs = self.segment_unit(stage, record.index)
+        inputs = {path: file_hash(path) for path in input_paths}
+        if self.is_done(stage, unit, inputs):
+            return True
+        try:
+            with timer("segment", stage=stage, segment=unit):
+                func()
+        except Exception as e:
+            record.fail(stage, e)
+            return False
+        self.manifest.record(stage, unit, self.settings(stage), inputs, outputs)
+        emit("unit_done", stage=stage, unit=unit)
+        return True
+
+    def _record_render(self, record, inputs, future):
+        """Record a render done in the process pool, with the duration measured in the worker
+
+        Returns:
+            bool: the segment can go to the next stage
+        """
+        unit = record.unit
+        error = future.exception()
+        duration = None if error is not None else future.result()
+        emit("timer_end", name="segment", duration_s=duration, status="error" if error else "ok", stage="render", segment=unit)
+        if error is not None:
+            record.fail("render", error)
+            return False
+        _, _, outputs = self.segment_unit("render", record.index)
+        self.manifest.record("render", unit, self.settings("render"), inputs, outputs)
+        emit("unit_done", stage="render", unit=unit)
+        return True
+
+    def _render_spec(self, i):
+        config = self.config
+        spec = {
+            "mode": config["mode"],
+            "title": config["video_title"],
+            "font_path": config["font_path"],
+            "part": f"Partie {i + 1}" if config["add_part"] else None,
+            "profile": config["profile"],
+        }
+        if config["transcribe"]:
+            spec["ass_path"] = self.subtitles_path(i)
+        return spec
+
+    def run_streaming(self):
+        """Move every segment through cut, transcribe, render and rename as soon as it is ready,
+        see stream_pipelines
+
+        Raises:
+            RuntimeError: the fetch or some segments failed, they will be done on the next run
+        """
+        config = self.config
+        stream_pipelines(
+            [self],
+            config["total_threads"],
+            config["max_workers"],
+            config["queue_size"],
+            config["transcription_threads"]
+        )
+        if not config["keep_models"]:
+            clear_models()
+            stop_transcription_worker()
+        if self.error is not None:
+            raise RuntimeError(f"Pipeline failed : {self.error}")
+        failed = [record for record in self.records if record.error is not None]
+        if failed:
+            raise RuntimeError(f"Segments failed : {', '.join(f'{r.index} ({r.stage})' for r in failed)}")
+
+    def _count_segments(self):
+        duration = get_duration(self.source)
+        start = self.start
+        time_of_segment = self.config["time_of_segment"]
+        self.number_of_segment = max(0, min(
+            self.config["number_of_segment"],
+            math.ceil((duration - start) / time_of_segment)
+        ))
+
+    def _run_fetch(self, pending, done):
+        for unit, inputs, outputs in pending:
+            done(unit, inputs, outputs)
+        return []
+
+    def _stage_threads(self):
+        """Threads of the transcription and of the cut, which run at the same time"""
+        config = self.config
+        if not config["transcribe"]:
+            return None, config["total_threads"]
+        return reserve_threads(config["total_threads"], config["transcription_threads"])
+
+    def _run_cut(self, pending, done):
+        config = self.config
+        _, threads = self._stage_threads()
+        if len(pending) == self.number_of_segment:
+            cut_segment_of_video(
+                self.source,
+                number_of_segment=self.number_of_segment,
+                start_cuting_time_code=self.start,
+                time_of_segment=config["time_of_segment"],
+                directory_videos=config["directory_videos"],
+                file_video_name_output=config["file_video_name_output"],
+                mode=config["cut_mode"],
+                threads=threads,
+                profile=config["profile"]
+            )
+            for unit, inputs, outputs in pending:
+                done(unit, inputs, outputs)
+            return []
+
+        # only some segments are missing, cut them alone
+        failed = []
+        for unit, inputs, outputs in pending:
+            i = int(unit)
+            try:
+                cut_single_segment(
+                    self.source,
+                    self.start + i * config["time_of_segment"],
+                    config["time_of_segment"],
+                    outputs[0],
+                    mode=config["cut_mode"],
+                    threads=threads,
+                    profile=config["profile"]
+                )
+            except ffmpeg.Error as e:
+                log("error", f"Cut of segment {unit} : {ffmpeg_error_message(e)}")
+                failed.append(unit)
+                continue
+            done(unit, inputs, outputs)
+        return failed
+
+    def _run_transcribe(self, pending, done):
+        config = self.config
+        threads, _ = self._stage_threads()
+        set_torch_threads(threads)
+        transcribe_source_to_segments_ass(
+            self.source,
+            number_of_segment=self.number_of_segment,
+            start_cuting_time_code=self.start,
+            time_of_segment=config["time_of_segment"],
+            directory_output_sub=config["directory_output_sub"],
+            file_video_name_output=config["file_video_name_output"],
+            model_name=config["model_name"],
+            use_cache=config["use_cache"],
+            backend=config["backend"],
+            karaoke=config["karaoke"],
+            use_worker=config["use_worker"]
+        )
+        if not config["keep_models"]:
+            clear_models()
+            stop_transcription_worker()
+        for unit, inputs, outputs in pending:
+            done(unit, inputs, outputs)
+        return []
+
+    def _run_render(self, pending, done):
+        config = self.config
+        os.makedirs(self.directory_rendered, exist_ok=True)
+        by_unit = {unit: (inputs, outputs) for unit, inputs, outputs in pending}
+        jobs = []
+        for unit in by_unit:
+            i = int(unit)
+            jobs.append((unit, {
+                "segment_path": self.segment_path(i),
+                "spec": self._render_spec(i),
+                "output_path": self.rendered_path(i),
+            }))
+
+        _, errors = run_segment_jobs(
+            render_segment,
+            jobs,
+            config["total_threads"],
+            config["max_workers"],
+            on_result=lambda unit, path: done(unit, *by_unit[unit])
+        )
+        return list(errors)
+
+    def _run_rename(self, pending, done):
+        os.makedirs(self.config["directory_output"], exist_ok=True)
+        for unit, inputs, outputs in pending:
+            # copy, the rendered segment stays so the render is not done again
+            shutil.copy(self.rendered_path(int(unit)), outputs[0])
+            log("ok", f"Video : {outputs[0]}")
+            done(unit, inputs, outputs)
+        return []
+
+
+def _render_job(segment_path, spec, output_path, threads):
+    """Render a segment in a pool worker
+
+    Returns:
+        float: duration of the render in seconds
+    """
+    start = time.perf_counter()
+    render_segment(segment_path, spec, output_path, threads)
+    return round(time.perf_counter() - start, 4)
+
+
+def stream_pipelines(pipelines, total_threads=None, max_workers=None, queue_size=2, transcription_threads=None):
+    """Move the segments of several pipelines through cut, transcribe, render and rename
+
+    The stages are threads connected by bounded queues : segment 0 is
+    rendered while segment 1 is cut, so the first clip is ready long
+    before the last one. The segments of every pipeline go through the
+    same threads, the same transcription model and the same process pool
+    of renders, the next source is fetched and cut while the last segments
+    of the previous one are rendered.
+
+    The models are kept loaded, the caller frees them with clear_models.
+    A pipeline which fails to fetch or cut gets its `error`, a segment which
+    fails gets its record `error`, see Pipeline.records.
+
+    Args:
+        pipelines (list): Pipeline to run, in order
+        total_threads (int, optional): threads shared by the transcription and the renders. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments rendered at the same time. Defaults to None.
+        queue_size (int, optional): segments waiting between two stages. Defaults to 2.
+        transcription_threads (int, optional): threads of the transcription, the renders get the others.
+            Defaults to None, a quarter of total_threads.
+    """
+    planned = sum(pipeline.config["number_of_segment"] for pipeline in pipelines)
+    render_threads = total_threads
+    if any(pipeline.config["transcribe"] for pipeline in pipelines):
+        # whisper runs in this process next to the renders, it gets its share of the cores
+        transcription_threads, render_threads = reserve_threads(total_threads, transcription_threads)
+    workers, threads = split_thread_budget(max(planned, 1), render_threads, max_workers)
+    cut_queue = queue.Queue(maxsize=queue_size)
+    render_queue = queue.Queue(maxsize=queue_size)
+
+    def cutter():
+        try:
+            for pipeline in pipelines:
+                config = pipeline.config
+                try:
+                    pipeline.run_stage("fetch")
+                    os.makedirs(config["directory_videos"], exist_ok=True)
+                    os.makedirs(pipeline.directory_rendered, exist_ok=True)
+                    os.makedirs(config["directory_output"], exist_ok=True)
+                    pipeline.records = [SegmentRecord(pipeline, i) for i in range(pipeline.number_of_segment)]
+                    for record in pipeline.records:
+                        ok = pipeline._segment_step("cut", record, lambda: cut_single_segment(
+                            pipeline.source,
+                            pipeline.start + record.index * config["time_of_segment"],
+                            config["time_of_segment"],
+                            record.segment_path,
+                            mode=config["cut_mode"],
+                            threads=threads,
+                            profile=config["profile"]
+                        ))
+                        if ok:
+                            cut_queue.put(record)
+                except Exception as e:
+                    # the next sources are still done
+                    pipeline.error = e
+                    log("error", f"{config['source']} : {ffmpeg_error_message(e)}")
+        finally:
+            cut_queue.put(None)
+
+    def transcriber():
+        if transcription_threads:
+            set_torch_threads(transcription_threads)
+        try:
+            while True:
+                record = cut_queue.get()
+                if record is None:
+                    break
+                pipeline = record.pipeline
+                config = pipeline.config
+                if config["transcribe"]:
+                    os.makedirs(config["directory_output_sub"], exist_ok=True)
+                    ok = pipeline._segment_step("transcribe", record, lambda: transcribe_segment_to_ass(
+                        record.segment_path,
+                        record.subtitles_path,
+                        os.path.splitext(record.subtitles_path)[0] + ".json",
+                        model_name=config["model_name"],
+                        use_cache=config["use_cache"],
+                        backend=config["backend"],
+                        karaoke=config["karaoke"],
+                        use_worker=config["use_worker"]
+                    ))
+                    if not ok:
+                        continue
+                render_queue.put(record)
+        finally:
+            render_queue.put(None)
+
+    def rename(record):
+        pipeline = record.pipeline
+        if pipeline._segment_step("rename", record, lambda: shutil.copy(record.rendered_path, record.output_path)):
+            log("ok", f"Video : {record.output_path}")
+
+    producers = [
+        threading.Thread(target=cutter, name="cut", daemon=True),
+        threading.Thread(target=transcriber, name="transcribe", daemon=True),
+    ]
+    for thread in producers:
+        thread.start()
+
+    # the main loop dispatches the renders and records them when they end, the
+    # done callbacks only post the future : hashing, writing the manifest and
+    # copying the clip in the executor thread would stall the pool.
+    # At most `workers` renders are in flight, the queues make the cut wait
+    events = queue.Queue()
+    in_flight = 0
+    ended = False
+    with process_pool(workers) as executor:
+        while not ended or in_flight:
+            if not ended and in_flight < workers:
+                try:
+                    # wait for a segment only when no render can end meanwhile
+                    record = render_queue.get(block=in_flight == 0)
+                except queue.Empty:
+                    record = False
+                if record is None:
+                    ended = True
+                    continue
+                if record:
+                    pipeline = record.pipeline
+                    unit, input_paths, _ = pipeline.segment_unit("render", record.index)
+                    inputs = {path: file_hash(path) for path in input_paths}
+                    if pipeline.is_done("render", unit, inputs):
+                        rename(record)
+                        continue
+                    emit("timer_start", name="segment", stage="render", segment=unit)
+                    future = executor.submit(_render_job, record.segment_path, pipeline._render_spec(record.index), record.rendered_path, threads)
+                    future.add_done_callback(lambda f, record=record, inputs=inputs: events.put((record, inputs, f)))
+                    in_flight += 1
+                    continue
+            try:
+                record, inputs, future = events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            in_flight -= 1
+            if record.pipeline._record_render(record, inputs, future):
+                rename(record)
+
+    for thread in producers:
+        thread.join()
+
+
+def run_pipeline(path_or_url, config=None, from_stage=None, manifest_path=None):
+    """Run the resumable pipeline on a video
+
+    Args:
+        path_or_url (string): the path or the url of the video
+        config (dict, optional): settings, see DEFAULT_CONFIG. Defaults to None.
+        from_stage (string, optional): do this stage and the next ones again. Defaults to None.
+        manifest_path (string, optional): path to the manifest. Defaults to None.
+
+    Returns:
+        Pipeline: the pipeline which ran
+    """
+    pipeline = Pipeline(path_or_url, config, manifest_path)
+    pipeline.run(from_stage)
+    return pipeline
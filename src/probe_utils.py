@@ -0,0 +1,164 @@
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+import ffmpeg
+
+DEFAULT_PROBE_DIR = "./cache/probe/"
+# in the key of the cached probes, changed when the content of a probe changes
+PROBE_VERSION = 2
+
+_probes = {}
+
+
+def _probe_key(path):
+    stat = os.stat(path)
+    return hashlib.sha1(json.dumps([PROBE_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns]).encode("utf-8")).hexdigest()
+
+
+def _frame_rate(rate):
+    if not rate or rate == "0/0":
+        return None
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1)
+
+
+def _summarize(probe):
+    """Keep the facts used by the stages from an ffprobe result"""
+    video = next((s for s in probe["streams"] if s.get("codec_type") == "video"), None)
+    audio = next((s for s in probe["streams"] if s.get("codec_type") == "audio"), None)
+    info = {
+        "duration": float(probe["format"].get("duration", 0)),
+        "format": probe["format"].get("format_name"),
+        "streams": [
+            {"index": s["index"], "codec_type": s.get("codec_type"), "codec_name": s.get("codec_name")}
+            for s in probe["streams"]
+        ],
+        "video": None,
+        "audio": None,
+        "keyframes": None,
+    }
+    if video:
+        info["video"] = {
+            "codec": video.get("codec_name"),
+            "width": int(video["width"]),
+            "height": int(video["height"]),
+            "fps": _frame_rate(video.get("avg_frame_rate")) or _frame_rate(video.get("r_frame_rate")),
+            "pix_fmt": video.get("pix_fmt"),
+        }
+    if audio:
+        info["audio"] = {
+            "codec": audio.get("codec_name"),
+            "sample_rate": int(audio.get("sample_rate", 0)),
+            "channels": audio.get("channels"),
+        }
+    return info
+
+
+def _start_time(probe):
+    """Timestamp of the start of the media, the origin of the -ss of ffmpeg"""
+    for entry in [probe.get("format", {}), *probe.get("streams", [])]:
+        if entry.get("start_time") not in (None, "N/A"):
+            return float(entry["start_time"])
+    return 0.0
+
+
+def _probe_keyframes(path):
+    """Times of the keyframes of the first video stream, read from the packets (no decoding)
+
+    The pts of the packets are absolute (a .ts or a cut video rarely starts
+    at 0), the times are from the start of the media like the -ss of ffmpeg.
+    """
+    probe = ffmpeg.probe(path, select_streams="v:0", show_entries="packet=pts_time,flags:stream=start_time:format=start_time")
+    start_time = _start_time(probe)
+    return sorted(
+        round(float(p["pts_time"]) - start_time, 6) for p in probe.get("packets", [])
+        if "K" in p.get("flags", "") and p.get("pts_time") not in (None, "N/A")
+    )
+
+
+def probe_media(path, keyframes=False, probe_dir=DEFAULT_PROBE_DIR):
+    """Probe a media once, the result is cached by (path, size, mtime)
+
+    The result is kept in memory and in a json file of probe_dir, so the
+    next runs do not open the media again.
+
+    Args:
+        path (string): path to the media
+        keyframes (bool, optional): also list the keyframes, it reads every packet. Defaults to False.
+        probe_dir (string, optional): directory of the cache. Defaults to DEFAULT_PROBE_DIR.
+
+    Returns:
+        dict: duration, format, streams, video (codec, width, height, fps, pix_fmt), audio and keyframes
+    """
+    key = _probe_key(path)
+    cache_path = os.path.join(probe_dir, f"{key}.json")
+    info = _probes.get(key)
+    if info is None and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+
+    changed = False
+    if info is None:
+        info = _summarize(ffmpeg.probe(path))
+        changed = True
+    if keyframes and info["keyframes"] is None and info["video"]:
+        info["keyframes"] = _probe_keyframes(path)
+        changed = True
+
+    _probes[key] = info
+    if changed:
+        os.makedirs(probe_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=probe_dir, suffix=".tmp", delete=False, encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(f.name, cache_path)
+    return info
+
+
+def get_duration(path):
+    """Duration of the media in seconds"""
+    return probe_media(path)["duration"]
+
+
+def get_resolution(path):
+    """(width, height) of the video, None without video stream"""
+    video = probe_media(path)["video"]
+    return (video["width"], video["height"]) if video else None
+
+
+def get_fps(path):
+    """Frame rate of the video, None without video stream"""
+    video = probe_media(path)["video"]
+    return video["fps"] if video else None
+
+
+def get_keyframes(path):
+    """Sorted times of the keyframes in seconds, from the start of the media"""
+    return probe_media(path, keyframes=True)["keyframes"] or []
+
+
+def snap_to_keyframe(keyframes, time, direction="before"):
+    """Move a time on a keyframe
+
+    Args:
+        keyframes (list): sorted timestamps of the keyframes
+        time (float): time in seconds
+        direction (string, optional): "before", "after" or "nearest". Defaults to "before".
+
+    Returns:
+        float: timestamp of the keyframe, time if there is none in this direction
+    """
+    if not keyframes:
+        return time
+    i = bisect.bisect_right(keyframes, time)
+    before = keyframes[i - 1] if i > 0 else None
+    after = keyframes[i] if i < len(keyframes) else None
+    if before is not None and before == time:
+        return time
+    if direction == "before":
+        return before if before is not None else time
+    if direction == "after":
+        return after if after is not None else time
+    candidates = [k for k in (before, after) if k is not None]
+    return min(candidates, key=lambda k: abs(k - time))
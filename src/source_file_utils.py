@@ -1,9 +1,263 @@
+import json
+import math
 import os
+import threading
+import ffmpeg
 import requests
 import yt_dlp
 import re
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.ffmpeg_scheduler import run_ffmpeg
+from src.metrics import emit, log
 
-def get_video_source(path_or_url, download_dir="downloads"):
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+READ_SIZE = 1024 * 1024
+DEFAULT_SECTION_MARGIN = 5.0
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size=DEFAULT_CONNECTIONS):
+    """Session shared by the downloads, its connections are kept alive and reused
+
+    Args:
+        pool_size (int, optional): connections kept by host. Defaults to DEFAULT_CONNECTIONS.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _load_progress(progress_path):
+    if not os.path.exists(progress_path):
+        return None
+    try:
+        with open(progress_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+
+def _save_progress(progress_path, progress):
+    temp_path = progress_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(progress, f)
+    os.replace(temp_path, progress_path)
+
+
+def _download_stream(session, url, part_path, length=None):
+    """Download the whole file with a single request"""
+    written = 0
+    with session.get(url, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        with open(part_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=READ_SIZE):
+                f.write(chunk)
+                written += len(chunk)
+    if length and written != length:
+        raise IOError(f"Download of {url} incomplete : {written}/{length} bytes")
+
+
+def _range_validator(etag, last_modified):
+    """Validator of the If-Range header : a strong ETag, else the Last-Modified date
+
+    A weak ETag (W/"...") can not be used, the server would always send the whole file.
+
+    Returns:
+        string: the validator, None if the server gives none
+    """
+    if etag and not etag.startswith("W/"):
+        return etag
+    return last_modified
+
+
+def _download_range(session, url, part_path, start, end, validator=None):
+    """Download bytes [start, end] of the file at their place in part_path
+
+    Args:
+        validator (string, optional): strong ETag or Last-Modified, see _range_validator. Defaults to None.
+
+    Raises:
+        ValueError: the server sent the whole file instead of the range
+        IOError: the range is incomplete
+    """
+    headers = {"Range": f"bytes={start}-{end}"}
+    if validator:
+        # the server sends the whole file if it changed since the first request
+        headers["If-Range"] = validator
+    position = start
+    with session.get(url, headers=headers, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise ValueError(f"Range requests not supported by {url}")
+        with open(part_path, "r+b") as f:
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size=READ_SIZE):
+                remaining = end + 1 - position
+                if remaining <= 0:
+                    break
+                f.write(chunk[:remaining])
+                position += min(len(chunk), remaining)
+    if position < end + 1:
+        raise IOError(f"Range {start}-{end} of {url} incomplete")
+
+
+def _remote_file(session, url):
+    """Length, validators and range support of a remote file
+
+    HEAD first, then a GET of the first byte for the servers which refuse HEAD
+    (403 on presigned S3/GCS urls, 405 on some CDNs).
+
+    Returns:
+        tuple: (length or None, ETag, Last-Modified, the server accepts ranges)
+    """
+    try:
+        head = session.head(url, allow_redirects=True, timeout=30)
+        head.raise_for_status()
+        length = int(head.headers.get("Content-Length", 0)) or None
+        ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes" and length is not None
+        return length, head.headers.get("ETag"), head.headers.get("Last-Modified"), ranges
+    except requests.RequestException as e:
+        log("warning", f"HEAD of {url} failed ({e}), ask the first byte")
+
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        if r.status_code == 206:
+            # Content-Range: bytes 0-0/<length>, the length may be unknown (*)
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            length = int(total) if total.isdigit() else None
+        else:
+            length = int(r.headers.get("Content-Length", 0)) or None
+        ranges = r.status_code == 206 and length is not None
+        return length, r.headers.get("ETag"), r.headers.get("Last-Modified"), ranges
+
+
+def download_file(url, local_filename, chunk_size=DEFAULT_CHUNK_SIZE, connections=DEFAULT_CONNECTIONS):
+    """Download a file with concurrent HTTP Range requests, resumable
+
+    The file is written in {local_filename}.part and the downloaded chunks
+    are recorded in {local_filename}.download.json, a new call only downloads
+    the missing chunks if the remote file has the same Content-Length, ETag
+    and Last-Modified. Every range is sent with If-Range (a strong ETag, else
+    Last-Modified), without any of them the download starts again from zero.
+    The file is only returned once it is complete and still matches the
+    remote file, a file without sidecar is only kept if it has the remote
+    Content-Length. Servers without ranges get a single streamed request,
+    servers which refuse HEAD are asked the first byte instead.
+
+    Args:
+        url (string): url of the file
+        local_filename (string): path of the downloaded file
+        chunk_size (int, optional): size of a range request. Defaults to 8 MB.
+        connections (int, optional): concurrent requests. Defaults to 4.
+
+    Returns:
+        string: local_filename
+    """
+    session = get_session(connections)
+    part_path = local_filename + ".part"
+    progress_path = local_filename + ".download.json"
+    progress = _load_progress(progress_path)
+    complete = os.path.exists(local_filename) and progress is not None and progress.get("complete")
+
+    try:
+        length, etag, last_modified, ranges = _remote_file(session, url)
+    except requests.RequestException:
+        if complete:
+            log("warning", f"{url} unreachable, use {local_filename}")
+            return local_filename
+        raise
+    validator = _range_validator(etag, last_modified)
+
+    if os.path.exists(local_filename):
+        same_size = length is not None and os.path.getsize(local_filename) == length
+        if progress is not None and progress.get("complete"):
+            same_etag = etag is None or progress.get("etag") == etag
+            same_date = last_modified is None or progress.get("last_modified") == last_modified
+            matches = (same_size or length is None) and same_etag and same_date
+        else:
+            # no sidecar, a file of an older download or of a killed run : only a known length tells it is complete
+            matches = progress is None and same_size
+        if matches:
+            return local_filename
+        log("warning", f"{local_filename} does not match {url}, download again")
+
+    if not ranges:
+        log("info", f"Download by {url} (single request)...")
+        # an interrupted download must not be taken for the old file
+        _save_progress(progress_path, {"url": url, "length": length, "etag": etag, "last_modified": last_modified, "complete": False})
+        _download_stream(session, url, part_path, length)
+        os.replace(part_path, local_filename)
+        _save_progress(progress_path, {"url": url, "length": length, "etag": etag, "last_modified": last_modified, "complete": True})
+        return local_filename
+
+    if (
+        progress is None
+        or progress.get("complete")
+        or progress.get("length") != length
+        or progress.get("etag") != etag
+        or progress.get("last_modified") != last_modified
+        or progress.get("chunk_size") != chunk_size
+        # nothing tells the chunks already downloaded are from the same file
+        or validator is None
+        or not os.path.exists(part_path)
+    ):
+        if progress is not None and not progress.get("complete") and validator is None:
+            log("warning", f"{url} has no ETag nor Last-Modified, the download can not resume")
+        progress = {
+            "url": url,
+            "length": length,
+            "etag": etag,
+            "last_modified": last_modified,
+            "chunk_size": chunk_size,
+            "done": [],
+        }
+        with open(part_path, "wb") as f:
+            f.truncate(length)
+        _save_progress(progress_path, progress)
+
+    number_of_chunks = math.ceil(length / chunk_size)
+    done = set(progress["done"])
+    missing = [i for i in range(number_of_chunks) if i not in done]
+    log("info", f"Download by {url} : {len(missing)}/{number_of_chunks} chunks on {connections} connections...")
+
+    lock = threading.Lock()
+
+    def fetch(i):
+        start = i * chunk_size
+        _download_range(session, url, part_path, start, min(start + chunk_size, length) - 1, validator)
+        with lock:
+            done.add(i)
+            progress["done"] = sorted(done)
+            _save_progress(progress_path, progress)
+            emit("download_progress", url=url, chunks_done=len(done), chunks=number_of_chunks, bytes=length)
+
+    try:
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(fetch, missing))
+    except ValueError:
+        log("warning", f"{url} ignores ranges, download with a single request")
+        _download_stream(session, url, part_path, length)
+
+    if os.path.getsize(part_path) != length:
+        raise IOError(f"Download of {url} incomplete : {os.path.getsize(part_path)}/{length} bytes")
+    os.replace(part_path, local_filename)
+    progress["complete"] = True
+    _save_progress(progress_path, progress)
+    return local_filename
+
+
+def get_video_source(path_or_url, download_dir="downloads", chunk_size=DEFAULT_CHUNK_SIZE, connections=DEFAULT_CONNECTIONS):
 
     """
         Get video source either from local or download it 
@@ -11,6 +265,8 @@ def get_video_source(path_or_url, download_dir="downloads"):
         Args:
             path_or_url (string): the path or the url to get the video .
             download_dir (string): The directory where video will be place.
+            chunk_size (int, optional): size of a range request for direct urls. Defaults to 8 MB.
+            connections (int, optional): concurrent requests for direct urls. Defaults to 4.
 
         Returns:
             string: Path to the video download
@@ -23,8 +279,8 @@ def get_video_source(path_or_url, download_dir="downloads"):
 
     # Case 2 : URL
     if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
-        if "youtube.com" in path_or_url or "youtu.be" in path_or_url:
-            print(f"[INFO] Download by YouTube : {path_or_url}")
+        if _is_youtube(path_or_url):
+            log("info", f"Download by YouTube : {path_or_url}")
             ydl_opts = {
                 "outtmpl": os.path.join(download_dir, "%(title)s.%(ext)s"),
                 "format": "bestvideo+bestaudio/best",
@@ -38,18 +294,76 @@ def get_video_source(path_or_url, download_dir="downloads"):
             return downloaded_path
         else:
             local_filename = os.path.join(download_dir, os.path.basename(path_or_url.split('?')[0]))
-            if not os.path.exists(local_filename):
-                print(f"[INFO] Downlaod by {path_or_url}...")
-                with requests.get(path_or_url, stream=True) as r:
-                    r.raise_for_status()
-                    with open(local_filename, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                print(f"[OK] Download : {local_filename}")
+            download_file(path_or_url, local_filename, chunk_size=chunk_size, connections=connections)
+            log("ok", f"Download : {local_filename}")
             return local_filename
 
     raise ValueError(f"Format no recognize : {path_or_url}")
 
+def _is_youtube(url):
+    return "youtube.com" in url or "youtu.be" in url
+
+
+def get_video_section(path_or_url, start, end, download_dir="downloads", margin=DEFAULT_SECTION_MARGIN):
+    """
+        Get only the part of the video between start and end
+
+        A local file is returned as is. For an url only [start - margin, end + margin]
+        is downloaded : yt-dlp download ranges for YouTube, ffmpeg seeking in the
+        remote file otherwise. The margin keeps the keyframe before start in the
+        section. The times in the section start at the beginning of the section,
+        so the returned offset is where start is in the section.
+
+        Args:
+            path_or_url (string): the path or the url to get the video
+            start (float): start of the part needed, in seconds
+            end (float): end of the part needed, in seconds
+            download_dir (string, optional): The directory where video will be place. Defaults to "downloads".
+            margin (float, optional): seconds downloaded before and after the part. Defaults to 5.
+
+        Returns:
+            tuple: (path to the video, start in this video in seconds)
+    """
+    if os.path.exists(path_or_url):
+        return path_or_url, start
+    if not (path_or_url.startswith("http://") or path_or_url.startswith("https://")):
+        raise ValueError(f"Format no recognize : {path_or_url}")
+
+    os.makedirs(download_dir, exist_ok=True)
+    section_start = max(0.0, start - margin)
+    section_end = end + margin
+    suffix = f"{section_start:g}-{section_end:g}"
+
+    if _is_youtube(path_or_url):
+        log("info", f"Download by YouTube : {path_or_url} from {section_start}s to {section_end}s")
+        ydl_opts = {
+            "outtmpl": os.path.join(download_dir, f"%(title)s [{suffix}].%(ext)s"),
+            "format": "bestvideo+bestaudio/best",
+            "merge_output_format": "mp4",
+            "download_ranges": yt_dlp.utils.download_range_func(None, [(section_start, section_end)]),
+        }
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(path_or_url, download=True)
+            downloaded_path = ydl.prepare_filename(info)
+            if not downloaded_path.endswith(".mp4"):
+                downloaded_path = os.path.splitext(downloaded_path)[0] + ".mp4"
+        return downloaded_path, start - section_start
+
+    name = os.path.splitext(os.path.basename(path_or_url.split('?')[0]))[0]
+    local_filename = os.path.join(download_dir, f"{name} [{suffix}].mp4")
+    if not os.path.exists(local_filename):
+        log("info", f"Download by {path_or_url} from {section_start}s to {section_end}s...")
+        part_path = os.path.join(download_dir, f"{name} [{suffix}].part.mp4")
+        run_ffmpeg(
+            ffmpeg
+            .input(path_or_url, ss=section_start, t=section_end - section_start)
+            .output(part_path, c="copy"),
+            name="download"
+        )
+        os.replace(part_path, local_filename)
+        log("ok", f"Download : {local_filename}")
+    return local_filename, start - section_start
+
 def cleanup_directory(directory="downloads"):
     """ Delete all files in directory
         Args:
@@ -63,7 +377,7 @@ def cleanup_directory(directory="downloads"):
                 if os.path.isfile(file_path):
                     os.remove(file_path)
             except Exception as e:
-                print(f"Erreur lors de la suppression de {file_path} : {e}")
+                log("error", f"Can not delete {file_path} : {e}")
 
 def sanitize_filename(filename):
     """
@@ -79,6 +393,14 @@ def sanitize_filename(filename):
     sanitized = sanitized.strip().rstrip('.')
     return sanitized
 
+def natural_sort_key(filename):
+    """Key to sort the names with their numbers as numbers, "segment_2" before "segment_10"
+
+    Args:
+        filename (string): name of the file
+    """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', filename)]
+
 def rename_file(original_path, new_name):
 
     """
@@ -104,9 +426,7 @@ def rename_all_files_segment_in_directory(directory, new_base_name):
         new_bas_name (string) : the common base of all files
 
     """
-    all_segments = sorted([
-        f for f in os.listdir(directory)
-    ])
+    all_segments = sorted(os.listdir(directory), key=natural_sort_key)
 
     for index, filename in enumerate(all_segments):
         file_path = os.path.join(directory, filename)
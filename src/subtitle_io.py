@@ -0,0 +1,461 @@
+import json
+import os
+import re
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1080
+PlayResY: 1920
+Timer: 100.0000
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: MyStyle,Arial,75,&H00FFFFFF,&H00000000,&H64000000,0,0,1,2,1,2,10,10,400,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+# sung words go from SecondaryColour (white) to PrimaryColour (yellow)
+KARAOKE_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1080
+PlayResY: 1920
+Timer: 100.0000
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: MyStyle,Arial,75,&H0000FFFF,&H00FFFFFF,&H00000000,&H64000000,0,0,1,2,1,2,10,10,400,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+FORMATS = ("srt", "ass", "json")
+
+
+def srt_time_to_seconds(t):
+    """Transform srt time to seconds
+
+    Args:
+        t (string): time in srt file
+    """
+    hh, mm, ss_ms = t.split(':')
+    ss, ms = ss_ms.split(',')
+    return int(hh) * 3600 + int(mm) * 60 + int(ss) + int(ms) / 1000.0
+
+
+def ass_time_to_seconds(t):
+    """Transform ass time to seconds
+
+    Args:
+        t (string): time in ass file
+    """
+    h, m, s_cs = t.split(":")
+    s, cs = s_cs.split(".")
+    return int(h)*3600 + int(m)*60 + int(s) + int(cs)/100.0
+
+
+def seconds_to_srt_time(seconds):
+    """Transform seconds to srt time
+
+    Args:
+        seconds (float): time in seconds
+    """
+    # rounded, 1.2 is 1.19999... in float
+    total_ms = max(round(seconds * 1000), 0)
+    hh, rest = divmod(total_ms, 3600000)
+    mm, rest = divmod(rest, 60000)
+    ss, ms = divmod(rest, 1000)
+    return f"{hh:02d}:{mm:02d}:{ss:02d},{ms:03d}"
+
+
+def seconds_to_ass_time(seconds):
+    """Transform seconds to ass time
+
+    Args:
+        seconds (float): time in seconds
+    """
+    total_cs = max(round(seconds * 100), 0)
+    h, rest = divmod(total_cs, 360000)
+    m, rest = divmod(rest, 6000)
+    s, cs = divmod(rest, 100)
+    return f"{h}:{m:02}:{s:02}.{cs:02}"
+
+
+def sniff_format(path):
+    """Find the format of a subtitles file from its content
+
+    Args:
+        path (string): path to subtitles file
+
+    Raises:
+        ValueError: the format is not recognized
+
+    Returns:
+        string: "srt", "ass" or "json"
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(4096).lstrip("\ufeff \t\r\n")
+    if head.startswith("[Script Info]") or "[Events]" in head or head.startswith("Dialogue:"):
+        return "ass"
+    if head.startswith("{") or head.startswith("["):
+        return "json"
+    if re.match(r"\d+\s*\n\s*[\d:,.]+\s*-->", head) or "-->" in head.split("\n", 2)[0]:
+        return "srt"
+    if head == "":
+        extension = os.path.splitext(path)[1].lower().lstrip(".")
+        if extension in FORMATS:
+            return extension
+    raise ValueError(f"Format no recognize : {path}")
+
+
+def iter_srt(path):
+    """Read the cues of a .srt file one by one
+
+    Args:
+        path (string): path to subtitles file
+
+    Yields:
+        dict: cue with 'start', 'end' in seconds and 'text'
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        times = None
+        text = []
+        for line in f:
+            line = line.strip()
+            if times is None:
+                if "-->" in line:
+                    start, end = line.split("-->")
+                    times = (srt_time_to_seconds(start.strip().replace(".", ",")), srt_time_to_seconds(end.strip().split(" ")[0].replace(".", ",")))
+                continue
+            if line:
+                text.append(line)
+                continue
+            yield {"start": times[0], "end": times[1], "text": " ".join(text)}
+            times = None
+            text = []
+        if times is not None:
+            yield {"start": times[0], "end": times[1], "text": " ".join(text)}
+
+
+def iter_ass(path):
+    """Read the Dialogue events of a .ass file one by one, override tags are removed
+
+    Args:
+        path (string): path to subtitles file
+
+    Yields:
+        dict: cue with 'start', 'end' in seconds and 'text'
+    """
+    fields = ["layer", "start", "end", "style", "name", "marginl", "marginr", "marginv", "effect", "text"]
+    events_section = False
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                events_section = line.startswith("[Events]")
+                continue
+            if not events_section:
+                continue
+            if line.startswith("Format:"):
+                fields = [x.strip().lower() for x in line[len("Format:"):].split(",")]
+                continue
+            if line.startswith("Dialogue:"):
+                parts = line[len("Dialogue:"):].split(",", len(fields) - 1)
+                text = parts[fields.index("text")].strip()
+                yield {
+                    "start": ass_time_to_seconds(parts[fields.index("start")].strip()),
+                    "end": ass_time_to_seconds(parts[fields.index("end")].strip()),
+                    "text": re.sub(r"{.*?}", "", text).replace("\\N", " "),
+                }
+
+
+class _JsonStream:
+    """Incremental reader of json values, only a chunk of the file is kept in memory"""
+
+    def __init__(self, f, chunk_size=65536):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n\ufeff":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Invalid json : '{char}' expected at '{self.buf[self.pos:self.pos + 20]}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number cut by the chunk ("12" of "12.5") is only complete before a delimiter
+                if self.eof or (end < len(self.buf) and self.buf[end] in " \t\r\n,:]}"):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def array_items(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def _json_item_to_cues(item):
+    words = item.get("words")
+    if words:
+        for w in words:
+            yield {"start": float(w["start"]), "end": float(w["end"]), "text": w["word"].strip()}
+        return
+    start, end = item["start"], item["end"]
+    if isinstance(start, str):
+        start, end = srt_time_to_seconds(start), srt_time_to_seconds(end)
+    yield {"start": float(start), "end": float(end), "text": item["text"].strip()}
+
+
+def iter_json(path):
+    """Read the cues of a .json file one by one
+
+    The file is either a list of cues (srt_to_json) or a whisper result,
+    whose words are read one by one (the segment when it has no words).
+
+    Args:
+        path (string): path to subtitles file
+
+    Yields:
+        dict: cue with 'start', 'end' in seconds and 'text'
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        if stream.peek() == "[":
+            for item in stream.array_items():
+                yield from _json_item_to_cues(item)
+            return
+        stream.expect("{")
+        while stream.peek() not in ("}", ""):
+            key = stream.value()
+            stream.expect(":")
+            if key == "segments" and stream.peek() == "[":
+                for item in stream.array_items():
+                    yield from _json_item_to_cues(item)
+            else:
+                stream.value()
+            if stream.peek() == ",":
+                stream.pos += 1
+
+
+PARSERS = {"srt": iter_srt, "ass": iter_ass, "json": iter_json}
+
+
+def iter_cues(path, input_format=None):
+    """Read the cues of a subtitles file, the format is found from the content
+
+    Args:
+        path (string): path to subtitles file
+        input_format (string, optional): "srt", "ass" or "json". Defaults to None, sniffed.
+
+    Yields:
+        dict: cue with 'start', 'end' in seconds and 'text'
+    """
+    return PARSERS[input_format or sniff_format(path)](path)
+
+
+def _karaoke_line(words, tag):
+    parts = []
+    for i, w in enumerate(words):
+        end = words[i + 1]["start"] if i + 1 < len(words) else w["end"]
+        duration = max(round(end * 100) - round(w["start"] * 100), 0)
+        parts.append(f"{{\\{tag}{duration}}}{w['text'].strip()}")
+    return {"start": words[0]["start"], "end": words[-1]["end"], "text": " ".join(parts)}
+
+
+def iter_karaoke_lines(words, max_chars=24, max_duration=3.0, max_pause=0.6, tag="kf"):
+    """Group words in display lines, each word is highlighted with a karaoke tag
+
+    A line ends when it would be longer than max_chars or max_duration, when
+    the pause before the next word is longer than max_pause, or after a
+    word which ends a sentence.
+
+    Args:
+        words (iterable): word cues with 'start', 'end' in seconds and 'text'
+        max_chars (int, optional): maximum of characters in a line. Defaults to 24.
+        max_duration (float, optional): maximum duration of a line in seconds. Defaults to 3.
+        max_pause (float, optional): longest pause inside a line in seconds. Defaults to 0.6.
+        tag (string, optional): "kf" to fill the word progressively, "k" to highlight it at once. Defaults to "kf".
+
+    Yields:
+        dict: cue of a line, with the karaoke tags in 'text'
+    """
+    line = []
+    length = 0
+    for w in words:
+        text = w["text"].strip()
+        if not text:
+            continue
+        if line and (
+            length + 1 + len(text) > max_chars
+            or w["end"] - line[0]["start"] > max_duration
+            or w["start"] - line[-1]["end"] > max_pause
+            or line[-1]["text"].strip()[-1] in ".?!"
+        ):
+            yield _karaoke_line(line, tag)
+            line = []
+            length = 0
+        length += len(text) + (1 if line else 0)
+        line.append(w)
+    if line:
+        yield _karaoke_line(line, tag)
+
+
+class _SubtitlesWriter:
+    """Base of the writers, cues are written as soon as they are given"""
+
+    def __init__(self, output_path):
+        self.f = open(output_path, "w", encoding="utf-8")
+        self.count = 0
+        self.begin()
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def write(self, cue):
+        """Write a cue, dict with 'start', 'end' in seconds and 'text'"""
+        self.count += 1
+        self.write_cue(cue)
+
+    def write_cue(self, cue):
+        raise NotImplementedError
+
+    def flush(self):
+        """Write the cues given so far to the disk, the file can be read while it grows"""
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.end()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SrtWriter(_SubtitlesWriter):
+    """Write a .srt file cue by cue"""
+
+    def write_cue(self, cue):
+        self.f.write(f"{self.count}\n")
+        self.f.write(f"{seconds_to_srt_time(cue['start'])} --> {seconds_to_srt_time(cue['end'])}\n")
+        self.f.write(f"{cue['text'].strip()}\n\n")
+
+
+class AssWriter(_SubtitlesWriter):
+    """Write a stylized .ass file cue by cue
+
+    Args:
+        output_path (string): output path of the subtitles file
+        header (string, optional): [Script Info], styles and events format. Defaults to ASS_HEADER.
+        style (string, optional): style of the events. Defaults to "MyStyle".
+    """
+
+    def __init__(self, output_path, header=ASS_HEADER, style="MyStyle"):
+        self.header = header
+        self.style = style
+        super().__init__(output_path)
+
+    def begin(self):
+        self.f.write(self.header)
+
+    def write_cue(self, cue):
+        text = cue["text"].strip().replace("\n", "\\N")
+        self.f.write(f"\nDialogue: 0,{seconds_to_ass_time(cue['start'])},{seconds_to_ass_time(cue['end'])},{self.style},,0,0,0,,{text}")
+
+
+class JsonWriter(_SubtitlesWriter):
+    """Write a .json list of cues (format of srt_to_json) cue by cue"""
+
+    def write_cue(self, cue):
+        item = json.dumps({
+            "index": self.count,
+            "start": seconds_to_srt_time(cue["start"]),
+            "end": seconds_to_srt_time(cue["end"]),
+            "text": cue["text"].replace("\n", " ").strip()
+        }, ensure_ascii=False, indent=2)
+        self.f.write(("[\n  " if self.count == 1 else ",\n  ") + item.replace("\n", "\n  "))
+
+    def end(self):
+        self.f.write("\n]" if self.count else "[]")
+
+
+WRITERS = {"srt": SrtWriter, "ass": AssWriter, "json": JsonWriter}
+
+
+def open_writer(output_path, output_format=None):
+    """Writer for a subtitles file, the format comes from the extension
+
+    Args:
+        output_path (string): output path of the subtitles file
+        output_format (string, optional): "srt", "ass" or "json". Defaults to None, from the extension.
+
+    Raises:
+        ValueError: unknown format
+    """
+    output_format = output_format or os.path.splitext(output_path)[1].lower().lstrip(".")
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown format. Choose one of {', '.join(FORMATS)}")
+    return WRITERS[output_format](output_path)
+
+
+def convert_subtitles(input_path, output_path, input_format=None, output_format=None):
+    """Convert a subtitles file cue by cue between srt, ass and json
+
+    Args:
+        input_path (string): path to subtitles file
+        output_path (string): output path of the subtitles file
+        input_format (string, optional): format of the input. Defaults to None, sniffed.
+        output_format (string, optional): format of the output. Defaults to None, from the extension.
+
+    Returns:
+        int: number of cues written
+    """
+    with open_writer(output_path, output_format) as writer:
+        for cue in iter_cues(input_path, input_format):
+            writer.write(cue)
+    return writer.count
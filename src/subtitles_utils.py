@@ -1,11 +1,82 @@
-from datetime import timedelta
 import json
+import math
 import os
-import re
-import whisper
 
-from src.source_file_utils import get_video_source
+from src.cue_table import CueTable
+from src.audio_utils import DEFAULT_OVERLAP, DEFAULT_WINDOW, SAMPLE_RATE, audio_window, extract_audio_pcm, iter_audio_windows, load_pcm
+from src.executor_utils import run_segment_jobs, set_torch_threads
+from src.metrics import log
+from src.model_registry import transcribe_batch
+from src.transcription_backends import get_backend_class
+from src.transcription_cache import cache_key, cached_transcribe, load_cached, store
+from src.probe_utils import get_duration
+from src.source_file_utils import get_video_section, get_video_source, natural_sort_key
+from src.subtitle_io import (
+    ASS_HEADER,
+    KARAOKE_ASS_HEADER,
+    AssWriter,
+    SrtWriter,
+    ass_time_to_seconds,
+    convert_subtitles,
+    iter_ass,
+    iter_cues,
+    iter_karaoke_lines,
+    seconds_to_srt_time,
+    srt_time_to_seconds,
+)
+
+
+def _iter_segments_cues(segments):
+    for seg in segments:
+        words = seg.get("words", [])
+        if words:
+            for w in words:
+                yield {"start": w["start"], "end": w["end"], "text": w["word"]}
+        else:
+            yield {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+
+def iter_streaming_words(video_path, model_name="medium", use_cache=True, backend="whisper", window=DEFAULT_WINDOW, overlap=DEFAULT_OVERLAP, on_window=None):
+    """Transcribe a video window by window, the word cues are given as soon as their window is done
 
+    The windows overlap (see audio_utils.iter_audio_windows). A word is
+    kept by the window which has its middle before the middle of the
+    overlap, so the words cut at the edge of a window come from the next
+    one, where they are whole. Every window is cached on its own, a stopped
+    transcription starts again from the first window which is not cached.
+
+    Args:
+        video_path (string): path to the video
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same window. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        window (float, optional): duration of a window in seconds. Defaults to 120.
+        overlap (float, optional): seconds shared by two windows. Defaults to 10.
+        on_window (callable, optional): called with the end of the window once its words are given. Defaults to None.
+
+    Yields:
+        dict: word cue with 'start', 'end' in seconds of the video and 'text'
+    """
+    for start, samples, last in iter_audio_windows(video_path, window, overlap):
+        duration = len(samples) / SAMPLE_RATE
+        result = cached_transcribe(
+            samples,
+            video_path,
+            model_name,
+            start=round(start, 3),
+            duration=round(duration, 3),
+            use_cache=use_cache,
+            backend=backend,
+            word_timestamps=True
+        )
+        low = start + overlap / 2 if start > 0 else -math.inf
+        high = math.inf if last else start + duration - overlap / 2
+        for cue in _iter_segments_cues(result["segments"]):
+            middle = start + (cue["start"] + cue["end"]) / 2
+            if low <= middle < high:
+                yield {"start": start + cue["start"], "end": start + cue["end"], "text": cue["text"]}
+        log("info", f"→ Transcription of {video_path} : {seconds_to_srt_time(start + duration)}")
+        if on_window:
+            on_window(start + duration)
 
 def save_srt(segments, output_path="subtitles.srt"):
 
@@ -15,96 +86,33 @@ def save_srt(segments, output_path="subtitles.srt"):
         segments (string): segments where subtitles are find
         output_path (str, optional): output path of the subtitles file. Defaults to "subtitles.ass".
     """
+    with SrtWriter(output_path) as writer:
+        for cue in _iter_segments_cues(segments):
+            writer.write(cue)
 
-    def format_time(seconds):
-        td = timedelta(seconds=seconds)
-        total_seconds = int(td.total_seconds())
-        hh = total_seconds // 3600
-        mm = (total_seconds % 3600) // 60
-        ss = total_seconds % 60
-        ms = int((seconds - total_seconds) * 1000)
-        return f"{hh:02}:{mm:02}:{ss:02},{ms:03}"
-
-    idx = 1
-    with open(output_path, "w", encoding="utf-8") as f:
-        for seg in segments:
-            words = seg.get("words", [])
-            if words:
-                for w in words:
-                    f.write(f"{idx}\n")
-                    f.write(f"{format_time(w['start'])} --> {format_time(w['end'])}\n")
-                    f.write(f"{w['word'].strip()}\n\n")
-                    idx += 1
-            else:
-                f.write(f"{idx}\n")
-                f.write(f"{format_time(seg['start'])} --> {format_time(seg['end'])}\n")
-                f.write(f"{seg['text'].strip()}\n\n")
-                idx += 1
-
-def save_ass(segments, output_path="subtitles.ass"):
+def save_ass(segments, output_path="subtitles.ass", karaoke=False):
     """Save subtiltes stylized in .ass 
 
     Args:
         segments (string): segments where subtitles are find
         output_path (str, optional): output path of the subtitles file. Defaults to "subtitles.ass".
+        karaoke (bool, optional): one event by line with the words highlighted instead of one event by word. Defaults to False.
     """
-    def format_time_ass(seconds):
-        h = int(seconds // 3600)
-        m = int((seconds % 3600) // 60)
-        s = int(seconds % 60)
-        cs = int((seconds - int(seconds)) * 100)
-        return f"{h}:{m:02}:{s:02}.{cs:02}"
-
-    header = """[Script Info]
-ScriptType: v4.00+
-PlayResX: 1080
-PlayResY: 1920
-Timer: 100.0000
-
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BackColour, Bold, Italic, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: MyStyle,Arial,75,&H00FFFFFF,&H00000000,&H64000000,0,0,1,2,1,2,10,10,400,1
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-"""
-
-    lines = [header]
-    for seg in segments:
-        words = seg.get("words", [])
-        if words:
-            for w in words:
-                lines.append(f"Dialogue: 0,{format_time_ass(w['start'])},{format_time_ass(w['end'])},MyStyle,,0,0,0,,{w['word'].strip()}")
-        else:
-            lines.append(f"Dialogue: 0,{format_time_ass(seg['start'])},{format_time_ass(seg['end'])},MyStyle,,0,0,0,,{seg['text'].strip()}")
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
+    cues = _iter_segments_cues(segments)
+    if karaoke:
+        cues = iter_karaoke_lines(cues)
+    with AssWriter(output_path, header=KARAOKE_ASS_HEADER if karaoke else ASS_HEADER) as writer:
+        for cue in cues:
+            writer.write(cue)
 
 def srt_to_json(srt_file, json_file):
-    """Create json from srt file
+    """Create json from srt file, a .ass or .json file is also accepted
 
     Args:
         srt_file (string): srt file
         json_file (string): json file
     """
-    with open(srt_file, 'r', encoding='utf-8') as f:
-        data = f.read()
-
-    pattern = re.compile(r'(\d+)\s+([\d:,]+)\s-->\s([\d:,]+)\s+(.*?)\n(?=\d+\s|$)', re.DOTALL)
-    subtitles = []
-
-    for match in pattern.finditer(data):
-        idx, start, end, text = match.groups()
-        subtitles.append({
-            "index": int(idx),
-            "start": start.strip(),
-            "end": end.strip(),
-            "text": text.replace("\n", " ").strip()
-        })
-
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(subtitles, f, ensure_ascii=False, indent=2)
+    convert_subtitles(srt_file, json_file, output_format="json")
 
 def json_to_srt(json_file, srt_file):
     """Create srt from json file
@@ -113,134 +121,256 @@ def json_to_srt(json_file, srt_file):
         srt_file (string): srt file
         json_file (string): json file
     """
-    with open(json_file, 'r', encoding='utf-8') as f:
-        subtitles = json.load(f)
-
-    with open(srt_file, 'w', encoding='utf-8') as f:
-        for sub in subtitles:
-            f.write(f"{sub['index']}\n")
-            f.write(f"{sub['start']} --> {sub['end']}\n")
-            f.write(f"{sub['text']}\n\n")
+    convert_subtitles(json_file, srt_file, output_format="srt")
 
-def transcribe_video_to_srt(video_to_transcribe_path, output_srt_file_path, output_json_file_path):
+def transcribe_video_to_srt(video_to_transcribe_path, output_srt_file_path, output_json_file_path, model_name="medium", use_cache=True, backend="whisper", streaming=False):
     """Transcribe video with whisper model
 
     Args:
         video_to_transcribe_path (string): path to the video to transcribe
         output_srt_file_path (string): ouput path for the srt file
         output_json_file_path (string): ouput path for the json file
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        streaming (bool, optional): transcribe by windows with a flat memory, the srt is written
+            while the video is transcribed, for long videos. Defaults to False.
     """
     video_to_transcribe_path = get_video_source(video_to_transcribe_path) 
-    model = whisper.load_model("medium")
-    result = model.transcribe(video_to_transcribe_path,word_timestamps=True)
+    if streaming:
+        with SrtWriter(output_srt_file_path) as writer:
+            words = iter_streaming_words(video_to_transcribe_path, model_name, use_cache, backend, on_window=lambda end: writer.flush())
+            for cue in words:
+                writer.write(cue)
+        srt_to_json(output_srt_file_path, output_json_file_path)
+        return
+    result = cached_transcribe(
+        lambda: load_pcm(extract_audio_pcm(video_to_transcribe_path)),
+        video_to_transcribe_path,
+        model_name,
+        use_cache=use_cache,
+        backend=backend,
+        word_timestamps=True
+    )
     save_srt(result["segments"], output_path=output_srt_file_path)
     srt_to_json(output_srt_file_path, output_json_file_path)
-    del model
 
-def transcribe_video_to_ass(video_to_transcribe_path, output_ass_file_path, output_json_file_path):
+def transcribe_video_to_ass(video_to_transcribe_path, output_ass_file_path, output_json_file_path, model_name="medium", use_cache=True, backend="whisper", karaoke=False, streaming=False):
     """Transcribe video with whisper model
 
     Args:
         video_to_transcribe_path (string): path to the video to transcribe
         output_ass_file_path (string): ouput path for the ass file
         output_json_file_path (string): ouput path for the json file
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        karaoke (bool, optional): group the words in karaoke lines. Defaults to False.
+        streaming (bool, optional): transcribe by windows with a flat memory, the ass is written
+            while the video is transcribed, for long videos. Defaults to False.
     """
     video_to_transcribe_path = get_video_source(video_to_transcribe_path) 
-    model = whisper.load_model("medium")
-    result = model.transcribe(video_to_transcribe_path,word_timestamps=True)
-    save_ass(result["segments"], output_path=output_ass_file_path)
-    srt_to_json(output_ass_file_path, output_json_file_path)
-    del model
-
-def transcribe_all_segments_to_ass(directory_videos,directory_output_sub, file_video_name_output):
-    """Transcribe segments by segments
+    if streaming:
+        with AssWriter(output_ass_file_path, header=KARAOKE_ASS_HEADER if karaoke else ASS_HEADER) as writer:
+            cues = iter_streaming_words(video_to_transcribe_path, model_name, use_cache, backend, on_window=lambda end: writer.flush())
+            if karaoke:
+                cues = iter_karaoke_lines(cues)
+            for cue in cues:
+                writer.write(cue)
+        convert_subtitles(output_ass_file_path, output_json_file_path, output_format="json")
+        return
+    result = cached_transcribe(
+        lambda: load_pcm(extract_audio_pcm(video_to_transcribe_path)),
+        video_to_transcribe_path,
+        model_name,
+        use_cache=use_cache,
+        backend=backend,
+        word_timestamps=True
+    )
+    save_ass(result["segments"], output_path=output_ass_file_path, karaoke=karaoke)
+    convert_subtitles(output_ass_file_path, output_json_file_path, output_format="json")
+
+def _save_segment_transcription(result, output_ass_file_path, output_json_file_path, karaoke=False):
+    save_ass(result["segments"], output_path=output_ass_file_path, karaoke=karaoke)
+    with open(output_json_file_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+def _transcribe_segment_job(segment_path, output_ass_file_path, output_json_file_path, model_name="medium", use_cache=True, backend="whisper", karaoke=False, threads=None):
+    """Transcribe one segment, the model is loaded once by process
 
     Args:
-        directory_videos (string): directory where are the videos
-        directory_output_sub (string): where place subtitles
-        file_video_name_output (string): name of the video output
+        segment_path (string): path to the segment
+        output_ass_file_path (string): ouput path for the ass file
+        output_json_file_path (string): ouput path for the json file
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        karaoke (bool, optional): group the words in karaoke lines. Defaults to False.
+        threads (int, optional): threads used by torch. Defaults to None.
     """
-    all_segments = sorted([
-        f for f in os.listdir(directory_videos)
-        if f.startswith(file_video_name_output) and f.endswith('.mp4')
-    ])
-
+    if threads:
+        set_torch_threads(threads)
+    transcribe_segment_to_ass(segment_path, output_ass_file_path, output_json_file_path, model_name, use_cache, backend, karaoke)
 
-    model = whisper.load_model("medium")
+def transcribe_segment_to_ass(segment_path, output_ass_file_path, output_json_file_path, model_name="medium", use_cache=True, backend="whisper", karaoke=False, use_worker=False):
+    """Transcribe one segment as soon as it is cut, used by the streaming pipeline
 
-    for i, seg_file in enumerate(all_segments):
-        segment_path = os.path.join(directory_videos, seg_file)
-        output_ass_file_path = os.path.join(directory_output_sub, f"{os.path.splitext(seg_file)[0]}.ass")
-        output_json_file_path = os.path.join(directory_output_sub, f"{os.path.splitext(seg_file)[0]}.json")
+    Args:
+        segment_path (string): path to the segment
+        output_ass_file_path (string): ouput path for the ass file
+        output_json_file_path (string): ouput path for the json file
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        karaoke (bool, optional): group the words in karaoke lines. Defaults to False.
+        use_worker (bool, optional): transcribe in the warm transcription worker. Defaults to False.
+    """
+    log("info", f"→ Transcription of {segment_path}")
+    result = cached_transcribe(segment_path, segment_path, model_name, use_cache=use_cache, backend=backend, use_worker=use_worker, word_timestamps=True)
+    _save_segment_transcription(result, output_ass_file_path, output_json_file_path, karaoke)
 
-        print(f"[INFO] → Transcription of segements {i+1}/{len(all_segments)} : {seg_file}")
-        result = model.transcribe(segment_path, word_timestamps=True)
+def _transcribe_segments_batched(jobs, model_name="medium", use_cache=True, backend="faster-whisper", batch_size=8):
+    """Transcribe segments by groups, the audio of a group shares the forward passes
 
-        save_ass(result["segments"], output_path=output_ass_file_path)
-        with open(output_json_file_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-    del model
+    Args:
+        jobs (list): (name, kwargs of _transcribe_segment_job) for every segment
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): a backend with transcribe_batch. Defaults to "faster-whisper".
+        batch_size (int, optional): number of segments in a group. Defaults to 8.
+    """
+    pending = []
+    for name, job in jobs:
+        key = cache_key(job["segment_path"], model_name, options={"word_timestamps": True}, backend=backend)
+        result = load_cached(key) if use_cache else None
+        if result is None:
+            pending.append((key, job))
+        else:
+            log("info", f"Transcription of {name} found in cache")
+            _save_segment_transcription(result, job["output_ass_file_path"], job["output_json_file_path"], job["karaoke"])
+
+    for i in range(0, len(pending), batch_size):
+        group = pending[i:i + batch_size]
+        log("info", f"→ Transcription of segments {i + 1}-{i + len(group)}/{len(pending)}")
+        audios = [load_pcm(extract_audio_pcm(job["segment_path"])) for _, job in group]
+        results = transcribe_batch(audios, model_name, backend=backend, word_timestamps=True)
+        for (key, job), result in zip(group, results):
+            if use_cache:
+                store(key, result)
+            _save_segment_transcription(result, job["output_ass_file_path"], job["output_json_file_path"], job["karaoke"])
+
+def transcribe_all_segments_to_ass(directory_videos,directory_output_sub, file_video_name_output, model_name="medium", use_cache=True, backend="whisper", karaoke=False, total_threads=None, max_workers=1):
+    """Transcribe segments by segments
 
-def srt_time_to_seconds(t):
-    """Transform srt time to seconds
+    Every worker loads its own model (about 1.5 GB for "medium"), so the
+    segments are transcribed one by one unless max_workers is raised. With
+    a backend which batches ("faster-whisper") the segments are grouped in
+    the same forward passes instead.
 
     Args:
-        t (string): time in srt file
+        directory_videos (string): directory where are the videos
+        directory_output_sub (string): where place subtitles
+        file_video_name_output (string): name of the video output
+        model_name (string, optional): size of the whisper model, "tiny" or "base" for previews. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same audio. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        karaoke (bool, optional): group the words in karaoke lines. Defaults to False.
+        total_threads (int, optional): threads shared by the workers. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments transcribed at the same time. Defaults to 1.
     """
-    hh, mm, ss_ms = t.split(':')
-    ss, ms = ss_ms.split(',')
-    return int(hh) * 3600 + int(mm) * 60 + int(ss) + int(ms) / 1000.0
-
-def ass_time_to_seconds(t):
-    """Transform ass time to seconds
+    all_segments = sorted([
+        f for f in os.listdir(directory_videos)
+        if f.startswith(file_video_name_output) and f.endswith('.mp4')
+    ], key=natural_sort_key)
+
+    jobs = [
+        (seg_file, {
+            "segment_path": os.path.join(directory_videos, seg_file),
+            "output_ass_file_path": os.path.join(directory_output_sub, f"{os.path.splitext(seg_file)[0]}.ass"),
+            "output_json_file_path": os.path.join(directory_output_sub, f"{os.path.splitext(seg_file)[0]}.json"),
+            "model_name": model_name,
+            "use_cache": use_cache,
+            "backend": backend,
+            "karaoke": karaoke,
+        })
+        for seg_file in all_segments
+    ]
+
+    if get_backend_class(backend).batched:
+        _transcribe_segments_batched(jobs, model_name, use_cache, backend)
+        return
+    run_segment_jobs(_transcribe_segment_job, jobs, total_threads, max_workers)
+
+def transcribe_source_to_segments_ass(
+    file_video,
+    number_of_segment,
+    start_cuting_time_code,
+    time_of_segment,
+    directory_output_sub,
+    file_video_name_output,
+    model_name="medium",
+    use_cache=True,
+    backend="whisper",
+    karaoke=False,
+    use_worker=False
+):
+    """Transcribe the source once and write the subtitles of every segment
+
+    Only the window which will be cut is transcribed. It does not need the
+    segments, so it can run at the same time as cut_segment_of_video.
 
     Args:
-        t (string): time in ass file
+        file_video (string): the path or the url to get the video
+        number_of_segment (int): number of segments
+        start_cuting_time_code (float): where the first segment starts, in seconds
+        time_of_segment (float): duration of a segment, in seconds
+        directory_output_sub (string): where place subtitles
+        file_video_name_output (string): name of the segments
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        use_cache (bool, optional): reuse the transcription of the same window. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        karaoke (bool, optional): group the words in karaoke lines. Defaults to False.
+        use_worker (bool, optional): transcribe in the warm transcription worker. Defaults to False.
     """
-    h, m, s_cs = t.split(":")
-    s, cs = s_cs.split(".")
-    return int(h)*3600 + int(m)*60 + int(s) + int(cs)/100.0
-
-def seconds_to_srt_time(seconds):
-    if seconds < 0:
-        seconds = 0
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    hh = total_seconds // 3600
-    mm = (total_seconds % 3600) // 60
-    ss = total_seconds % 60
-    ms = int((seconds - total_seconds) * 1000)
-    return f"{hh:02d}:{mm:02d}:{ss:02d},{ms:03d}"
+    file_video, start_cuting_time_code = get_video_section(
+        file_video,
+        start_cuting_time_code,
+        start_cuting_time_code + number_of_segment * time_of_segment
+    )
+    os.makedirs(directory_output_sub, exist_ok=True)
+
+    source_duration = get_duration(file_video)
+    duration = number_of_segment * time_of_segment
+    number_of_segment = min(number_of_segment, math.ceil((source_duration - start_cuting_time_code) / time_of_segment))
+
+    log("info", f"→ Transcription of {file_video} for {number_of_segment} segments")
+    result = cached_transcribe(
+        lambda: audio_window(load_pcm(extract_audio_pcm(file_video)), start_cuting_time_code, start_cuting_time_code + duration),
+        file_video,
+        model_name,
+        start=start_cuting_time_code,
+        duration=duration,
+        use_cache=use_cache,
+        backend=backend,
+        use_worker=use_worker,
+        word_timestamps=True
+    )
+
+    words = CueTable.from_whisper_words(result["segments"])
+    for i in range(number_of_segment):
+        name = f"{file_video_name_output}_{i}"
+        offset = i * time_of_segment
+        segment_words = words.starting_in(offset, offset + time_of_segment).offset(-offset).clamp(0, time_of_segment)
+        segment_words.save_ass(os.path.join(directory_output_sub, f"{name}.ass"), karaoke=karaoke)
+        segment_words.save_json(os.path.join(directory_output_sub, f"{name}.json"))
 
 def load_subtitles_master(path):
-    """Load the subtitles file
+    """Load the subtitles file, the format (.srt, .ass or .json) is found from the content
 
     Args:
         path (string): path to subtitles file
     """
-    if path.lower().endswith('.json'):
-        with open(path, 'r', encoding='utf-8') as f:
-            subs = json.load(f)
-        normalized = []
-        for s in subs:
-            start = s['start']
-            end = s['end']
-            if isinstance(start, str):
-                s_start = srt_time_to_seconds(start)
-                s_end = srt_time_to_seconds(end)
-            else:
-                s_start = float(start)
-                s_end = float(end)
-            normalized.append({'start': s_start, 'end': s_end, 'text': s['text']})
-        return normalized
-    with open(path, 'r', encoding='utf-8') as f:
-        data = f.read()
-    pattern = re.compile(r'(\d+)\s+([\d:,]+)\s-->\s([\d:,]+)\s+(.*?)\n(?=\d+\s|$)', re.DOTALL)
-    subs = []
-    for m in pattern.finditer(data):
-        _, start, end, text = m.groups()
-        subs.append({'start': srt_time_to_seconds(start), 'end': srt_time_to_seconds(end), 'text': text.replace("\n", " ").strip()})
-    return subs
+    return list(iter_cues(path))
 
 def load_subtitles_master_ass(path):
     """Load the subtitles file
@@ -248,29 +378,4 @@ def load_subtitles_master_ass(path):
     Args:
         path (string): path to subtitles file
     """
-    with open(path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    
-    events_section = False
-    subs = []
-    for line in lines:
-        line = line.strip()
-        if line.startswith("[Events]"):
-            events_section = True
-            continue
-        if not events_section:
-            continue
-        if line.startswith("Format:"):
-            fields = [x.strip().lower() for x in line[len("Format:"):].split(",")]
-            start_idx = fields.index("start")
-            end_idx = fields.index("end")
-            text_idx = fields.index("text")
-            continue
-        if line.startswith("Dialogue:"):
-            parts = line[len("Dialogue:"):].split(",", len(fields)-1)
-            start = ass_time_to_seconds(parts[start_idx].strip())
-            end = ass_time_to_seconds(parts[end_idx].strip())
-            text = parts[text_idx].strip()
-            text = re.sub(r"{.*?}", "", text)
-            subs.append({"start": start, "end": end, "text": text})
-    return subs
\ No newline at end of file
+    return list(iter_ass(path))
@@ -0,0 +1,184 @@
+import bisect
+import numpy as np
+
+from src.audio_utils import SAMPLE_RATE
+
+CHUNK_SECONDS = 30
+
+
+def merge_speech(speech, max_samples):
+    """Group the speech timestamps of an audio in chunks of at most max_samples
+
+    A chunk goes from the start of its first speech to the end of its last
+    one, so it ends in a silence.
+
+    Args:
+        speech (list): {"start", "end"} in samples, sorted, each at most max_samples long
+        max_samples (int): length of a chunk
+
+    Returns:
+        list: {"start", "end"} of every chunk, in samples
+    """
+    chunks = []
+    for part in speech:
+        if chunks and part["end"] - chunks[-1]["start"] <= max_samples:
+            chunks[-1]["end"] = part["end"]
+        else:
+            chunks.append({"start": part["start"], "end": part["end"]})
+    return chunks
+
+
+class WhisperBackend:
+    """openai-whisper, the default backend"""
+
+    name = "whisper"
+    batched = False
+
+    def __init__(self, model_name="medium", device=None, compute_type=None):
+        import whisper
+        self.model = whisper.load_model(model_name, device=device)
+        self.compute_type = compute_type
+
+    def transcribe(self, audio, **options):
+        """Transcribe a path or 16 kHz mono float32 audio
+
+        Returns:
+            dict: whisper result, with "text", "segments" and "language"
+        """
+        if self.compute_type is not None:
+            options.setdefault("fp16", self.compute_type == "float16")
+        return self.model.transcribe(audio, **options)
+
+    def transcribe_batch(self, audios, **options):
+        """Transcribe several audios, one after the other"""
+        return [self.transcribe(audio, **options) for audio in audios]
+
+
+class FasterWhisperBackend:
+    """CTranslate2 (faster-whisper) int8 inference on CPU
+
+    The speech of every audio is found with the Silero VAD of faster-whisper
+    and grouped in chunks of at most 30 seconds which end in a silence,
+    transcribe_batch puts the chunks of several audios in the same forward
+    pass. A long audio is never cut in the middle of a word. Needs
+    faster-whisper 1.2 or later, which reads the clip timestamps in seconds.
+    """
+
+    name = "faster-whisper"
+    batched = True
+    # options of whisper which the batched pipeline of faster-whisper uses too,
+    # it accepts and ignores the others (condition_on_previous_text, thresholds...)
+    OPTIONS = {
+        "language", "task", "beam_size", "best_of", "patience", "length_penalty", "temperature",
+        "initial_prompt", "suppress_blank", "without_timestamps", "word_timestamps",
+        "prepend_punctuations", "append_punctuations",
+    }
+
+    def __init__(self, model_name="medium", device=None, compute_type=None, batch_size=8):
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+        from faster_whisper.vad import VadOptions
+        self.model = WhisperModel(model_name, device=device or "cpu", compute_type=compute_type or "int8")
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        self.batch_size = batch_size
+        # the same settings as the pipeline when it runs the VAD itself
+        self.vad_options = VadOptions(max_speech_duration_s=CHUNK_SECONDS, min_silence_duration_ms=160)
+
+    def transcribe(self, audio, **options):
+        """Transcribe a path or 16 kHz mono float32 audio
+
+        Returns:
+            dict: result in the whisper format
+        """
+        if isinstance(audio, str):
+            from faster_whisper import decode_audio
+            audio = decode_audio(audio, sampling_rate=SAMPLE_RATE)
+        return self.transcribe_batch([audio], **options)[0]
+
+    def _check_options(self, options):
+        unsupported = sorted(set(options) - self.OPTIONS)
+        if unsupported:
+            raise ValueError(f"Options not supported by faster-whisper : {', '.join(unsupported)}")
+
+    def _speech_chunks(self, audio):
+        """Chunks of at most CHUNK_SECONDS around the speech of an audio, in samples"""
+        from faster_whisper.vad import get_speech_timestamps
+        return merge_speech(get_speech_timestamps(audio, self.vad_options), CHUNK_SECONDS * SAMPLE_RATE)
+
+    def transcribe_batch(self, audios, **options):
+        """Transcribe several 16 kHz mono float32 audios in shared batches
+
+        Args:
+            audios (list): np.ndarray of every audio
+            options: options of whisper, ex word_timestamps or language, see OPTIONS
+
+        Raises:
+            ValueError: an option is not supported by faster-whisper
+
+        Returns:
+            list: result in the whisper format for every audio
+        """
+        self._check_options(options)
+        language = options.get("language")
+        offsets = []
+        clip_timestamps = []
+        position = 0
+        for audio in audios:
+            offsets.append(position)
+            for chunk in self._speech_chunks(audio):
+                # faster-whisper reads the clips in seconds
+                clip_timestamps.append({
+                    "start": (position + chunk["start"]) / SAMPLE_RATE,
+                    "end": (position + chunk["end"]) / SAMPLE_RATE,
+                })
+            position += len(audio)
+
+        results = [{"text": "", "segments": [], "language": language} for _ in audios]
+        if not clip_timestamps:
+            # no speech
+            return results
+
+        segments, info = self.pipeline.transcribe(
+            np.concatenate(audios).astype(np.float32, copy=False),
+            clip_timestamps=clip_timestamps,
+            batch_size=self.batch_size,
+            **options
+        )
+
+        offsets_seconds = [offset / SAMPLE_RATE for offset in offsets]
+        for seg in segments:
+            index = bisect.bisect_right(offsets_seconds, seg.start) - 1
+            shift = offsets_seconds[index]
+            result = results[index]
+            result["language"] = info.language
+            result["text"] += seg.text
+            result["segments"].append({
+                "id": len(result["segments"]),
+                "start": seg.start - shift,
+                "end": seg.end - shift,
+                "text": seg.text,
+                "words": [
+                    {"word": w.word, "start": w.start - shift, "end": w.end - shift, "probability": w.probability}
+                    for w in (seg.words or [])
+                ],
+            })
+        return results
+
+
+BACKENDS = {
+    WhisperBackend.name: WhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+}
+
+
+def get_backend_class(backend="whisper"):
+    """Class of a transcription backend
+
+    Args:
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+
+    Raises:
+        ValueError: unknown backend
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend. Choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend]
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from src.audio_utils import DEFAULT_AUDIO_DIR, evict_audio
+from src.model_registry import transcribe
+from src.metrics import log
+
+DEFAULT_CACHE_DIR = "./cache/transcriptions/"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_file_hashes = {}
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha256 of a file, computed once by (path, size, mtime) in this process
+
+    Args:
+        path (string): path to the file
+        chunk_size (int, optional): size of the reads. Defaults to 1 MB.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        _file_hashes[key] = sha.hexdigest()
+    return _file_hashes[key]
+
+
+def cache_key(source_path, model_name, start=0, duration=None, options=None, backend="whisper"):
+    """Key of a transcription in the cache
+
+    Args:
+        source_path (string): path to the media which is transcribed
+        model_name (string): size of the whisper model
+        start (float, optional): start of the transcribed window in seconds. Defaults to 0.
+        duration (float, optional): duration of the window. Defaults to None, until the end.
+        options (dict, optional): whisper options. Defaults to None.
+        backend (string, optional): transcription backend. Defaults to "whisper".
+    """
+    description = {
+        "source": file_hash(source_path),
+        "start": start,
+        "duration": duration,
+        "model": model_name,
+        "backend": backend,
+        "options": options or {},
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_cached(key, cache_dir=DEFAULT_CACHE_DIR):
+    """Get a transcription from the cache
+
+    Args:
+        key (string): key from cache_key
+        cache_dir (string, optional): directory of the cache. Defaults to DEFAULT_CACHE_DIR.
+
+    Returns:
+        dict: whisper result, None if it is not in the cache
+    """
+    path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    os.utime(path)
+    return result
+
+
+def store(key, result, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """Save a transcription in the cache then evict the oldest ones over max_bytes
+
+    Args:
+        key (string): key from cache_key
+        result (dict): whisper result
+        cache_dir (string, optional): directory of the cache. Defaults to DEFAULT_CACHE_DIR.
+        max_bytes (int, optional): size of the cache. Defaults to 512 MB.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=cache_dir, suffix=".tmp", delete=False, encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(f.name, os.path.join(cache_dir, f"{key}.json"))
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """Delete the least recently used transcriptions until the cache fits in max_bytes
+
+    Args:
+        cache_dir (string, optional): directory of the cache. Defaults to DEFAULT_CACHE_DIR.
+        max_bytes (int, optional): size of the cache. Defaults to 512 MB.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(".json"):
+            stat = os.stat(os.path.join(cache_dir, filename))
+            entries.append((stat.st_mtime, stat.st_size, filename))
+    total = sum(size for _, size, _ in entries)
+    for _, size, filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(cache_dir, filename))
+        total -= size
+
+
+def purge(cache_dir=DEFAULT_CACHE_DIR, audio_dir=DEFAULT_AUDIO_DIR):
+    """Delete every transcription of the cache and the audio extracted for them
+
+    Args:
+        cache_dir (string, optional): directory of the cache. Defaults to DEFAULT_CACHE_DIR.
+        audio_dir (string, optional): directory of the PCM files, see audio_utils. Defaults to DEFAULT_AUDIO_DIR.
+    """
+    evict(cache_dir, 0)
+    evict_audio(audio_dir, 0)
+    log("ok", f"Transcription cache purged : {cache_dir}, {audio_dir}")
+
+
+def cached_transcribe(
+    audio,
+    source_path,
+    model_name="medium",
+    start=0,
+    duration=None,
+    use_cache=True,
+    backend="whisper",
+    cache_dir=DEFAULT_CACHE_DIR,
+    max_bytes=DEFAULT_MAX_BYTES,
+    use_worker=False,
+    **options
+):
+    """Transcribe with the registry, or get the result from the cache without loading a model
+
+    Args:
+        audio (string, np.ndarray or callable): what is given to the model, path or 16 kHz audio,
+            a callable is only called when the transcription is not in the cache
+        source_path (string): file the audio comes from, its hash is in the key
+        model_name (string, optional): size of the whisper model. Defaults to "medium".
+        start (float, optional): start of the audio in the source, in seconds. Defaults to 0.
+        duration (float, optional): duration of the audio. Defaults to None, until the end.
+        use_cache (bool, optional): read and write the cache. Defaults to True.
+        backend (string, optional): "whisper" or "faster-whisper". Defaults to "whisper".
+        cache_dir (string, optional): directory of the cache. Defaults to DEFAULT_CACHE_DIR.
+        max_bytes (int, optional): size of the cache. Defaults to 512 MB.
+        use_worker (bool, optional): transcribe in the warm transcription worker, see model_registry.
+            It is not in the cache key. Defaults to False.
+        **options: options of model.transcribe, ex word_timestamps=True
+
+    Returns:
+        dict: whisper result
+    """
+    if not use_cache:
+        return transcribe(audio() if callable(audio) else audio, model_name, backend=backend, use_worker=use_worker, **options)
+
+    key = cache_key(source_path, model_name, start, duration, options, backend)
+    result = load_cached(key, cache_dir)
+    if result is not None:
+        log("info", f"Transcription of {source_path} found in cache")
+        return result
+
+    result = transcribe(audio() if callable(audio) else audio, model_name, backend=backend, use_worker=use_worker, **options)
+    store(key, result, cache_dir, max_bytes)
+    return result
@@ -2,45 +2,449 @@ import os
 import shutil
 import tempfile
 import ffmpeg
-import textwrap
-from moviepy import VideoFileClip
-from src.source_file_utils import get_video_source
+from src.encoder_profiles import DEFAULT_PROFILE, audio_args, get_profile, intermediate_video_args, scale_of, video_args
+from src.banner_utils import BOX_BORDER, DEFAULT_FONT_PATH, PART_Y, TITLE_Y_RATIO, part_banner, title_banner
+from src.executor_utils import run_segment_jobs
+from src.ffmpeg_scheduler import run_ffmpeg
+from src.metrics import ffmpeg_error_message, log
+from src.probe_utils import get_duration, get_keyframes, get_resolution, snap_to_keyframe
+from src.source_file_utils import get_video_section, natural_sort_key
 from src.subtitles_utils import load_subtitles_master, load_subtitles_master_ass, save_ass, seconds_to_srt_time
 
-def cut_segment_of_video(file_video, number_of_segment, start_cuting_time_code, time_of_segment, directory_videos, file_video_name_output):
+def cut_segment_of_video(file_video, number_of_segment, start_cuting_time_code, time_of_segment, directory_videos, file_video_name_output, mode="exact", threads=None, profile=DEFAULT_PROFILE):
     """
-        Cut the video in multiple segments of the video
+        Cut the video in multiple segments of the video with a single ffmpeg process
+
+        In "exact" mode the source is decoded once and keyframes are forced at every
+        boundary so each segment starts on the requested frame. In "fast" mode the
+        streams are copied without re-encoding and segments start on the first
+        keyframe after each boundary.
 
         Args:
             file_video (string): the path or the url to get the video .
-            download_dir (string): The directory where video will be place.
+            number_of_segment (int): number of segments to cut
+            start_cuting_time_code (float): where the first segment starts, in seconds
+            time_of_segment (float): duration of a segment, in seconds
+            directory_videos (string): The directory where segments will be place.
+            file_video_name_output (string): name of the segments, {file_video_name_output}_{i}.mp4
+            mode (string, optional): "exact" or "fast". Defaults to "exact".
+            threads (int, optional): threads used by ffmpeg. Defaults to None.
+            profile (string, optional): encoding profile of the audio, the video of the "exact" mode is
+                an intermediate encode, see encoder_profiles. Defaults to "final".
+
+        Raises:
+            ValueError: wrong mode
+    """
+    if mode == "exact":
+        output_args = {
+            **intermediate_video_args(threads),
+            **audio_args(profile),
+            "force_key_frames": f"expr:gte(t,n_forced*{time_of_segment})",
+        }
+    elif mode == "fast":
+        output_args = {"c": "copy"}
+        if threads:
+            output_args["threads"] = threads
+    else:
+        raise ValueError("Unknown mode. Choose 'exact' or 'fast'")
+
+    # only the window which is cut is downloaded, the start is rebased in it
+    file_video, start_cuting_time_code = get_video_section(
+        file_video,
+        start_cuting_time_code,
+        start_cuting_time_code + number_of_segment * time_of_segment
+    )
+    os.makedirs(directory_videos, exist_ok=True)
+
+    duration = get_duration(file_video)
+    if start_cuting_time_code >= duration:
+        log("warning", f"Start {start_cuting_time_code}s is after the end of the video ({duration}s)")
+        return
+    total_duration = min(number_of_segment * time_of_segment, duration - start_cuting_time_code)
+    if mode == "fast":
+        # stream copy can only start on a keyframe, start on the one before so nothing is lost
+        start_cuting_time_code = snap_to_keyframe(get_keyframes(file_video), start_cuting_time_code)
+
+    run_ffmpeg(
+        ffmpeg
+        .input(file_video, ss=start_cuting_time_code, t=total_duration)
+        .output(
+            os.path.join(directory_videos, f"{file_video_name_output}_%d.mp4"),
+            f="segment",
+            segment_time=time_of_segment,
+            reset_timestamps=1,
+            **output_args
+        ),
+        name="cut"
+    )
+
+def cut_single_segment(file_video, start, duration, output_path, mode="exact", threads=None, profile=DEFAULT_PROFILE):
+    """
+        Cut one segment of the video, used to cut again only the missing segments
+
+        Args:
+            file_video (string): path to the video
+            start (float): start of the segment in seconds
+            duration (float): duration of the segment in seconds
+            output_path (string): path of the segment
+            mode (string, optional): "exact" re-encodes, "fast" copies from the previous keyframe. Defaults to "exact".
+            threads (int, optional): threads used by ffmpeg. Defaults to None.
+            profile (string, optional): encoding profile of the audio of the "exact" mode. Defaults to "final".
+
+        Raises:
+            ValueError: wrong mode
 
         Returns:
-            string: Path to the video download
+            string: path of the segment
     """
-    file_video = get_video_source(file_video)  
-    os.makedirs(directory_videos, exist_ok=True)
-    clip = VideoFileClip(file_video)
-    start = start_cuting_time_code
-
-    for i in range(number_of_segment):
-        end = start + time_of_segment
-        if end > clip.duration:
-            end = clip.duration
-        segment = clip.subclipped(start, end)
-        segment.write_videofile(f"{directory_videos}/{file_video_name_output}_{i}.mp4", codec="libx264")
-        start = end
-        if start >= clip.duration:
-            break
-    clip.reader.close()
-    clip.audio = None
+    if mode == "exact":
+        output_args = {**intermediate_video_args(threads), **audio_args(profile)}
+    elif mode == "fast":
+        output_args = {"c": "copy", "avoid_negative_ts": "make_zero"}
+        if threads:
+            output_args["threads"] = threads
+        start = snap_to_keyframe(get_keyframes(file_video), start)
+    else:
+        raise ValueError("Unknown mode. Choose 'exact' or 'fast'")
+
+    run_ffmpeg(
+        ffmpeg
+        .input(file_video, ss=start, t=duration)
+        .output(output_path, **output_args),
+        name="cut",
+        segment=os.path.basename(output_path)
+    )
+    return output_path
+
+def tiktok_format_filter(mode="letterbox", size=None, width=1080, height=1920):
+    """Filter used to go from 16:9 format to 9:16
+
+    Args:
+        mode (string, optional): letterbox format or crop. Defaults to "letterbox".
+        size (tuple, optional): (width, height) of the video, from probe_utils. Defaults to None, unknown.
+        width (int, optional): width of the output. Defaults to 1080.
+        height (int, optional): height of the output. Defaults to 1920.
+
+    Raises:
+        ValueError: wrong mode
+
+    Returns:
+        string: ffmpeg filter, None if the video already has the output size
+    """
+    if mode not in ("letterbox", "crop"):
+        raise ValueError("Unknown mode. Choose 'letterbox' or 'crop'")
+    if size is not None and tuple(size) == (width, height):
+        return None
+    if mode == "letterbox":
+        return f"scale={width}:-2:flags=lanczos,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}"
+
+def _filter_path(path):
+    return path.replace(os.sep, "/")
+
+def build_render_filter(spec):
+    """Build the filter graph of one segment from its render spec
+
+    The banners are png rendered once (see banner_utils) and blended with
+    overlay, so there is no text to draw on every frame.
+
+    The spec is a dict, every key is optional :
+        mode (string): "letterbox" or "crop" to go to 9:16
+        ass_path (string): subtitles to burn in
+        part (string): text of the part banner
+        title (string): text of the title banner
+        font_path (string): font of the banners
+        max_chars_per_line (int): Number of characters per line of the title
+        size (tuple): (width, height) of the segment, see probe_utils
+        profile (string): encoding profile, gives the output size, see encoder_profiles
+
+    The subtitles keep their 1080x1920 PlayRes, libass scales them to the
+    size of the video, only the banners are rendered at the profile scale.
+
+    Args:
+        spec (dict): render spec of the segment
+
+    Returns:
+        string: ffmpeg filter, None if there is nothing to do
+    """
+    settings = get_profile(spec.get("profile", DEFAULT_PROFILE))
+    scale = scale_of(settings)
+    border = round(BOX_BORDER * scale)
+    filters = []
+    if spec.get("mode"):
+        format_filter = tiktok_format_filter(spec["mode"], spec.get("size"), settings["width"], settings["height"])
+        if format_filter:
+            filters.append(format_filter)
+    if spec.get("ass_path"):
+        filters.append(f"ass='{_filter_path(spec['ass_path'])}'")
+
+    overlays = []
+    if spec.get("part"):
+        banner = part_banner(spec["part"], spec.get("font_path"), scale)
+        part_y = round(PART_Y * scale) - border
+        # a video left in 16:9 is not 1920 high, keep the banner above its bottom
+        y = f"{part_y}" if spec.get("mode") or not spec.get("size") else f"min({part_y}\\,H-h-{border})"
+        overlays.append((banner, y))
+    if spec.get("title"):
+        banner = title_banner(spec["title"], spec.get("font_path"), spec.get("max_chars_per_line", 25), scale)
+        overlays.append((banner, f"H*{TITLE_Y_RATIO}-{border}"))
+
+    if not overlays:
+        return ",".join(filters) if filters else None
+
+    graph = [f"[in]{','.join(filters) if filters else 'null'}[v0]"]
+    for i, (banner, y) in enumerate(overlays):
+        output = "[out]" if i == len(overlays) - 1 else f"[v{i + 1}]"
+        graph.append(f"movie='{_filter_path(banner)}'[b{i}]")
+        graph.append(f"[v{i}][b{i}]overlay=x=(W-w)/2:y={y}{output}")
+    return ";".join(graph)
+
+def render_segment(segment_path, spec, output_path=None, threads=None):
+    """Render a segment with a single encode : 9:16, subtitles, part and title banners
+
+    Args:
+        segment_path (string): path to the segment
+        spec (dict): render spec of the segment, see build_render_filter
+        output_path (string, optional): path of the rendered video. Defaults to None, the segment is replaced.
+        threads (int, optional): threads used by ffmpeg. Defaults to None, ffmpeg decides.
+
+    Raises:
+        ffmpeg.Error: ffmpeg failed, the segment is left untouched
+
+    Returns:
+        string: path of the rendered video
+    """
+    destination = output_path if output_path else segment_path
+    if "size" not in spec and (spec.get("mode") or spec.get("part")):
+        spec = dict(spec, size=get_resolution(segment_path))
+    vf = build_render_filter(spec)
+    if vf is None:
+        if destination != segment_path:
+            shutil.copy(segment_path, destination)
+        return destination
+
+    directory = os.path.dirname(segment_path)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".mp4", delete=False) as tmpfile:
+        temp_output = tmpfile.name
+
+    try:
+        run_ffmpeg(
+            ffmpeg
+            .input(segment_path)
+            .output(
+                temp_output,
+                vf=vf,
+                acodec="copy",
+                **video_args(spec.get("profile", DEFAULT_PROFILE), threads)
+            ),
+            name="render",
+            segment=os.path.basename(segment_path)
+        )
+    except ffmpeg.Error:
+        if os.path.exists(temp_output):
+            os.remove(temp_output)
+        raise
+
+    shutil.move(temp_output, destination)
+    return destination
+
+def _command_args(args):
+    """ffmpeg-python output kwargs as command line arguments, ex {"vcodec": "libx264"} -> ["-c:v", "libx264"]"""
+    names = {"vcodec": "-c:v", "acodec": "-c:a", "audio_bitrate": "-b:a"}
+    command = []
+    for key, value in args.items():
+        command += [names.get(key, f"-{key}"), str(value)]
+    return command
+
+def build_ladder_filter(spec, profiles):
+    """Build the filter_complex of a ladder : the segment is rendered once then split in every rung
+
+    The render is composed at the size of the widest profile, so the
+    subtitles and the banners are scaled with the frame in the smaller rungs.
+
+    Args:
+        spec (dict): render spec of the segment, see build_render_filter
+        profiles (list): encoding profiles of the rungs, see encoder_profiles
+
+    Returns:
+        tuple: (filter_complex, list of the output labels in the order of profiles)
+    """
+    top = max(profiles, key=lambda profile: get_profile(profile)["width"])
+    top_width = get_profile(top)["width"]
+    graph = build_render_filter(dict(spec, profile=top))
+    if graph is None:
+        graph = "[0:v]null[base]"
+    elif graph.startswith("[in]"):
+        graph = f"[0:v]{graph[len('[in]'):-len('[out]')]}[base]"
+    else:
+        graph = f"[0:v]{graph}[base]"
+
+    if len(profiles) == 1:
+        return graph, ["[base]"]
+
+    graph += f";[base]split={len(profiles)}" + "".join(f"[s{i}]" for i in range(len(profiles)))
+    labels = []
+    for i, profile in enumerate(profiles):
+        settings = get_profile(profile)
+        if settings["width"] == top_width:
+            labels.append(f"[s{i}]")
+            continue
+        if spec.get("mode"):
+            size = f"{settings['width']}:{settings['height']}"
+        else:
+            # the video is left at its size, keep its ratio
+            size = f"trunc(iw*{settings['width']}/{top_width}/2)*2:-2"
+        graph += f";[s{i}]scale={size}:flags=lanczos[o{i}]"
+        labels.append(f"[o{i}]")
+    return graph, labels
+
+def render_segment_ladder(segment_path, spec, outputs, threads=None):
+    """Render a segment in several profiles with one ffmpeg process
+
+    The segment is decoded and filtered once, the frames are split and
+    every rung is encoded with its own profile, see build_ladder_filter.
+
+    Args:
+        segment_path (string): path to the segment
+        spec (dict): render spec of the segment, see build_render_filter, its profile is ignored
+        outputs (dict): path of the rendered video by profile, ex {"high": ..., "480p": ...}
+        threads (int, optional): threads used by each encoder. Defaults to None, ffmpeg decides.
+
+    Raises:
+        ffmpeg.Error: ffmpeg failed, no output is written
+
+    Returns:
+        dict: path of the rendered video by profile
+    """
+    profiles = list(outputs)
+    if "size" not in spec and (spec.get("mode") or spec.get("part")):
+        spec = dict(spec, size=get_resolution(segment_path))
+    graph, labels = build_ladder_filter(spec, profiles)
+
+    directory = os.path.dirname(segment_path)
+    command = ["ffmpeg", "-i", segment_path, "-filter_complex", graph]
+    temp_outputs = []
+    for profile, label in zip(profiles, labels):
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".mp4", delete=False) as tmpfile:
+            temp_outputs.append(tmpfile.name)
+        command += ["-map", label, "-map", "0:a?", *_command_args(video_args(profile, threads)), "-c:a", "copy", temp_outputs[-1]]
+
+    try:
+        run_ffmpeg(command, name="ladder", segment=os.path.basename(segment_path))
+    except ffmpeg.Error:
+        for temp_output in temp_outputs:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+        raise
+
+    for profile, temp_output in zip(profiles, temp_outputs):
+        os.makedirs(os.path.dirname(outputs[profile]) or ".", exist_ok=True)
+        shutil.move(temp_output, outputs[profile])
+    return dict(outputs)
+
+def ladder_outputs(directory_output, file_name, profiles):
+    """Path of a video in every rung, directory_output/<profile>/file_name"""
+    return {profile: os.path.join(directory_output, profile, file_name) for profile in profiles}
+
+def render_segment_to_directory(segment_path, spec, directory_output=None, threads=None):
+    """Render a segment in place then move it to the output directory
+
+    Args:
+        segment_path (string): path to the segment
+        spec (dict): render spec of the segment, see build_render_filter
+        directory_output (string, optional): path to output directory. Defaults to None, the segment stays.
+        threads (int, optional): threads used by ffmpeg. Defaults to None.
+
+    Returns:
+        string: path of the rendered video
+    """
+    render_segment(segment_path, spec, threads=threads)
+    if directory_output:
+        return shutil.move(segment_path, directory_output)
+    return segment_path
+
+def render_all_segments(
+    directory_videos,
+    file_video_name_output,
+    directory_input_sub=None,
+    video_title=None,
+    mode="letterbox",
+    directory_output=None,
+    font_path=DEFAULT_FONT_PATH,
+    add_part=True,
+    total_threads=None,
+    max_workers=None,
+    profile=DEFAULT_PROFILE,
+    profiles=None
+):
+    """Render every segment in one pass instead of running each stage after the other
+
+    Args:
+        directory_videos (string): directory where videos are
+        file_video_name_output (string): name of the segments
+        directory_input_sub (string, optional): directory where .ass subtitles are. Defaults to None, no subtitles.
+        video_title (string, optional): title in the banner. Defaults to None, no title.
+        mode (string, optional): letterbox format or crop. Defaults to "letterbox".
+        directory_output (string, optional): path to output directory. Defaults to None.
+        font_path (string, optional): font of the banners. Defaults to Montserrat SemiBold.
+        add_part (bool, optional): add the part banner. Defaults to True.
+        total_threads (int, optional): threads shared by the segments. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments rendered at the same time. Defaults to None.
+        profile (string, optional): "draft" for a quick preview or "final". Defaults to "final".
+        profiles (list, optional): render every segment in these profiles with one decode, in
+            directory_output/<profile>/, ex DEFAULT_LADDER. Defaults to None, only profile.
+    """
+    tiktok_format_filter(mode)
+
+    all_segments = sorted([
+        f for f in os.listdir(directory_videos)
+        if f.startswith(file_video_name_output) and f.endswith(".mp4")
+    ], key=natural_sort_key)
+
+    log("info", f"{len(all_segments)} segments found in {directory_videos}")
+
+    jobs = []
+    for i, seg_file in enumerate(all_segments):
+        spec = {
+            "mode": mode,
+            "title": video_title,
+            "font_path": font_path,
+            "part": f"Partie {i + 1}" if add_part else None,
+            "profile": profile,
+        }
+        if directory_input_sub:
+            segment_path_ass = os.path.join(directory_input_sub, f"{os.path.splitext(seg_file)[0]}.ass")
+            if os.path.exists(segment_path_ass):
+                spec["ass_path"] = segment_path_ass
+            else:
+                log("warning", f"No file .ass for {seg_file}, render without subtitles.")
+        if profiles:
+            jobs.append((seg_file, {
+                "segment_path": os.path.join(directory_videos, seg_file),
+                "spec": spec,
+                "outputs": ladder_outputs(directory_output or directory_videos, seg_file, profiles),
+            }))
+        else:
+            jobs.append((seg_file, {
+                "segment_path": os.path.join(directory_videos, seg_file),
+                "spec": spec,
+                "directory_output": directory_output,
+            }))
+
+    func = render_segment_ladder if profiles else render_segment_to_directory
+    results, _ = run_segment_jobs(func, jobs, total_threads, max_workers)
+    for result in results.values():
+        for path in (result.values() if profiles else [result]):
+            log("ok", f"Video rendered : {path}")
 
 def add_subtitles_to_video_segments_ass_segment_only(
     directory_videos,
     directory_input_sub,
     directory_output,
     file_video_name_output,
-    burn_in=True
+    burn_in=True,
+    total_threads=None,
+    max_workers=None
 ):
     """
     Add subtitles of segments with .ass extension
@@ -51,49 +455,35 @@ def add_subtitles_to_video_segments_ass_segment_only(
         directory_output (string): directory for the output video
         file_video_name_output (string): name of the output video
         burn_in (bool, optional): If subtitles are embedded or not. Defaults to True.
+        total_threads (int, optional): threads shared by the segments. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments processed at the same time. Defaults to None.
     """
     all_segments = sorted([
         f for f in os.listdir(directory_videos)
         if f.startswith(file_video_name_output) and f.endswith(".mp4")
-    ])
+    ], key=natural_sort_key)
 
-    print(f"[INFO] {len(all_segments)} segments found in {directory_videos}")
+    log("info", f"{len(all_segments)} segments found in {directory_videos}")
 
+    jobs = []
     for seg_file in all_segments:
-        segment_path = os.path.join(directory_videos, seg_file)
         segment_path_ass = os.path.join(directory_input_sub, f"{os.path.splitext(seg_file)[0]}.ass")
 
-        with tempfile.NamedTemporaryFile(dir=directory_videos, suffix=".mp4", delete=False) as tmpfile:
-            temp_output = tmpfile.name
-
         if not os.path.exists(segment_path_ass):
-            print(f"[WARNING] No file .ass for {seg_file}, skip.")
+            log("warning", f"No file .ass for {seg_file}, skip.")
             continue
-        try:
-            if burn_in:
-                (
-                    ffmpeg
-                    .input(segment_path)
-                    .output(
-                        temp_output, 
-                        vf=f"ass='{segment_path_ass.replace(os.sep, '/')}'",
-                        vcodec="libx264", 
-                        acodec="copy"
-                    )
-                    .run(overwrite_output=True, quiet=False)
-                )
-
-            print(f"[OK] Subtitles add to : {temp_output}")
-
-        except ffmpeg.Error as e:
-            print(f"[ERREUR] ffmpeg failed with {seg_file} : {e}")
-        finally:
-            shutil.move(temp_output, segment_path)
-        if directory_output:
-            shutil.move(segment_path, directory_output)
-    print("\n[OK] All segments are subtitled ")
-
-def add_part_to_video(segment_path, title, font_path=None, output_path=None):
+        jobs.append((seg_file, {
+            "segment_path": os.path.join(directory_videos, seg_file),
+            "spec": {"ass_path": segment_path_ass} if burn_in else {},
+            "directory_output": directory_output,
+        }))
+
+    results, _ = run_segment_jobs(render_segment_to_directory, jobs, total_threads, max_workers)
+    for path in results.values():
+        log("ok", f"Subtitles add to : {path}")
+    log("ok", "All segments are subtitled")
+
+def add_part_to_video(segment_path, title, font_path=None, output_path=None, threads=None):
     """
     Add banner part for the video
 
@@ -102,53 +492,20 @@ def add_part_to_video(segment_path, title, font_path=None, output_path=None):
         title (string): Number of the part
         font_path (_type_, optional): Which use. Defaults to None.
         output_path (_type_, optional): path to the ouput directory. Defaults to None.
+        threads (int, optional): threads used by ffmpeg. Defaults to None.
     """
-    directory = os.path.dirname(segment_path)
-
-    with tempfile.NamedTemporaryFile(dir=directory, suffix=".mp4", delete=False) as tmpfile:
-        temp_output = tmpfile.name
-
-    font_option = f"fontfile='{font_path}'" if font_path else "font='Arial'"
-    vf = (
-        "drawtext="
-        f"text='{title}':"
-        f"{font_option}:"
-        "fontsize=70:"
-        "fontcolor=black:"
-        "x=(w-text_w)/2:"
-        "y=1500:"
-        "box=1:"
-        "boxcolor=white@1.0:"
-        "boxborderw=25"
-    )
-
     try:
-        (
-            ffmpeg
-            .input(segment_path)
-            .output(
-                temp_output,
-                vf=vf,
-                vcodec="libx264",
-                acodec="copy"
-            )
-            .run(overwrite_output=True, quiet=False)
-        )
-
-        destination = output_path if output_path else segment_path
-        shutil.move(temp_output, destination)
-
+        render_segment(segment_path, {"part": title, "font_path": font_path}, output_path, threads)
     except ffmpeg.Error as e:
-        print(f"[ERREUR] ffmpeg failed : {e}")
-        if os.path.exists(temp_output):
-            os.remove(temp_output)
+        log("error", f"ffmpeg failed : {ffmpeg_error_message(e)}")
 
 def add_title_to_video(
-    segment_path, 
-    title, 
-    font_path=None, 
+    segment_path,
+    title,
+    font_path=None,
     output_path=None,
-    max_chars_per_line=25
+    max_chars_per_line=25,
+    threads=None
 ):
     """Add title banner to the video
 
@@ -158,66 +515,27 @@ def add_title_to_video(
         font_path (_type_, optional): Which font to use. Defaults to None.
         output_path (_type_, optional): path for the output directory. Defaults to None.
         max_chars_per_line (int, optional): Number of characters per line. Defaults to 25.
+        threads (int, optional): threads used by ffmpeg. Defaults to None.
     """
-    directory = os.path.dirname(segment_path)
-
-    with tempfile.NamedTemporaryFile(dir=directory, suffix=".mp4", delete=False) as tmpfile:
-        temp_output = tmpfile.name
-
-    print(f"[INFO] Ajout du titre '{title}' à {segment_path}")
-
-    wrapped_title = "\n".join(textwrap.wrap(title, width=max_chars_per_line))
-    font_option = f"fontfile='{font_path}'" if font_path else "font='Arial'"
-
-    length = len(title)
-    if length < 30:
-        fontsize = 70
-    elif length < 60:
-        fontsize = 60
-    else:
-        fontsize = 50
-
-    vf = (
-        "drawtext="
-        f"text='{wrapped_title}':"
-        f"{font_option}:"
-        f"fontsize={fontsize}:"
-        "fontcolor=black:"
-        "x=(w-text_w)/2:"
-        "y=(h/10):"
-        "line_spacing=15:"
-        "box=1:"
-        "boxcolor=white@0.9:"
-        "boxborderw=25"
-    )
+    log("info", f"Add title '{title}' to {segment_path}")
 
+    spec = {"title": title, "font_path": font_path, "max_chars_per_line": max_chars_per_line}
     try:
-        (
-            ffmpeg
-            .input(segment_path)
-            .output(
-                temp_output,
-                vf=vf,
-                vcodec="libx264",
-                acodec="copy"
-            )
-            .run(overwrite_output=True, quiet=False)
-        )
-
-        destination = output_path if output_path else segment_path
-        shutil.move(temp_output, destination)
-        print(f"[OK] Titre ajouté et fichier mis à jour : {destination}")
+        destination = render_segment(segment_path, spec, output_path, threads)
+        log("ok", f"Title added : {destination}")
 
     except ffmpeg.Error as e:
-        print(f"[ERREUR] ffmpeg a échoué : {e}")
-        if os.path.exists(temp_output):
-            os.remove(temp_output)
+        log("error", f"ffmpeg failed : {ffmpeg_error_message(e)}")
 
 def convert_to_tiktok_format(
-    directory_videos, 
-    file_video_name_output, 
+    directory_videos,
+    file_video_name_output,
     directory_output = None,
-    mode="letterbox"
+    mode="letterbox",
+    total_threads=None,
+    max_workers=None,
+    profile=DEFAULT_PROFILE,
+    profiles=None
 ):
     """Transform video to 16:9 format to 9:16 to correspond to the tiktok
 
@@ -226,118 +544,98 @@ def convert_to_tiktok_format(
         file_video_name_output (string): name for the output video
         directory_output (string, optional): path to output directory. Defaults to None.
         mode (string, optional): letterbox format or crop. Defaults to "letterbox".
+        total_threads (int, optional): threads shared by the segments. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments converted at the same time. Defaults to None.
+        profile (string, optional): "draft" for a quick preview or "final". Defaults to "final".
+        profiles (list, optional): convert every segment in these profiles with one decode, in
+            directory_output/<profile>/, ex DEFAULT_LADDER. Defaults to None, only profile.
 
     Raises:
         ValueError: wrong mode
     """
-
-    if mode == "letterbox":
-        vf = "scale=1080:-1:flags=lanczos,pad=1080:1920:(ow-iw)/2:(oh-ih)/2"
-    elif mode == "crop":
-        vf = "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920"
-    else:
-        raise ValueError("Unknown mode. Choose 'letterbox' or 'crop'")
+    tiktok_format_filter(mode)
 
     all_segments = sorted([
         f for f in os.listdir(directory_videos)
         if f.startswith(file_video_name_output) and f.endswith('.mp4')
-    ])
-
-    for seg_file in all_segments:
-        segment_path = os.path.join(directory_videos, seg_file)
-
-        with tempfile.NamedTemporaryFile(dir=directory_videos, suffix=".mp4", delete=False) as tmpfile:
-            temp_output = tmpfile.name
-
-        (
-            ffmpeg
-            .input(segment_path)
-            .output(
-                temp_output,
-                vf=vf,
-                vcodec="libx264",
-                acodec="copy"
-            )
-            .run(overwrite_output=True, quiet=False)
-        )
-
-        shutil.move(temp_output, segment_path)
-        if directory_output:
-            shutil.move(segment_path, directory_output)
-
-        print(f"[OK] Video converted : {segment_path}")
-
-def add_part_to_correct_index(directory_videos, output_path=None):
+    ], key=natural_sort_key)
+
+    if profiles:
+        jobs = [
+            (seg_file, {
+                "segment_path": os.path.join(directory_videos, seg_file),
+                "spec": {"mode": mode},
+                "outputs": ladder_outputs(directory_output or directory_videos, seg_file, profiles),
+            })
+            for seg_file in all_segments
+        ]
+        results, _ = run_segment_jobs(render_segment_ladder, jobs, total_threads, max_workers)
+        for outputs in results.values():
+            for path in outputs.values():
+                log("ok", f"Video converted : {path}")
+        return
+
+    jobs = [
+        (seg_file, {
+            "segment_path": os.path.join(directory_videos, seg_file),
+            "spec": {"mode": mode, "profile": profile},
+            "directory_output": directory_output,
+        })
+        for seg_file in all_segments
+    ]
+
+    results, _ = run_segment_jobs(render_segment_to_directory, jobs, total_threads, max_workers)
+    for path in results.values():
+        log("ok", f"Video converted : {path}")
+
+def add_part_to_correct_index(directory_videos, output_path=None, total_threads=None, max_workers=None):
     """Add part banner with correct index video
 
     Args:
         directory_videos (string): directory where videos
         output_path (string, optional): output path for the video. Defaults to None.
+        total_threads (int, optional): threads shared by the segments. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments processed at the same time. Defaults to None.
     """
     all_segments = sorted([
         f for f in os.listdir(directory_videos)
         if f.endswith(".mp4")
-    ])
-
-    for i, seg_file in enumerate(all_segments):
-        seg_path = os.path.join(directory_videos, seg_file)
-
-        with tempfile.NamedTemporaryFile(dir=directory_videos, suffix=".mp4", delete=False) as tmpfile:
-            temp_output = tmpfile.name
-
-        try:
-            add_part_to_video(
-                segment_path=seg_path,
-                title=f"Partie {i + 1}",
-                output_path=temp_output,
-                font_path="./fonts/Montserrat-SemiBold.otf"
-            )
+    ], key=natural_sort_key)
 
+    jobs = [
+        (seg_file, {
+            "segment_path": os.path.join(directory_videos, seg_file),
+            "spec": {"part": f"Partie {i + 1}", "font_path": DEFAULT_FONT_PATH},
+            "directory_output": output_path,
+        })
+        for i, seg_file in enumerate(all_segments)
+    ]
 
-        except Exception as e:
-            print(f"[ERROR] in {seg_file} : {e}")
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-        finally:
-            shutil.move(temp_output, seg_path)
-            if output_path:
-                shutil.move(seg_path, output_path)
+    run_segment_jobs(render_segment_to_directory, jobs, total_threads, max_workers)
 
-def add_title_to_correct_index(directory_videos, video_title, output_path=None):
+def add_title_to_correct_index(directory_videos, video_title, output_path=None, total_threads=None, max_workers=None):
     """Add title banner with correct index video
 
     Args:
         directory_videos (string): directory where videos
         output_path (string, optional): output path for the video. Defaults to None.
         video_title (string, optional): title in the banner the video. Defaults to None.
+        total_threads (int, optional): threads shared by the segments. Defaults to None, every core.
+        max_workers (int, optional): maximum of segments processed at the same time. Defaults to None.
 
     """
     all_segments = sorted([
         f for f in os.listdir(directory_videos)
         if f.endswith(".mp4")
-    ])
-
-    for i, seg_file in enumerate(all_segments):
-        seg_path = os.path.join(directory_videos, seg_file)
-
-        with tempfile.NamedTemporaryFile(dir=directory_videos, suffix=".mp4", delete=False) as tmpfile:
-            temp_output = tmpfile.name
-
-        try:
-            add_title_to_video(
-                segment_path=seg_path,
-                title=f"{video_title}",
-                output_path=temp_output,
-                font_path="./fonts/Montserrat-SemiBold.otf"
-            )
-
-        except Exception as e:
-            print(f"[ERROR] in {seg_file} : {e}")
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-
-        finally:
-            shutil.move(temp_output, seg_path)
-            if output_path:
-                shutil.move(seg_path, output_path)
-
+    ], key=natural_sort_key)
+
+    jobs = [
+        (seg_file, {
+            "segment_path": os.path.join(directory_videos, seg_file),
+            "spec": {"title": f"{video_title}", "font_path": DEFAULT_FONT_PATH},
+            "directory_output": output_path,
+        })
+        for seg_file in all_segments
+    ]
+
+    run_segment_jobs(render_segment_to_directory, jobs, total_threads, max_workers)
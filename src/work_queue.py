@@ -0,0 +1,574 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from src.metrics import configure as configure_metrics
+from src.metrics import ffmpeg_error_message, increment, log, timer
+from src.pipeline import DEFAULT_CONFIG, Pipeline
+from src.source_file_utils import get_video_section
+from src.subtitles_utils import transcribe_segment_to_ass
+from src.video_utils import cut_single_segment, render_segment
+
+DEFAULT_QUEUE_PATH = "./queue.db"
+DEFAULT_LEASE = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 10.0
+TASK_KINDS = ["fetch", "cut", "transcribe", "render"]
+# directories of the config made absolute, the workers of other hosts see the same paths on a shared filesystem
+PATH_SETTINGS = ["directory_videos", "directory_output", "directory_output_sub", "font_path"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    config TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL REFERENCES jobs(id),
+    kind TEXT NOT NULL,
+    segment INTEGER NOT NULL DEFAULT -1,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (job, kind, segment)
+);
+CREATE TABLE IF NOT EXISTS task_dependencies (
+    task INTEGER NOT NULL REFERENCES tasks(id),
+    depends_on INTEGER NOT NULL REFERENCES tasks(id),
+    PRIMARY KEY (task, depends_on)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, available_at);
+"""
+
+
+class WorkQueue:
+    """Tasks of the jobs in a SQLite database shared by the workers
+
+    A job is a fetch task, its completion adds the cut, transcribe and
+    render tasks of every segment. A worker claims a task whose
+    dependencies are done with a lease, extends it with heartbeats while
+    it works and completes it. A task whose lease expires (the worker
+    crashed or the host is gone) is claimed again by another worker, a
+    failed task is retried after a backoff until max_attempts. When a
+    task fails for good, the tasks which depend on it (the render of a
+    segment whose cut failed) are failed with it : they would never be
+    ready, retry_failed puts them back in the queue together.
+
+    Completion is idempotent : only the owner of the lease completes the
+    task, and the tasks added by a completion are unique by (job, kind,
+    segment), so a late or repeated completion changes nothing.
+
+    Every call opens its own connection, a WorkQueue can be used by
+    several threads and processes. The database must be on a filesystem
+    with working locks (a local disk, or NFS with locking). It uses the
+    rollback journal (journal_mode=DELETE) and not WAL : the WAL index is
+    shared memory, it only works for processes of the same host.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=DEFAULT_BACKOFF):
+        """
+        Args:
+            path (string, optional): path to the database. Defaults to DEFAULT_QUEUE_PATH.
+            max_attempts (int, optional): attempts of a task before it fails. Defaults to 3.
+            backoff (float, optional): wait before the first retry of a task in seconds. Defaults to 10.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=DELETE")
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock first, two workers cannot claim the same task
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def _add_task(self, connection, job, kind, segment=-1, depends_on=()):
+        connection.execute(
+            "INSERT OR IGNORE INTO tasks (job, kind, segment, max_attempts, updated) VALUES (?, ?, ?, ?, ?)",
+            (job, kind, segment, self.max_attempts, time.time())
+        )
+        task_id = connection.execute(
+            "SELECT id FROM tasks WHERE job = ? AND kind = ? AND segment = ?", (job, kind, segment)
+        ).fetchone()["id"]
+        connection.executemany(
+            "INSERT OR IGNORE INTO task_dependencies (task, depends_on) VALUES (?, ?)",
+            [(task_id, dependency) for dependency in depends_on]
+        )
+        return task_id
+
+    def enqueue(self, source, config=None, job=None):
+        """Add a job, its fetch task is ready at once
+
+        Args:
+            source (string): the path or the url of the video
+            config (dict, optional): settings of the pipeline, see pipeline.DEFAULT_CONFIG. Defaults to None.
+            job (string, optional): id of the job. Defaults to None, a random id.
+
+        Raises:
+            ValueError: unknown setting or the job already exists
+
+        Returns:
+            string: id of the job
+        """
+        settings = config or {}
+        config = dict(DEFAULT_CONFIG, **settings)
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown settings {sorted(unknown)}")
+        job = job or uuid.uuid4().hex[:12]
+        # the names not given come from the job id, two jobs never write the same segments or clips
+        if "file_video_name_output" not in settings:
+            config["file_video_name_output"] = job
+        if "video_name" not in settings:
+            config["video_name"] = job
+        if "directory_output" not in settings:
+            config["directory_output"] = os.path.join(DEFAULT_CONFIG["directory_output"], job)
+        for key in PATH_SETTINGS:
+            if config[key]:
+                config[key] = os.path.abspath(config[key])
+        if not source.startswith(("http://", "https://")):
+            source = os.path.abspath(source)
+
+        with self._transaction() as connection:
+            if connection.execute("SELECT 1 FROM jobs WHERE id = ?", (job,)).fetchone():
+                raise ValueError(f"Job {job} already exists")
+            connection.execute(
+                "INSERT INTO jobs (id, source, config, created) VALUES (?, ?, ?, ?)",
+                (job, source, json.dumps(config), time.time())
+            )
+            self._add_task(connection, job, "fetch")
+        log("ok", f"Job {job} enqueued : {source}")
+        return job
+
+    def get_job(self, job):
+        """Source, config and fetch result of a job
+
+        Returns:
+            dict: source, config and fetch ({"source", "start", "number_of_segment"} once fetched)
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT source, config FROM jobs WHERE id = ?", (job,)).fetchone()
+            fetch = connection.execute(
+                "SELECT result FROM tasks WHERE job = ? AND kind = 'fetch' AND status = 'done'", (job,)
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown job {job}")
+        return {
+            "source": row["source"],
+            "config": json.loads(row["config"]),
+            "fetch": json.loads(fetch["result"]) if fetch else None,
+        }
+
+    def claim(self, owner, kinds=None, lease=DEFAULT_LEASE):
+        """Lease the oldest task which is ready
+
+        A task is ready when it is pending (or its lease expired), its
+        backoff is over and every task it depends on is done.
+
+        Args:
+            owner (string): name of the worker
+            kinds (list, optional): kinds of task the worker does, ex ["transcribe"] on a GPU host. Defaults to None, every kind.
+            lease (float, optional): seconds before the task can be claimed by another worker. Defaults to 120.
+
+        Returns:
+            dict: the task (id, job, kind, segment, attempts), None if no task is ready
+        """
+        kinds = kinds or TASK_KINDS
+        now = time.time()
+        with self._transaction() as connection:
+            # the tasks whose worker died on their last attempt
+            expired = connection.execute(
+                "SELECT id FROM tasks WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts", (now,)
+            ).fetchall()
+            for task in expired:
+                connection.execute(
+                    "UPDATE tasks SET status = 'failed', error = 'lease expired', lease_owner = NULL, updated = ? WHERE id = ?",
+                    (now, task["id"])
+                )
+                self._fail_dependents(connection, task["id"], now)
+            row = connection.execute(
+                f"SELECT id, job, kind, segment, attempts FROM tasks "
+                f"WHERE kind IN ({','.join('?' * len(kinds))}) "
+                f"AND ((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?)) "
+                f"AND NOT EXISTS ("
+                f"    SELECT 1 FROM task_dependencies d JOIN tasks t ON t.id = d.depends_on "
+                f"    WHERE d.task = tasks.id AND t.status != 'done'"
+                f") ORDER BY id LIMIT 1",
+                (*kinds, now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                (owner, now + lease, now, row["id"])
+            )
+        return dict(row, attempts=row["attempts"] + 1)
+
+    def heartbeat(self, task_id, owner, lease=DEFAULT_LEASE):
+        """Extend the lease of a task
+
+        Returns:
+            bool: False if the worker does not own the lease any more
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + lease, now, task_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, owner, result=None):
+        """Mark a task done, a fetch task adds the tasks of the segments
+
+        Args:
+            task_id (int): id of the task
+            owner (string): name of the worker
+            result (dict, optional): result of the task, json serializable. Defaults to None.
+
+        Returns:
+            bool: False if the task was already done or leased by another worker, nothing changed
+        """
+        with self._transaction() as connection:
+            task = connection.execute(
+                "SELECT job, kind FROM tasks WHERE id = ? AND status = 'leased' AND lease_owner = ?", (task_id, owner)
+            ).fetchone()
+            if task is None:
+                return False
+            connection.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_owner = NULL, updated = ? WHERE id = ?",
+                (json.dumps(result), time.time(), task_id)
+            )
+            if task["kind"] == "fetch":
+                self._add_segment_tasks(connection, task["job"], task_id, result)
+        return True
+
+    def _add_segment_tasks(self, connection, job, fetch_id, fetch):
+        config = json.loads(connection.execute("SELECT config FROM jobs WHERE id = ?", (job,)).fetchone()["config"])
+        for i in range(fetch["number_of_segment"]):
+            cut_id = self._add_task(connection, job, "cut", i, [fetch_id])
+            render_dependencies = [cut_id]
+            if config["transcribe"]:
+                render_dependencies.append(self._add_task(connection, job, "transcribe", i, [cut_id]))
+            self._add_task(connection, job, "render", i, render_dependencies)
+
+    def fail(self, task_id, owner, error):
+        """Retry a task after a backoff, or mark it failed after max_attempts
+
+        Returns:
+            bool: False if the worker does not own the lease any more
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            task = connection.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (task_id, owner)
+            ).fetchone()
+            if task is None:
+                return False
+            if task["attempts"] >= task["max_attempts"]:
+                status, available_at = "failed", now
+            else:
+                status, available_at = "pending", now + self.backoff * 2 ** (task["attempts"] - 1)
+            connection.execute(
+                "UPDATE tasks SET status = ?, available_at = ?, error = ?, lease_owner = NULL, updated = ? WHERE id = ?",
+                (status, available_at, error, now, task_id)
+            )
+            if status == "failed":
+                self._fail_dependents(connection, task_id, now)
+        return True
+
+    def _fail_dependents(self, connection, task_id, now):
+        # every task which depends on it, directly or not, is still pending : none of them can run
+        connection.execute(
+            "WITH RECURSIVE dependents(id) AS ("
+            "    SELECT task FROM task_dependencies WHERE depends_on = ? "
+            "    UNION SELECT d.task FROM task_dependencies d JOIN dependents ON d.depends_on = dependents.id"
+            ") UPDATE tasks SET status = 'failed', error = ?, updated = ? "
+            "WHERE id IN (SELECT id FROM dependents) AND status = 'pending'",
+            (task_id, f"task {task_id} it depends on failed", now)
+        )
+
+    def release(self, task_id, owner):
+        """Give a task back without counting the attempt, ex when the worker is stopped"""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE tasks SET status = 'pending', attempts = attempts - 1, lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (time.time(), task_id, owner)
+            )
+
+    def retry_failed(self, job=None):
+        """Put the failed tasks back in the queue with their attempts reset
+
+        The tasks failed because a task they depend on failed come back
+        too, they are ready once it is done.
+
+        Args:
+            job (string, optional): id of the job. Defaults to None, every job.
+
+        Returns:
+            int: number of tasks
+        """
+        query = "UPDATE tasks SET status = 'pending', attempts = 0, available_at = 0, updated = ? WHERE status = 'failed'"
+        params = [time.time()]
+        if job:
+            query += " AND job = ?"
+            params.append(job)
+        with self._transaction() as connection:
+            return connection.execute(query, params).rowcount
+
+    def status(self, job=None):
+        """Number of tasks by job, kind and status
+
+        Returns:
+            dict: {job: {kind: {status: count}}}
+        """
+        query = "SELECT job, kind, status, COUNT(*) AS count FROM tasks"
+        params = []
+        if job:
+            query += " WHERE job = ?"
+            params.append(job)
+        with self._connect() as connection:
+            rows = connection.execute(query + " GROUP BY job, kind, status ORDER BY job", params).fetchall()
+        summary = {}
+        for row in rows:
+            summary.setdefault(row["job"], {}).setdefault(row["kind"], {})[row["status"]] = row["count"]
+        return summary
+
+    def failures(self, job=None):
+        """Failed tasks with their error
+
+        Returns:
+            list: dict with id, job, kind, segment, attempts and error
+        """
+        query = "SELECT id, job, kind, segment, attempts, error FROM tasks WHERE status = 'failed'"
+        params = []
+        if job:
+            query += " AND job = ?"
+            params.append(job)
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(query + " ORDER BY id", params).fetchall()]
+
+
+def _job_pipeline(state):
+    """Pipeline of a job, used for its paths and render specs"""
+    pipeline = Pipeline(state["source"], state["config"])
+    if state["fetch"]:
+        pipeline.source = state["fetch"]["source"]
+        pipeline.start = state["fetch"]["start"]
+        pipeline.number_of_segment = state["fetch"]["number_of_segment"]
+    return pipeline
+
+
+def run_task(task, state, threads=None):
+    """Do the work of a task with the functions of the stages
+
+    Args:
+        task (dict): the task, see WorkQueue.claim
+        state (dict): the job, see WorkQueue.get_job
+        threads (int, optional): threads used by ffmpeg. Defaults to None, ffmpeg decides.
+
+    Returns:
+        dict: result of the task
+    """
+    pipeline = _job_pipeline(state)
+    config = pipeline.config
+    i = task["segment"]
+
+    if task["kind"] == "fetch":
+        pipeline.source, pipeline.start = get_video_section(
+            config["source"],
+            config["start_cuting_time_code"],
+            config["start_cuting_time_code"] + config["number_of_segment"] * config["time_of_segment"],
+            download_dir=os.path.join(config["directory_videos"], "downloads")
+        )
+        pipeline._count_segments()
+        return {"source": pipeline.source, "start": pipeline.start, "number_of_segment": pipeline.number_of_segment}
+
+    if task["kind"] == "cut":
+        os.makedirs(config["directory_videos"], exist_ok=True)
+        cut_single_segment(
+            pipeline.source,
+            pipeline.start + i * config["time_of_segment"],
+            config["time_of_segment"],
+            pipeline.segment_path(i),
+            mode=config["cut_mode"],
+            threads=threads,
+            profile=config["profile"]
+        )
+        return {"path": pipeline.segment_path(i)}
+
+    if task["kind"] == "transcribe":
+        os.makedirs(config["directory_output_sub"], exist_ok=True)
+        ass_path = pipeline.subtitles_path(i)
+        transcribe_segment_to_ass(
+            pipeline.segment_path(i),
+            ass_path,
+            os.path.splitext(ass_path)[0] + ".json",
+            model_name=config["model_name"],
+            use_cache=config["use_cache"],
+            backend=config["backend"],
+            karaoke=config["karaoke"]
+        )
+        return {"path": ass_path}
+
+    if task["kind"] == "render":
+        # render_segment writes a temp file then renames it, a killed render leaves no half clip
+        os.makedirs(config["directory_output"], exist_ok=True)
+        render_segment(pipeline.segment_path(i), pipeline._render_spec(i), pipeline.output_path(i), threads)
+        return {"path": pipeline.output_path(i)}
+
+    raise ValueError(f"Unknown task kind {task['kind']}")
+
+
+def _heartbeat_loop(work_queue, task_id, owner, lease, stop, lost):
+    while not stop.wait(lease / 3):
+        try:
+            if not work_queue.heartbeat(task_id, owner, lease):
+                lost.set()
+                return
+        except sqlite3.Error as e:
+            log("warning", f"Heartbeat of task {task_id} failed : {e}")
+
+
+def run_worker(path=DEFAULT_QUEUE_PATH, owner=None, kinds=None, lease=DEFAULT_LEASE, poll=2.0, exit_when_idle=False, threads=None):
+    """Claim and do tasks until stopped (Ctrl+C)
+
+    The lease of the running task is extended every lease / 3 seconds. If
+    the worker is stopped the task is given back, if it crashes the task is
+    claimed again once the lease expires.
+
+    Args:
+        path (string, optional): path to the database. Defaults to DEFAULT_QUEUE_PATH.
+        owner (string, optional): name of the worker. Defaults to None, "host:pid".
+        kinds (list, optional): kinds of task to do. Defaults to None, every kind.
+        lease (float, optional): seconds of a lease. Defaults to 120.
+        poll (float, optional): seconds between two claims when no task is ready. Defaults to 2.
+        exit_when_idle (bool, optional): stop when no task is ready. Defaults to False.
+        threads (int, optional): threads used by ffmpeg. Defaults to None, ffmpeg decides.
+
+    Returns:
+        int: number of tasks done
+    """
+    work_queue = WorkQueue(path)
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+    log("info", f"Worker {owner} on {path}")
+    done = 0
+    while True:
+        task = work_queue.claim(owner, kinds, lease)
+        if task is None:
+            if exit_when_idle:
+                log("ok", f"Worker {owner} : no task ready, {done} tasks done")
+                return done
+            time.sleep(poll)
+            continue
+
+        name = f"{task['kind']} {task['job']}" + (f"/{task['segment']}" if task["segment"] >= 0 else "")
+        log("info", f"Task {name} (attempt {task['attempts']})")
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat_loop, args=(work_queue, task["id"], owner, lease, stop, lost), daemon=True
+        )
+        heartbeat.start()
+        try:
+            with timer("task", kind=task["kind"], job=task["job"], segment=task["segment"]):
+                result = run_task(task, work_queue.get_job(task["job"]), threads)
+        except KeyboardInterrupt:
+            stop.set()
+            work_queue.release(task["id"], owner)
+            log("warning", f"Worker {owner} stopped, task {name} given back")
+            return done
+        except Exception as e:
+            stop.set()
+            log("error", f"Task {name} : {ffmpeg_error_message(e)}")
+            increment("task_errors", kind=task["kind"])
+            work_queue.fail(task["id"], owner, ffmpeg_error_message(e))
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        if lost.is_set() or not work_queue.complete(task["id"], owner, result):
+            log("warning", f"Task {name} was leased by another worker, result dropped")
+            continue
+        done += 1
+        log("ok", f"Task {name} done")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queue of the pipeline tasks shared by workers")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="path to the SQLite database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add a video to the queue")
+    enqueue.add_argument("source", help="path or url of the video")
+    enqueue.add_argument("--job", help="id of the job, random by default")
+    enqueue.add_argument("--config", help="json of pipeline settings, ex '{\"number_of_segment\": 5}'")
+
+    worker = commands.add_parser("worker", help="claim and do tasks")
+    worker.add_argument("--kinds", nargs="+", choices=TASK_KINDS, help="kinds of task to do, every kind by default")
+    worker.add_argument("--lease", type=float, default=DEFAULT_LEASE, help="seconds of a lease")
+    worker.add_argument("--threads", type=int, help="threads used by ffmpeg")
+    worker.add_argument("--exit-when-idle", action="store_true", help="stop when no task is ready")
+
+    status = commands.add_parser("status", help="print the tasks by job, kind and status")
+    status.add_argument("--job", help="id of the job")
+
+    retry = commands.add_parser("retry", help="put the failed tasks back in the queue")
+    retry.add_argument("--job", help="id of the job")
+
+    parser.add_argument("--events", help="write every event in this .jsonl file")
+    args = parser.parse_args(argv)
+    configure_metrics(events_path=args.events)
+
+    if args.command == "enqueue":
+        WorkQueue(args.queue).enqueue(args.source, json.loads(args.config) if args.config else None, args.job)
+    elif args.command == "worker":
+        run_worker(args.queue, kinds=args.kinds, lease=args.lease, exit_when_idle=args.exit_when_idle, threads=args.threads)
+    elif args.command == "status":
+        work_queue = WorkQueue(args.queue)
+        print(json.dumps(work_queue.status(args.job), indent=2))
+        for failure in work_queue.failures(args.job):
+            print(f"[ERROR] {failure['kind']} {failure['job']}/{failure['segment']} : {failure['error']}")
+    else:
+        log("ok", f"{WorkQueue(args.queue).retry_failed(args.job)} tasks back in the queue")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,108 @@
+import pytest
+
+from src.cue_table import CueTable
+
+
+def _table(*cues):
+    return CueTable.from_cues({"start": s, "end": e, "text": t} for s, e, t in cues)
+
+
+def _rows(table):
+    return [(c["start"], c["end"], c["text"]) for c in table.to_cues()]
+
+
+@pytest.fixture
+def words():
+    return _table(
+        (0.0, 1.0, "a"),
+        (1.0, 2.0, "b"),
+        (1.5, 5.0, "long"),
+        (2.5, 3.0, "c"),
+        (5.0, 5.0, "instant"),
+        (6.0, 7.0, "d"),
+    )
+
+
+def test_cues_are_sorted_by_start():
+    table = _table((2.0, 3.0, "second"), (0.0, 1.0, "first"))
+    assert table.texts() == ["first", "second"]
+
+
+def test_starting_in_includes_start_excludes_end(words):
+    assert words.starting_in(1.0, 2.5).texts() == ["b", "long"]
+    assert words.starting_in(7.0, 9.0).texts() == []
+
+
+def test_window_keeps_cues_which_straddle(words):
+    # "long" starts before the window, "b" ends on its start and does not overlap
+    assert words.window(2.0, 2.6).texts() == ["long", "c"]
+
+
+def test_window_after_a_short_cue_still_finds_a_long_one(words):
+    # "c" ends before 3.5 but "long", earlier in the table, still runs
+    assert words.window(3.5, 4.0).texts() == ["long"]
+
+
+def test_window_touching_edges(words):
+    assert words.window(1.0, 1.5).texts() == ["b"]
+    assert words.window(7.0, 8.0).texts() == []
+
+
+def test_offset(words):
+    shifted = words.offset(-1.0)
+    assert _rows(shifted)[0] == (-1.0, 0.0, "a")
+    assert shifted.texts() == words.texts()
+
+
+def test_clamp_trims_and_drops(words):
+    assert _rows(words.clamp(1.5, 5.0)) == [
+        (1.5, 2.0, "b"),
+        (1.5, 5.0, "long"),
+        (2.5, 3.0, "c"),
+        (5.0, 5.0, "instant"),
+    ]
+
+
+def test_clamp_drops_cues_touching_the_edge(words):
+    # "a" ends where the range starts, "d" is after it
+    assert words.clamp(1.0, 5.5).texts() == ["b", "long", "c", "instant"]
+
+
+def test_drop_short(words):
+    assert words.drop_short(1.0).texts() == ["a", "b", "long", "d"]
+
+
+def test_merge_adjacent_within_gap():
+    table = _table((0.0, 1.0, "a"), (1.2, 2.0, "b"), (3.0, 4.0, "c"), (4.0, 4.5, "d"))
+    assert _rows(table.merge_adjacent(max_gap=0.2)) == [
+        (0.0, 2.0, "a b"),
+        (3.0, 4.5, "c d"),
+    ]
+
+
+def test_merge_adjacent_keeps_the_end_of_a_nested_cue():
+    table = _table((0.0, 5.0, "long"), (1.0, 2.0, "inside"), (6.0, 7.0, "after"))
+    assert _rows(table.merge_adjacent(separator="|")) == [
+        (0.0, 5.0, "long|inside"),
+        (6.0, 7.0, "after"),
+    ]
+
+
+def test_merge_adjacent_without_gap_keeps_separate_cues():
+    table = _table((0.0, 1.0, "a"), (1.5, 2.0, "b"))
+    assert table.merge_adjacent().texts() == ["a", "b"]
+
+
+def test_from_whisper_words_keeps_segments_without_words():
+    segments = [
+        {"start": 0.0, "end": 2.0, "text": " Hello world", "words": [
+            {"start": 0.0, "end": 0.8, "word": " Hello"},
+            {"start": 0.9, "end": 2.0, "word": " world"},
+        ]},
+        {"start": 2.5, "end": 3.0, "text": " Bye"},
+    ]
+    assert _rows(CueTable.from_whisper_words(segments)) == [
+        (0.0, 0.8, "Hello"),
+        (0.9, 2.0, "world"),
+        (2.5, 3.0, "Bye"),
+    ]
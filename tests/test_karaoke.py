@@ -0,0 +1,52 @@
+from src.subtitle_io import iter_karaoke_lines
+
+
+def _words(*words):
+    return [{"start": s, "end": e, "text": t} for s, e, t in words]
+
+
+def _texts(lines):
+    return [line["text"] for line in lines]
+
+
+def test_kf_durations_in_centiseconds_include_the_pause():
+    lines = list(iter_karaoke_lines(_words((1.0, 1.3, "one"), (1.45, 1.8, "two"), (1.8, 2.234, "three"))))
+    # a word lasts until the next one starts, the last one until its end
+    assert _texts(lines) == ["{\\kf45}one {\\kf35}two {\\kf43}three"]
+    assert (lines[0]["start"], lines[0]["end"]) == (1.0, 2.234)
+
+
+def test_k_tag():
+    assert _texts(iter_karaoke_lines(_words((0.0, 0.5, "a"), (0.5, 1.0, "b")), tag="k")) == ["{\\k50}a {\\k50}b"]
+
+
+def test_max_chars():
+    # "aaaa bbbb cccc" is 14 characters, the space before a word counts
+    words = _words((0.0, 0.1, "aaaa"), (0.1, 0.2, "bbbb"), (0.2, 0.3, "cccc"), (0.3, 0.4, "dddd"))
+    lines = list(iter_karaoke_lines(words, max_chars=14))
+    assert [line["start"] for line in lines] == [0.0, 0.3]
+    assert _texts(lines)[1] == "{\\kf10}dddd"
+
+
+def test_max_duration():
+    words = _words((0.0, 1.0, "a"), (1.0, 2.0, "b"), (2.0, 3.0, "c"), (3.0, 3.5, "d"))
+    lines = list(iter_karaoke_lines(words, max_duration=3.0))
+    assert [(line["start"], line["end"]) for line in lines] == [(0.0, 3.0), (3.0, 3.5)]
+
+
+def test_max_pause():
+    words = _words((0.0, 0.5, "a"), (1.0, 1.5, "b"), (2.25, 2.5, "c"))
+    lines = list(iter_karaoke_lines(words, max_pause=0.5))
+    # 0.5 s before "b" stays in the line, 0.75 s before "c" does not
+    assert [(line["start"], line["end"]) for line in lines] == [(0.0, 1.5), (2.25, 2.5)]
+    assert _texts(lines)[0] == "{\\kf100}a {\\kf50}b"
+
+
+def test_sentence_end_breaks_the_line():
+    words = _words((0.0, 0.2, "Yes."), (0.2, 0.4, "No?"), (0.4, 0.6, "Maybe"), (0.6, 0.8, "so"))
+    assert [line["start"] for line in iter_karaoke_lines(words)] == [0.0, 0.2, 0.4]
+
+
+def test_blank_words_are_skipped():
+    words = _words((0.0, 0.2, " hi "), (0.2, 0.3, "  "), (0.3, 0.5, "there"))
+    assert _texts(iter_karaoke_lines(words)) == ["{\\kf30}hi {\\kf20}there"]
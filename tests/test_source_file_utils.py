@@ -0,0 +1,222 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.source_file_utils import download_file
+
+CHUNK_SIZE = 1024
+CONTENT = bytes(range(256)) * 40  # 10 chunks
+
+
+class FileServer(ThreadingHTTPServer):
+    """http.server serving one file with Range and If-Range, like a CDN"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.content = CONTENT
+        self.etag = '"v1"'
+        self.last_modified = "Mon, 05 Oct 2026 10:00:00 GMT"
+        self.fail_from = None
+        self.fail_get = False
+        self.head_status = None
+        self.send_length = True
+        self.accept_ranges = True
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/video.mp4"
+
+    def ranges(self):
+        return [headers for method, headers in self.requests if method == "GET" and "Range" in headers]
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _validators(self):
+        if self.server.etag:
+            self.send_header("ETag", self.server.etag)
+        if self.server.last_modified:
+            self.send_header("Last-Modified", self.server.last_modified)
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", dict(self.headers)))
+        if self.server.head_status:
+            self.send_error(self.server.head_status)
+            return
+        self.send_response(200)
+        if self.server.send_length:
+            self.send_header("Content-Length", str(len(self.server.content)))
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self._validators()
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append(("GET", dict(self.headers)))
+        content = self.server.content
+        if self.server.fail_get:
+            self.send_error(404)
+            return
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not self.server.accept_ranges:
+            match = None
+        if_range = self.headers.get("If-Range")
+        if match and if_range not in (None, self.server.etag, self.server.last_modified):
+            # the file changed, the whole file is sent
+            match = None
+        if match is None:
+            self.send_response(200)
+            if self.server.send_length:
+                self.send_header("Content-Length", str(len(content)))
+            self._validators()
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        start, end = int(match.group(1)), int(match.group(2))
+        if self.server.fail_from is not None and start >= self.server.fail_from:
+            self.send_error(404)
+            return
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(content)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self._validators()
+        self.end_headers()
+        self.wfile.write(content[start:end + 1])
+
+
+@pytest.fixture
+def server():
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _download(server, path):
+    return download_file(server.url, str(path), chunk_size=CHUNK_SIZE, connections=1)
+
+
+def _interrupted_download(server, path):
+    server.fail_from = 5 * CHUNK_SIZE
+    with pytest.raises(requests.HTTPError):
+        _download(server, path)
+    server.fail_from = None
+    server.requests.clear()
+
+
+def test_download_by_ranges(server, tmp_path):
+    path = tmp_path / "video.mp4"
+    assert _download(server, path) == str(path)
+    assert path.read_bytes() == CONTENT
+    assert len(server.ranges()) == 10
+    with open(f"{path}.download.json", encoding="utf-8") as f:
+        assert json.load(f)["complete"]
+
+
+def test_resume_only_downloads_missing_chunks(server, tmp_path):
+    path = tmp_path / "video.mp4"
+    _interrupted_download(server, path)
+    assert not path.exists()
+
+    _download(server, path)
+    assert path.read_bytes() == CONTENT
+    assert [headers["Range"] for headers in server.ranges()] == [
+        f"bytes={i * CHUNK_SIZE}-{(i + 1) * CHUNK_SIZE - 1}" for i in range(5, 10)
+    ]
+
+
+def test_changed_file_downloads_again(server, tmp_path):
+    path = tmp_path / "video.mp4"
+    _interrupted_download(server, path)
+    server.content = CONTENT[::-1]
+    server.etag = '"v2"'
+
+    _download(server, path)
+    assert path.read_bytes() == CONTENT[::-1]
+    assert len(server.ranges()) == 10
+
+
+def test_if_range_strong_etag(server, tmp_path):
+    _download(server, tmp_path / "video.mp4")
+    assert {headers["If-Range"] for headers in server.ranges()} == {'"v1"'}
+
+
+def test_if_range_last_modified_with_weak_etag(server, tmp_path):
+    server.etag = 'W/"v1"'
+    _download(server, tmp_path / "video.mp4")
+    assert {headers["If-Range"] for headers in server.ranges()} == {server.last_modified}
+
+
+def test_no_validator_restarts(server, tmp_path):
+    server.etag = 'W/"v1"'
+    server.last_modified = None
+    path = tmp_path / "video.mp4"
+    _interrupted_download(server, path)
+
+    _download(server, path)
+    assert path.read_bytes() == CONTENT
+    assert len(server.ranges()) == 10
+    assert not any("If-Range" in headers for headers in server.ranges())
+    assert os.path.getsize(path) == len(CONTENT)
+
+
+def test_head_refused_asks_the_first_byte(server, tmp_path):
+    server.head_status = 405
+    path = tmp_path / "video.mp4"
+    _download(server, path)
+    assert path.read_bytes() == CONTENT
+    assert server.ranges()[0]["Range"] == "bytes=0-0"
+    assert len(server.ranges()) == 11
+
+
+def test_head_refused_without_ranges(server, tmp_path):
+    server.head_status = 403
+    server.accept_ranges = False
+    path = tmp_path / "video.mp4"
+    _download(server, path)
+    assert path.read_bytes() == CONTENT
+
+
+def test_leftover_file_without_length_downloads_again(server, tmp_path):
+    server.send_length = False
+    server.accept_ranges = False
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT[:100])
+    _download(server, path)
+    assert path.read_bytes() == CONTENT
+
+
+def test_leftover_file_with_the_remote_length_is_kept(server, tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(CONTENT)
+    _download(server, path)
+    assert server.ranges() == []
+
+
+def test_interrupted_download_is_not_taken_for_the_old_file(server, tmp_path):
+    server.accept_ranges = False
+    path = tmp_path / "video.mp4"
+    _download(server, path)
+    server.content = CONTENT[::-1]
+    server.etag = '"v2"'
+    server.fail_get = True
+    with pytest.raises(requests.HTTPError):
+        _download(server, path)
+
+    with open(f"{path}.download.json", encoding="utf-8") as f:
+        progress = json.load(f)
+    assert progress["etag"] == '"v2"'
+    assert not progress["complete"]
+    server.fail_get = False
+    _download(server, path)
+    assert path.read_bytes() == CONTENT[::-1]
@@ -0,0 +1,121 @@
+import io
+import json
+import pytest
+
+from src.subtitle_io import (
+    AssWriter,
+    SrtWriter,
+    _JsonStream,
+    convert_subtitles,
+    iter_ass,
+    iter_cues,
+    iter_json,
+    iter_srt,
+    sniff_format,
+)
+
+CUES = [
+    {"start": 0.0, "end": 1.2, "text": "Hello world"},
+    {"start": 1.5, "end": 3.25, "text": "Ça va ?"},
+    {"start": 61.1, "end": 3725.5, "text": "Long"},
+]
+
+
+def _write(path, cues, writer=SrtWriter):
+    with writer(str(path)) as w:
+        for cue in cues:
+            w.write(cue)
+    return str(path)
+
+
+def test_srt_json_srt_round_trip(tmp_path):
+    srt = _write(tmp_path / "a.srt", CUES)
+    assert convert_subtitles(srt, str(tmp_path / "a.json")) == 3
+    assert convert_subtitles(str(tmp_path / "a.json"), str(tmp_path / "b.srt")) == 3
+    assert list(iter_srt(str(tmp_path / "b.srt"))) == CUES
+    assert (tmp_path / "b.srt").read_text(encoding="utf-8") == (tmp_path / "a.srt").read_text(encoding="utf-8")
+
+
+def test_json_is_a_list_of_cues(tmp_path):
+    srt = _write(tmp_path / "a.srt", CUES[:1])
+    convert_subtitles(srt, str(tmp_path / "a.json"))
+    with open(tmp_path / "a.json", encoding="utf-8") as f:
+        assert json.load(f) == [{"index": 1, "start": "00:00:00,000", "end": "00:00:01,200", "text": "Hello world"}]
+
+
+def test_ass_to_srt(tmp_path):
+    ass = _write(tmp_path / "a.ass", CUES, AssWriter)
+    assert sniff_format(ass) == "ass"
+    convert_subtitles(ass, str(tmp_path / "a.srt"))
+    assert list(iter_srt(str(tmp_path / "a.srt"))) == CUES
+
+
+def test_ass_override_tags_and_commas_in_text(tmp_path):
+    path = tmp_path / "a.ass"
+    path.write_text(
+        "[Script Info]\nTitle: x\n\n[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Comment: 0,0:00:00.00,0:00:01.00,S,,0,0,0,,not a cue\n"
+        "Dialogue: 0,0:00:01.50,0:00:02.00,S,,0,0,0,,{\\kf50}One, two\\Nthree\n",
+        encoding="utf-8"
+    )
+    assert list(iter_ass(str(path))) == [{"start": 1.5, "end": 2.0, "text": "One, two three"}]
+
+
+def test_srt_with_bom_multiline_and_no_final_blank_line(tmp_path):
+    path = tmp_path / "a.srt"
+    path.write_text("﻿1\n00:00:01,000 --> 00:00:02,500\nline one\nline two", encoding="utf-8")
+    assert sniff_format(str(path)) == "srt"
+    assert list(iter_srt(str(path))) == [{"start": 1.0, "end": 2.5, "text": "line one line two"}]
+
+
+def test_whisper_result_words_are_read(tmp_path):
+    result = {
+        "text": " Hi there. Bye",
+        "segments": [
+            {"start": 0.0, "end": 1.0, "text": " Hi there.", "words": [
+                {"start": 0.0, "end": 0.4, "word": " Hi"},
+                {"start": 0.5, "end": 1.0, "word": " there."},
+            ]},
+            {"start": 2.0, "end": 2.5, "text": " Bye"},
+        ],
+        "language": "en",
+    }
+    path = tmp_path / "r.json"
+    path.write_text(json.dumps(result), encoding="utf-8")
+    assert list(iter_cues(str(path))) == [
+        {"start": 0.0, "end": 0.4, "text": "Hi"},
+        {"start": 0.5, "end": 1.0, "text": "there."},
+        {"start": 2.0, "end": 2.5, "text": "Bye"},
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 65536])
+def test_json_stream_across_chunks(chunk_size):
+    items = [{"a": "x" * 10, "b": [1, 2, {"c": "]}"}]}, 12.5, "s,t", None, []]
+    stream = _JsonStream(io.StringIO(" \n" + json.dumps(items, indent=1)), chunk_size=chunk_size)
+    assert list(stream.array_items()) == items
+
+
+def test_json_stream_empty_array():
+    assert list(_JsonStream(io.StringIO("[ ]"), chunk_size=1).array_items()) == []
+
+
+@pytest.mark.parametrize("content", [
+    '[{"start": 0, "end": 1, "text": "a"}',
+    '[{"start": 0, "end": 1, "text": "a"} {"start": 1}]',
+    '[{"start": 0, "end": 1, "text": "a"',
+    '{"segments": [{"start": 0, "end": 1, "text": "a"},]}',
+])
+def test_malformed_json_raises(tmp_path, content):
+    path = tmp_path / "bad.json"
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json(str(path)))
+
+
+def test_unknown_format_raises(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("just some text\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        sniff_format(str(path))
@@ -0,0 +1,193 @@
+import pytest
+
+import src.work_queue
+from src.work_queue import WorkQueue
+
+
+class Clock:
+    """time of the queue, moved by the tests instead of sleeping"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(src.work_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return WorkQueue(str(tmp_path / "queue.db"), max_attempts=3, backoff=10.0)
+
+
+def _fetched(queue, number_of_segment=1, transcribe=True):
+    job = queue.enqueue("video.mp4", {"transcribe": transcribe}, job="job")
+    task = queue.claim("w1")
+    assert queue.complete(task["id"], "w1", {"source": "video.mp4", "start": 0, "number_of_segment": number_of_segment})
+    return job
+
+
+def _statuses(queue, job="job"):
+    return {kind: statuses for kind, statuses in queue.status(job)[job].items()}
+
+
+def test_fetch_adds_the_segment_tasks(queue):
+    _fetched(queue, number_of_segment=2)
+    assert _statuses(queue) == {
+        "fetch": {"done": 1},
+        "cut": {"pending": 2},
+        "transcribe": {"pending": 2},
+        "render": {"pending": 2},
+    }
+
+
+def test_tasks_wait_for_their_dependencies(queue):
+    _fetched(queue)
+    cut = queue.claim("w1")
+    assert cut["kind"] == "cut"
+    # transcribe and render wait for the cut
+    assert queue.claim("w2") is None
+    queue.complete(cut["id"], "w1", {})
+    transcribe = queue.claim("w1")
+    assert transcribe["kind"] == "transcribe"
+    assert queue.claim("w2") is None
+    queue.complete(transcribe["id"], "w1", {})
+    assert queue.claim("w1")["kind"] == "render"
+
+
+def test_render_without_transcribe(queue):
+    _fetched(queue, transcribe=False)
+    cut = queue.claim("w1")
+    queue.complete(cut["id"], "w1", {})
+    assert queue.claim("w1")["kind"] == "render"
+
+
+def test_claim_by_kind(queue):
+    _fetched(queue)
+    assert queue.claim("gpu", kinds=["transcribe"]) is None
+    assert queue.claim("cpu", kinds=["cut"])["kind"] == "cut"
+
+
+def test_complete_is_idempotent(queue):
+    queue.enqueue("video.mp4", job="job")
+    task = queue.claim("w1")
+    fetch = {"source": "video.mp4", "start": 0, "number_of_segment": 1}
+    assert queue.complete(task["id"], "w1", fetch)
+    assert not queue.complete(task["id"], "w1", fetch)
+    assert not queue.complete(task["id"], "w2", fetch)
+    assert _statuses(queue)["cut"] == {"pending": 1}
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    queue.enqueue("video.mp4", job="job")
+    task = queue.claim("w1", lease=30)
+    clock.sleep(20)
+    assert queue.claim("w2") is None
+    assert queue.heartbeat(task["id"], "w1", lease=30)
+    clock.sleep(20)
+    # the heartbeat moved the lease to 50 s
+    assert queue.claim("w2") is None
+    clock.sleep(20)
+    again = queue.claim("w2")
+    assert (again["id"], again["attempts"]) == (task["id"], 2)
+    # the first worker lost its lease, its heartbeat and result are refused
+    assert not queue.heartbeat(task["id"], "w1")
+    assert not queue.complete(task["id"], "w1", {"source": "video.mp4", "start": 0, "number_of_segment": 1})
+    assert queue.complete(task["id"], "w2", {"source": "video.mp4", "start": 0, "number_of_segment": 1})
+
+
+def test_expired_lease_on_the_last_attempt_fails(queue, clock):
+    queue.enqueue("video.mp4", job="job")
+    for _ in range(3):
+        assert queue.claim("w1", lease=30) is not None
+        clock.sleep(31)
+    assert queue.claim("w1") is None
+    assert [(f["kind"], f["attempts"], f["error"]) for f in queue.failures()] == [("fetch", 3, "lease expired")]
+
+
+def test_retry_after_a_backoff(queue, clock):
+    queue.enqueue("video.mp4", job="job")
+    task = queue.claim("w1")
+    assert queue.fail(task["id"], "w1", "boom")
+    # 10 s after the first attempt, 20 s after the second
+    clock.sleep(9)
+    assert queue.claim("w1") is None
+    clock.sleep(1)
+    task = queue.claim("w1")
+    assert task["attempts"] == 2
+    queue.fail(task["id"], "w1", "boom")
+    clock.sleep(19)
+    assert queue.claim("w1") is None
+    clock.sleep(1)
+    task = queue.claim("w1")
+    assert task["attempts"] == 3
+    queue.fail(task["id"], "w1", "boom again")
+    clock.sleep(1000)
+    assert queue.claim("w1") is None
+    assert [(f["attempts"], f["error"]) for f in queue.failures()] == [(3, "boom again")]
+
+
+def test_release_does_not_count_the_attempt(queue):
+    queue.enqueue("video.mp4", job="job")
+    task = queue.claim("w1")
+    queue.release(task["id"], "w1")
+    assert queue.claim("w2")["attempts"] == 1
+
+
+def test_dependents_of_a_failed_task_fail_with_it(queue, clock):
+    _fetched(queue, number_of_segment=2)
+    for _ in range(3):
+        cut = queue.claim("w1", kinds=["cut"])
+        assert cut["segment"] == 0
+        queue.fail(cut["id"], "w1", "boom")
+        clock.sleep(100)
+    failures = queue.failures("job")
+    assert [(f["kind"], f["segment"]) for f in failures] == [("cut", 0), ("transcribe", 0), ("render", 0)]
+    assert failures[1]["error"] == failures[2]["error"] == f"task {cut['id']} it depends on failed"
+    # the other segment goes on
+    assert _statuses(queue)["cut"] == {"failed": 1, "pending": 1}
+    assert queue.claim("w1")["segment"] == 1
+
+
+def test_dependents_of_an_expired_task_fail_with_it(queue, clock):
+    _fetched(queue)
+    cut = queue.claim("w1", lease=30)
+    queue.complete(cut["id"], "w1", {})
+    for _ in range(3):
+        assert queue.claim("w1", lease=30)["kind"] == "transcribe"
+        clock.sleep(31)
+    assert queue.claim("w1") is None
+    assert _statuses(queue) == {
+        "fetch": {"done": 1},
+        "cut": {"done": 1},
+        "transcribe": {"failed": 1},
+        "render": {"failed": 1},
+    }
+
+
+def test_retry_failed_brings_back_the_dependents(queue, clock):
+    _fetched(queue)
+    for _ in range(3):
+        cut = queue.claim("w1")
+        queue.fail(cut["id"], "w1", "boom")
+        clock.sleep(100)
+    assert queue.retry_failed("job") == 3
+    cut = queue.claim("w1")
+    assert (cut["kind"], cut["attempts"]) == ("cut", 1)
+    queue.complete(cut["id"], "w1", {})
+    assert queue.claim("w1")["kind"] == "transcribe"
+
+
+def test_enqueue_twice_raises(queue):
+    queue.enqueue("video.mp4", job="job")
+    with pytest.raises(ValueError):
+        queue.enqueue("video.mp4", job="job")